@@ -0,0 +1,251 @@
+# Offline end-to-end benchmark of update_product_column.
+#
+# Serves synthetic storefronts from a local fixture server (English and
+# non-English pages, slow pages, huge heading lists, JavaScript-rendered pages
+# and TLS failures), answers ChatGPT calls from the local mock API and writes
+# to an in-memory sheet, then reports URLs/sec, per-URL p50/p95 latency, peak
+# RSS of the process tree (browser included) and LLM calls per URL:
+#
+#     python benchmarks/bench_end_to_end.py --urls 200 --concurrency 8 --json base.json
+#     python benchmarks/bench_end_to_end.py --urls 200 --concurrency 8 --baseline base.json
+#
+# Needs the same dependencies and Playwright browsers as the classifier itself.
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_sheets import fake_spreadsheet  # noqa: E402
+from fixture_sites import DEFAULT_MIX, fixture_urls, start_fixture_server  # noqa: E402
+from mock_openai_server import start_mock_server  # noqa: E402
+
+from browser_pool import BROWSER_ENGINES, BrowserPool  # noqa: E402
+from http_fetcher import HttpFetcher  # noqa: E402
+from llm_cache import LLMCache  # noqa: E402
+from llm_client import LLMClient  # noqa: E402
+from memory_governor import process_tree_rss_bytes  # noqa: E402
+from preflight import CircuitBreaker, Preflight  # noqa: E402
+from sheet_writer import SHEET_HEADERS, BatchedSheetWriter, SheetSource  # noqa: E402
+from tracing import Tracer  # noqa: E402
+from website_classifier import Classifier, RunStats, update_product_column  # noqa: E402
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED_METRICS = {
+    "urls_per_sec": True,
+    "p50_latency_ms": False,
+    "p95_latency_ms": False,
+    "peak_rss_mb": False,
+    "llm_calls_per_url": False,
+}
+
+
+# Samples process-tree RSS in the background and keeps the peak
+class RssSampler:
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak = 0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, process_tree_rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self.peak = max(self.peak, process_tree_rss_bytes())
+
+
+# Function to parse "en=40,de=10" into a mix of page kinds
+def parse_mix(text):
+    if not text:
+        return DEFAULT_MIX
+    mix = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+async def run_benchmark(args):
+    fixtures = start_fixture_server(slow_delay=args.slow_delay)
+    mock_api = start_mock_server(latency=args.llm_latency, seed=args.seed)
+    pages = fixture_urls(fixtures, args.urls, parse_mix(args.mix), args.seed)
+    spreadsheet = fake_spreadsheet(
+        SHEET_HEADERS, [url for _, url in pages], write_latency=args.sheet_latency
+    )
+    stats = RunStats()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        async with contextlib.AsyncExitStack() as stack:
+            browser_pool = await stack.enter_async_context(
+                BrowserPool(engine=args.engine, pool_size=args.concurrency)
+            )
+            llm_client = await stack.enter_async_context(
+                LLMClient(
+                    api_key="benchmark",
+                    base_url=mock_api.base_url,
+                    requests_per_minute=args.llm_rpm,
+                    tokens_per_minute=args.llm_rpm * 1000,
+                    max_in_flight=args.llm_concurrency,
+                )
+            )
+            llm_cache = None
+            if args.llm_cache:
+                llm_cache = stack.enter_context(
+                    LLMCache(os.path.join(tmp, "llm_cache.sqlite3"))
+                )
+            http_fetcher = None
+            if not args.no_http_tier:
+                http_fetcher = await stack.enter_async_context(
+                    HttpFetcher(max_connections=max(args.concurrency, 10))
+                )
+            tracer = stack.enter_context(Tracer(args.trace))
+            sampler = await stack.enter_async_context(RssSampler())
+
+            sheet = spreadsheet.get_worksheet(0)
+            start = time.perf_counter()
+            classifier = Classifier(
+                browser_pool,
+                stats=stats,
+                http_fetcher=http_fetcher,
+                llm_client=llm_client,
+                llm_cache=llm_cache,
+                llm_batch_size=args.llm_batch_size,
+                page_budget=args.page_budget,
+                preflight=None if args.no_preflight else Preflight(),
+                circuit_breaker=None if args.no_preflight else CircuitBreaker(),
+            )
+            await update_product_column(
+                SheetSource(sheet),
+                functools.partial(BatchedSheetWriter, sheet),
+                classifier,
+                concurrency=args.concurrency,
+                per_domain=2,
+                batch_size=50,
+                flush_interval=2.0,
+                checkpoint_path=os.path.join(tmp, "checkpoint.jsonl"),
+                tracer=tracer,
+            )
+            elapsed = time.perf_counter() - start
+
+    fixtures.shutdown()
+    mock_api.shutdown()
+
+    total = tracer.histograms.get("total")
+    statuses = spreadsheet.worksheet.column("Status")
+    return {
+        "urls": args.urls,
+        "concurrency": args.concurrency,
+        "engine": args.engine,
+        "http_tier": not args.no_http_tier,
+        "preflight": not args.no_preflight,
+        "elapsed_sec": round(elapsed, 3),
+        "urls_per_sec": round(args.urls / elapsed, 3),
+        "p50_latency_ms": round(total.quantile(0.5) * 1000, 1) if total else None,
+        "p95_latency_ms": round(total.quantile(0.95) * 1000, 1) if total else None,
+        "peak_rss_mb": round(sampler.peak / 1024 / 1024, 1),
+        "llm_calls": mock_api.calls,
+        "llm_calls_per_url": round(mock_api.calls / args.urls, 3),
+        "rows_successful": sum(1 for status in statuses if status == 1),
+        "http_tier_urls": stats["http_tier_urls"],
+        "browser_tier_urls": stats["browser_tier_urls"],
+        "preflight_rejected": stats["preflight_rejected"],
+        "fixture_requests": dict(fixtures.requests),
+        "stage_latency": tracer.summary_lines(),
+    }
+
+
+# Function to print the report, with deltas against a baseline if given
+def print_report(result, baseline=None):
+    print("\n----------- End-to-end benchmark ------------")
+    print(
+        f"{result['urls']} URLs, concurrency {result['concurrency']}, "
+        f"{result['engine']}, HTTP tier {'on' if result['http_tier'] else 'off'}, "
+        f"pre-flight {'on' if result['preflight'] else 'off'}"
+    )
+    print(f"Elapsed: {result['elapsed_sec']:.2f} s")
+    print(
+        f"Rows successful: {result['rows_successful']} "
+        f"(HTTP tier {result['http_tier_urls']}, browser {result['browser_tier_urls']}, "
+        f"rejected by pre-flight {result['preflight_rejected']})"
+    )
+    for metric, higher_is_better in COMPARED_METRICS.items():
+        value = result[metric]
+        line = f"{metric}: {value}"
+        if baseline and baseline.get(metric) and value is not None:
+            change = (value - baseline[metric]) / baseline[metric]
+            better = change > 0 if higher_is_better else change < 0
+            verdict = "better" if better else "worse" if change else "same"
+            line += f" (baseline {baseline[metric]}, {change:+.1%} {verdict})"
+        print(line)
+    print("Per-URL latency by stage:")
+    for line in result["stage_latency"]:
+        print(f"  {line}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the classifier end to end against local fixtures."
+    )
+    parser.add_argument("--urls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--engine", choices=BROWSER_ENGINES, default="chromium")
+    parser.add_argument(
+        "--mix", help="Share of each page kind, e.g. 'en=40,de=10,js=10,tls=5'"
+    )
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--page-budget", type=float, default=30.0)
+    parser.add_argument("--no-http-tier", action="store_true")
+    parser.add_argument(
+        "--no-preflight",
+        action="store_true",
+        help="Disable the pre-flight check and the circuit breaker",
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-rpm", type=int, default=6000)
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--llm-batch-size", type=int, default=1)
+    parser.add_argument("--llm-cache", action="store_true")
+    parser.add_argument("--sheet-latency", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", help="Also write per-URL traces to this file")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results from --json")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=args.log_level, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    result = asyncio.run(run_benchmark(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+# Micro-benchmark for the keyword matcher used by product_categorisation.
+#
+# Compares the compiled whole-word matcher against the previous approach of
+# running one any(keyword in text ...) substring scan per category, on
+# synthetic 500-word metadata strings. The run fails if the matcher finds a
+# keyword inside a longer word ("top" in "desktop", "bra" in "brand"):
+#
+#     python benchmarks/bench_keyword_matcher.py --texts 2000 --repeat 5
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import KeywordMatcher, load_keywords  # noqa: E402
+
+FILLER_WORDS = (
+    "shop new season collection free delivery returns sale women men kids home "
+    "gift card store locator account basket wishlist newsletter sign up brand "
+    "desktop stop story about contact help privacy cookies terms customer "
+    "service premium quality sustainable organic cotton summer winter spring"
+).split()
+
+# Texts and the hit counts the English rules must give them: keywords only
+# count as whole words, and a phrase counts once
+BOUNDARY_CASES = (
+    ("Shop the best desktop computers and brand laptops, stop by", {}),
+    ("Topshop: stories, brands & boots-and-more", {"shoes": 1}),
+    ("Tops, BRAS and lingerie sets.", {"clothing": 1, "lingerie": 2}),
+)
+
+
+# Build metadata-like texts where roughly `density` of the words are keywords
+def make_texts(keywords, count, words_per_text, density, seed):
+    rng = random.Random(seed)
+    keyword_list = [w for words in keywords.values() for w in words]
+    texts = []
+    for _ in range(count):
+        words = [
+            rng.choice(keyword_list if rng.random() < density else FILLER_WORDS)
+            for _ in range(words_per_text)
+        ]
+        texts.append(" ".join(words).capitalize() + ".")
+    return texts
+
+
+# The per-category substring scans product_categorisation used to run
+def substring_scan(keywords, text):
+    text = text.lower()
+    return {
+        category: any(keyword in text for keyword in words)
+        for category, words in keywords.items()
+    }
+
+
+def time_it(fn, texts, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the compiled keyword matcher on 500-word inputs."
+    )
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=500)
+    parser.add_argument(
+        "--density", type=float, default=0.02, help="Share of words that are keywords"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    keywords = load_keywords()["en"]
+    texts = make_texts(
+        keywords, args.texts, args.words, args.density, args.seed
+    )
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher(keywords)
+    compile_ms = (time.perf_counter() - start) * 1000
+
+    legacy_rate = time_it(lambda t: substring_scan(keywords, t), texts, args.repeat)
+    matcher_rate = time_it(matcher.match, texts, args.repeat)
+    total_hits = sum(sum(matcher.match(t).values()) for t in texts)
+    for text, expected in BOUNDARY_CASES:
+        hits = dict(matcher.match(text))
+        if hits != expected:
+            raise SystemExit(f"Expected {expected} for {text!r}, matcher found {hits}")
+
+    print(
+        f"Inputs: {args.texts} texts x {args.words} words, "
+        f"{args.density:.0%} keyword density"
+    )
+    print(f"Matcher compile time: {compile_ms:.2f} ms")
+    print(f"Substring scans (any() per category): {legacy_rate:,.0f} texts/sec")
+    print(f"Compiled matcher (per-category counts): {matcher_rate:,.0f} texts/sec")
+    print(f"Keyword hits/sec: {matcher_rate * total_hits / len(texts):,.0f}")
+
+
+if __name__ == "__main__":
+    main()
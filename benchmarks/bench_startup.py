@@ -0,0 +1,121 @@
+# Startup benchmark of the command line.
+#
+# Imports website_classifier and parses `classify --help` in fresh
+# interpreters, and checks that the median import time stays within the
+# module's IMPORT_TIME_BUDGET_MS and that no heavy backend (Playwright,
+# OpenAI, gspread, google-auth, httpx, pyarrow, zstandard) is loaded before a
+# command actually uses it:
+#
+#     python benchmarks/bench_startup.py --repeat 20
+#     python website_classifier.py bench startup --json startup.json
+#
+# Exits with status 1 when a check fails, so it can gate CI.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from website_classifier import IMPORT_TIME_BUDGET_MS  # noqa: E402
+
+# Top-level packages that must only be imported by the command using them
+HEAVY_MODULES = (
+    "playwright",
+    "playwright_stealth",
+    "openai",
+    "gspread",
+    "google",
+    "httpx",
+    "dotenv",
+    "pyarrow",
+    "zstandard",
+)
+
+# Run in a fresh interpreter; prints the timings and heavy modules loaded
+CHILD_SCRIPT = """
+import contextlib, io, json, sys, time
+start = time.perf_counter()
+import website_classifier
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()), contextlib.suppress(SystemExit):
+    website_classifier.parse_args(["classify", "--help"])
+parsed = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "help_ms": (parsed - imported) * 1000,
+    "heavy": sorted({name.split(".")[0] for name in sys.modules} & set(HEAVY)),
+}))
+"""
+
+
+# Time one fresh interpreter importing the module and parsing --help
+def measure_once():
+    script = f"HEAVY = {list(HEAVY_MODULES)!r}\n" + CHILD_SCRIPT
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the command line's import time and lazy backend imports."
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=IMPORT_TIME_BUDGET_MS,
+        help=f"Median import time allowed (default: {IMPORT_TIME_BUDGET_MS})",
+    )
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    # The first run may compile bytecode, so it is not counted
+    measure_once()
+    runs = [measure_once() for _ in range(args.repeat)]
+    import_ms = sorted(run["import_ms"] for run in runs)
+    help_ms = [run["help_ms"] for run in runs]
+    heavy = sorted({name for run in runs for name in run["heavy"]})
+    result = {
+        "repeat": args.repeat,
+        "budget_ms": args.budget_ms,
+        "import_p50_ms": round(statistics.median(import_ms), 1),
+        "import_max_ms": round(import_ms[-1], 1),
+        "help_p50_ms": round(statistics.median(help_ms), 1),
+        "heavy_modules": heavy,
+    }
+
+    print("\n----------- Startup benchmark ------------")
+    print(
+        f"Import of website_classifier: p50 {result['import_p50_ms']} ms, "
+        f"max {result['import_max_ms']} ms (budget {args.budget_ms:g} ms)"
+    )
+    print(f"Parsing classify --help: p50 {result['help_p50_ms']} ms")
+    print(f"Heavy modules loaded at startup: {', '.join(heavy) or 'none'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    failed = False
+    if result["import_p50_ms"] > args.budget_ms:
+        print(f"FAIL: import time is over the {args.budget_ms:g} ms budget")
+        failed = True
+    if heavy:
+        print(f"FAIL: {', '.join(heavy)} imported before any command used them")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# In-memory stand-ins for the gspread spreadsheet and worksheet used by
+# update_product_column, so benchmarks never touch the Google Sheets API.
+# Writes can be given a latency to mimic the real API round trip.
+
+import re
+import threading
+import time
+
+A1_CELL_RE = re.compile(r"^([A-Z]+)(\d+)$")
+
+
+# Function to turn an A1 cell like "C12" into (row, column)
+def a1_to_rowcol(cell):
+    match = A1_CELL_RE.match(cell)
+    if not match:
+        raise ValueError(f"Unsupported cell reference: {cell}")
+    letters, row = match.groups()
+    column = 0
+    for letter in letters:
+        column = column * 26 + ord(letter) - ord("A") + 1
+    return int(row), column
+
+
+class FakeWorksheet:
+    def __init__(self, headers, rows, write_latency=0.0):
+        self.headers = list(headers)
+        # rows[i] is sheet row i + 2; row 1 holds the headers
+        self.rows = [list(row) + [""] * (len(headers) - len(row)) for row in rows]
+        self.write_latency = write_latency
+        self.batch_updates = 0
+        self.cells_written = 0
+        self._lock = threading.Lock()
+
+    def get_all_records(self, expected_headers=None):
+        return [dict(zip(self.headers, row)) for row in self.rows]
+
+    # Same call shape as gspread's Worksheet.batch_update
+    def batch_update(self, data, value_input_option=None):
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        with self._lock:
+            self.batch_updates += 1
+            for update in data:
+                start, _, _ = update["range"].partition(":")
+                row, column = a1_to_rowcol(start)
+                for offset, value in enumerate(update["values"][0]):
+                    self.rows[row - 2][column - 1 + offset] = value
+                    self.cells_written += 1
+
+    def column(self, name):
+        index = self.headers.index(name)
+        return [row[index] for row in self.rows]
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def get_worksheet(self, index):
+        return self.worksheet
+
+
+# Function to build a fake spreadsheet with one row per URL
+def fake_spreadsheet(headers, urls, write_latency=0.0):
+    url_column = headers.index("URL")
+    rows = []
+    for url in urls:
+        row = [""] * len(headers)
+        row[url_column] = url
+        rows.append(row)
+    return FakeSpreadsheet(FakeWorksheet(headers, rows, write_latency))
@@ -0,0 +1,234 @@
+# Local HTTP server serving synthetic e-commerce pages for offline benchmarks.
+# Every page is /<kind>/<n>; each site is given its own loopback address
+# (127.0.x.y) so per-domain limits behave as they would across real shops:
+#
+#     python benchmarks/fixture_sites.py --port 8082
+#     curl http://127.0.0.5:8082/de/5
+#
+# Kinds:
+#   en, de, fr, es  storefront pages with meta tags and headings
+#   generic         a page with no category keywords (goes on to the LLM)
+#   slow            an English page served after --slow-delay seconds
+#   huge            an English page with thousands of headings
+#   js              a shell page whose content is rendered by JavaScript
+#   tls             not a page: its URL is https:// on this plain-HTTP port,
+#                   so the TLS handshake fails
+
+import argparse
+import html
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_KINDS = ("en", "de", "fr", "es", "generic", "slow", "huge", "js", "tls")
+
+# Default share of each kind in a generated URL list
+DEFAULT_MIX = {
+    "en": 40,
+    "de": 10,
+    "fr": 8,
+    "es": 7,
+    "generic": 10,
+    "slow": 5,
+    "huge": 5,
+    "js": 10,
+    "tls": 5,
+}
+
+# Storefront copy per language: (title, description, headings)
+STOREFRONT_COPY = {
+    "en": (
+        "Official Store | Clothing, Shoes and Accessories",
+        "Shop the new season collection of dresses, jeans and sneakers. "
+        "Free delivery and returns.",
+        ["Women", "Men", "Kids", "New In", "Dresses", "Jeans", "Sneakers",
+         "Boots", "Sale", "Gift Cards"],
+    ),
+    "de": (
+        "Offizieller Shop | Mode und Schuhe online kaufen",
+        "Entdecken Sie die neue Kollektion: Kleider, Hosen und Sneaker. "
+        "Kostenloser Versand und Rückgabe.",
+        ["Damen", "Herren", "Kinder", "Neu", "Kleider", "Hosen", "Schuhe",
+         "Stiefel", "Sale", "Gutscheine"],
+    ),
+    "fr": (
+        "Boutique officielle | Vêtements et chaussures",
+        "Découvrez la nouvelle collection de robes, jeans et baskets. "
+        "Livraison gratuite et retours offerts.",
+        ["Femme", "Homme", "Enfant", "Nouveautés", "Robes", "Jeans",
+         "Chaussures", "Bottes", "Soldes", "Cartes cadeaux"],
+    ),
+    "es": (
+        "Tienda oficial | Ropa y zapatos",
+        "Descubre la nueva colección de vestidos, vaqueros y zapatillas. "
+        "Envío gratis y devoluciones.",
+        ["Mujer", "Hombre", "Niños", "Novedades", "Vestidos", "Vaqueros",
+         "Zapatos", "Botas", "Rebajas", "Tarjetas regalo"],
+    ),
+    "generic": (
+        "Acme Industrial Supplies",
+        "Pumps, valves and fittings for industrial customers since 1952.",
+        ["Products", "Pumps", "Valves", "Fittings", "Support", "Contact"],
+    ),
+}
+
+HUGE_HEADING_COUNT = 5000
+
+
+# Function to render a static storefront page
+def storefront_html(lang, heading_count=None):
+    title, description, headings = STOREFRONT_COPY[lang]
+    if heading_count:
+        headings = [f"{headings[i % len(headings)]} {i}" for i in range(heading_count)]
+    heading_html = "\n".join(f"<h2>{html.escape(h)}</h2>" for h in headings)
+    page_lang = "en" if lang == "generic" else lang
+    return f"""<!DOCTYPE html>
+<html lang="{page_lang}">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+<meta name="description" content="{html.escape(description)}">
+<meta property="og:title" content="{html.escape(title)}">
+<meta property="og:description" content="{html.escape(description)}">
+</head>
+<body>
+<nav><a href="/clothing">Clothing</a> <a href="/shoes">Shoes</a></nav>
+{heading_html}
+<p>{html.escape(description)}</p>
+</body>
+</html>
+"""
+
+
+# Function to render a page that only has content once its script runs
+def js_rendered_html():
+    title, description, headings = STOREFRONT_COPY["en"]
+    return f"""<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"><title></title></head>
+<body>
+<div id="root"></div>
+<script>
+document.addEventListener("DOMContentLoaded", () => {{
+  setTimeout(() => {{
+    document.title = {title!r};
+    const meta = document.createElement("meta");
+    meta.name = "description";
+    meta.content = {description!r};
+    document.head.appendChild(meta);
+    const root = document.getElementById("root");
+    for (const text of {headings!r}) {{
+      const h = document.createElement("h2");
+      h.textContent = text;
+      root.appendChild(h);
+    }}
+  }}, 300);
+}});
+</script>
+</body>
+</html>
+"""
+
+
+class FixtureSiteHandler(BaseHTTPRequestHandler):
+    server_version = "FixtureSites/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        kind = parts[0] if parts else ""
+        self.server.record_request(kind)
+
+        if kind in STOREFRONT_COPY:
+            body = storefront_html(kind)
+        elif kind == "slow":
+            time.sleep(self.server.slow_delay)
+            body = storefront_html("en")
+        elif kind == "huge":
+            body = storefront_html("en", heading_count=HUGE_HEADING_COUNT)
+        elif kind == "js":
+            body = js_rendered_html()
+        else:
+            self.send_error(404)
+            return
+
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FixtureSiteServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Many workers connect at once when the benchmark starts
+    request_queue_size = 128
+
+    def __init__(self, address, slow_delay=3.0, verbose=False):
+        super().__init__(address, FixtureSiteHandler)
+        self.slow_delay = slow_delay
+        self.verbose = verbose
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def record_request(self, kind):
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    # Function to build the URL of site number n, serving pages of this kind
+    def url_for(self, kind, n):
+        host = f"127.0.{1 + n // 250}.{1 + n % 250}"
+        scheme = "https" if kind == "tls" else "http"
+        return f"{scheme}://{host}:{self.port}/{kind}/{n}"
+
+
+# Function to build a shuffled list of (kind, url) pairs following the mix
+def fixture_urls(server, count, mix=None, seed=0):
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    return [(kind, server.url_for(kind, n)) for n, kind in enumerate(kinds)]
+
+
+# Function to start the fixture server on a background thread. It listens on
+# every loopback address, so 127.0.x.y hosts all reach it.
+def start_fixture_server(host="0.0.0.0", port=0, **kwargs):
+    server = FixtureSiteServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve synthetic e-commerce pages for offline benchmarks."
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--slow-delay", type=float, default=3.0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = FixtureSiteServer(
+        (args.host, args.port), slow_delay=args.slow_delay, verbose=args.verbose
+    )
+    print(f"Fixture sites listening on port {server.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+# Local mock of the OpenAI chat-completions API for exercising LLMClient
+# without spending tokens. It answers with a category code picked from
+# keywords in the prompt, simulates latency and can inject 429/500 errors:
+#
+#     python benchmarks/mock_openai_server.py --port 8081 --latency 0.5 --error-rate 0.1
+#     OPENAI_BASE_URL=http://127.0.0.1:8081/v1 OPENAI_API_KEY=test python website_classifier.py
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Words in any of our main languages that point at each category
+CATEGORY_HINTS = {
+    "6": ("lingerie", "dessous", "lencería", "intimo", "bra", "unterwäsche"),
+    "7": ("shoe", "schuh", "chaussure", "zapato", "scarpe", "schoen", "sneaker"),
+    "8": ("cloth", "kleid", "vêtement", "robe", "ropa", "vestito", "kleding", "mode"),
+}
+
+
+# Function to pick the category code the mock model answers with
+def mock_category(text):
+    text = text.lower()
+    clothing = any(word in text for word in CATEGORY_HINTS["8"])
+    shoes = any(word in text for word in CATEGORY_HINTS["7"])
+    if clothing and shoes:
+        return "9"
+    if clothing:
+        return "8"
+    if shoes:
+        return "7"
+    if any(word in text for word in CATEGORY_HINTS["6"]):
+        return "6"
+    return "-"
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    server_version = "MockOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.record_call(request)
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.rng.random() < self.server.error_rate:
+            status = self.server.rng.choice([429, 500])
+            self._send_json(
+                status,
+                {"error": {"message": f"Injected HTTP {status}", "type": "mock_error"}},
+            )
+            return
+
+        prompt = " ".join(m.get("content", "") for m in request.get("messages", []))
+        user_text = " ".join(
+            m.get("content", "")
+            for m in request.get("messages", [])
+            if m.get("role") == "user"
+        )
+        answer = self.server.answer(user_text)
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(answer) // 4)
+
+        self._send_json(
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, seed=0, verbose=False):
+        super().__init__(address, MockOpenAIHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.requests = []
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record_call(self, request):
+        with self._lock:
+            self.calls += 1
+            self.requests.append(request)
+
+    # Function to build the assistant reply for a user prompt
+    def answer(self, user_text):
+        return mock_category(user_text)
+
+
+# Function to start the mock server on a background thread
+def start_mock_server(host="127.0.0.1", port=0, **kwargs):
+    server = MockOpenAIServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve a local mock of the OpenAI chat-completions API."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds per call")
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Share of calls answered 429/500"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = MockOpenAIServer(
+        (args.host, args.port),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    print(f"Mock chat-completions API listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served {server.calls} call(s).")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
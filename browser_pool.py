@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import contextlib
+from contextlib import asynccontextmanager
+
+from interception import InterceptionPolicy, PageTraffic
+
+logger = logging.getLogger(__name__)
+
+# Browser engines Playwright can launch
+BROWSER_ENGINES = ("webkit", "chromium", "firefox")
+
+
+# Long-lived Playwright driver and browser that hands out isolated contexts.
+# Contexts are recycled after pages_per_context pages and the whole browser
+# after pages_per_browser; pages over the page_limits caps are closed early.
+class BrowserPool:
+    def __init__(
+        self,
+        engine="webkit",
+        pool_size=4,
+        pages_per_context=50,
+        headless=True,
+        interception_policy=None,
+        pages_per_browser=None,
+        page_limits=None,
+    ):
+        if engine not in BROWSER_ENGINES:
+            raise ValueError(
+                f"Unknown browser engine '{engine}', expected one of {BROWSER_ENGINES}"
+            )
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        if pages_per_context < 1:
+            raise ValueError("pages_per_context must be at least 1")
+
+        self.engine = engine
+        self.pool_size = pool_size
+        self.pages_per_context = pages_per_context
+        self.headless = headless
+        self.interception_policy = interception_policy or InterceptionPolicy()
+        self.pages_per_browser = pages_per_browser
+        self.page_limits = page_limits
+        self.restarts = 0
+
+        self._playwright = None
+        self._browser = None
+        self._idle_contexts = []
+        self._page_counts = {}
+        self._traffic = {}
+        self._slots = None
+        self._launch_lock = None
+        self._pages_since_launch = 0
+        self._restart_task = None
+        self._limit_hits = {}
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # Start the Playwright driver and launch the browser once per run
+    async def start(self):
+        # Imported here so importing the pool does not load Playwright
+        from playwright.async_api import async_playwright
+
+        self._slots = asyncio.Semaphore(self.pool_size)
+        self._launch_lock = asyncio.Lock()
+        self._playwright = await async_playwright().start()
+        await self._launch_browser()
+        logger.info(f"Browser pool started: {self.engine}, {self.pool_size} context(s).")
+
+    async def _launch_browser(self):
+        browser_type = getattr(self._playwright, self.engine)
+        self._browser = await browser_type.launch(headless=self.headless)
+
+    # Close every pooled context, the browser and the driver
+    async def close(self):
+        if self._restart_task is not None:
+            self._restart_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._restart_task
+            self._restart_task = None
+
+        for context in self._idle_contexts:
+            await self._close_context(context)
+        self._idle_contexts.clear()
+
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception as e:
+                logger.warning(f"Error while closing browser: {e}")
+            self._browser = None
+
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _new_context(self):
+        # Relaunch the browser if it crashed or was disconnected
+        async with self._launch_lock:
+            if self._browser is None or not self._browser.is_connected():
+                logger.warning("Browser is not connected. Relaunching...")
+                self._idle_contexts.clear()
+                self._page_counts.clear()
+                self._traffic.clear()
+                await self._launch_browser()
+
+        context = await self._browser.new_context()
+        # A context serves one page at a time, so its traffic counter is
+        # reset per page and belongs to the URL currently loading
+        traffic = PageTraffic()
+
+        async def intercept(route):
+            await self.interception_policy.handle(route, traffic)
+
+        # Install the interception route once for the whole context
+        await context.route("**/*", intercept)
+        context.on("response", traffic.record_response)
+        self._traffic[context] = traffic
+        self._page_counts[context] = 0
+        return context
+
+    async def _close_context(self, context):
+        self._page_counts.pop(context, None)
+        self._traffic.pop(context, None)
+        try:
+            await context.close()
+        except Exception as e:
+            logger.warning(f"Error while closing browser context: {e}")
+
+    # Borrow a context from the pool, creating one if none are idle
+    async def acquire_context(self):
+        await self._slots.acquire()
+        try:
+            if self._idle_contexts:
+                return self._idle_contexts.pop()
+            return await self._new_context()
+        except Exception:
+            self._slots.release()
+            raise
+
+    # Return a context to the pool, recycling it after pages_per_context pages
+    async def release_context(self, context, discard=False):
+        try:
+            self._page_counts[context] = self._page_counts.get(context, 0) + 1
+            if discard or self._page_counts[context] >= self.pages_per_context:
+                await self._close_context(context)
+            else:
+                self._idle_contexts.append(context)
+        finally:
+            self._slots.release()
+
+        self._pages_since_launch += 1
+        if self.pages_per_browser and self._pages_since_launch >= self.pages_per_browser:
+            self.request_restart(f"{self._pages_since_launch} pages")
+
+    # Open every context up front, so the first pages of a long-running
+    # service do not wait for context creation
+    async def prewarm(self):
+        contexts = []
+        try:
+            for _ in range(self.pool_size):
+                contexts.append(await self.acquire_context())
+        finally:
+            for context in contexts:
+                self._idle_contexts.append(context)
+                self._slots.release()
+        logger.info(f"Browser pool warmed: {len(contexts)} context(s) ready.")
+
+    # Close every idle context so the browser can free their memory
+    async def recycle_idle_contexts(self):
+        contexts, self._idle_contexts = self._idle_contexts, []
+        for context in contexts:
+            await self._close_context(context)
+        logger.info(f"Recycled {len(contexts)} idle browser context(s).")
+
+    # Restart the browser once the pages in flight are done. Returns the
+    # restart task; concurrent requests share it.
+    def request_restart(self, reason):
+        if self._restart_task is None:
+            self._restart_task = asyncio.create_task(self._restart_browser(reason))
+        return self._restart_task
+
+    async def _restart_browser(self, reason):
+        # Holding every slot waits for in-flight pages and keeps new ones out
+        for _ in range(self.pool_size):
+            await self._slots.acquire()
+        try:
+            logger.info(f"Restarting browser ({reason}).")
+            await self.recycle_idle_contexts()
+            try:
+                await self._browser.close()
+            except Exception as e:
+                logger.warning(f"Error while closing browser: {e}")
+            await self._launch_browser()
+            self._pages_since_launch = 0
+            self.restarts += 1
+        finally:
+            for _ in range(self.pool_size):
+                self._slots.release()
+            self._restart_task = None
+
+    # Requests allowed and blocked so far for the URL loading in this page
+    def traffic(self, page):
+        return self._traffic.get(page.context)
+
+    # The cap ("dom_nodes" or "js_heap") this page went over, if any
+    def page_limit(self, page):
+        return self._limit_hits.get(page)
+
+    # Close a page as soon as it goes over a cap; the caller's pending
+    # Playwright calls then fail instead of running out the page budget
+    async def _watch_page(self, page):
+        reason = await self.page_limits.watch(page)
+        self._limit_hits[page] = reason
+        logger.warning(f"Closing page over its {reason} cap: {page.url}")
+        await page.close()
+
+    # Open a fresh page in a pooled context and clean it up afterwards
+    @asynccontextmanager
+    async def page(self):
+        context = await self.acquire_context()
+        page = None
+        watchdog = None
+        discard = False
+        try:
+            self._traffic[context].reset()
+            page = await context.new_page()
+            if self.page_limits is not None:
+                watchdog = asyncio.create_task(self._watch_page(page))
+            yield page
+        except Exception:
+            discard = page is None
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+                with contextlib.suppress(Exception, asyncio.CancelledError):
+                    await watchdog
+            # A runaway page may have left its context bloated
+            if self._limit_hits.pop(page, None) is not None:
+                discard = True
+            if page is not None:
+                try:
+                    await page.close()
+                except Exception as e:
+                    logger.warning(f"Error while closing page: {e}")
+                    discard = True
+            await self.release_context(context, discard=discard)
@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+# Local JSON-lines log of classified rows so an interrupted run can resume
+# without re-fetching sites it already classified successfully. A path of None
+# disables it, e.g. for queue workers whose results are already durable.
+class Checkpoint:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.completed = {}
+        self._file = None
+        if path is None:
+            return
+
+        if resume:
+            self.completed = self._load()
+        elif os.path.exists(path):
+            # A fresh run starts a fresh checkpoint
+            os.remove(path)
+
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        if self._file.tell() and not self._ends_with_newline():
+            # Start on a fresh line after an entry cut short by a killed run
+            self._file.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _load(self):
+        completed = {}
+        if not os.path.exists(self.path):
+            return completed
+
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut short if the run was killed mid-write
+                    continue
+                if entry.get("status") == 1:
+                    completed[entry["row"]] = entry
+                else:
+                    completed.pop(entry.get("row"), None)
+        logger.info(f"Loaded {len(completed)} classified row(s) from {self.path}")
+        return completed
+
+    # Return the saved result for a row, if it was classified for the same URL
+    def result_for(self, row, url):
+        entry = self.completed.get(row)
+        if entry is None or entry.get("url") != url:
+            return None
+        return entry["product"], entry["status"]
+
+    def record(self, row, url, product_code, status):
+        if self._file is None:
+            return
+        entry = {"row": row, "url": url, "product": product_code, "status": status}
+        self._file.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
@@ -0,0 +1,250 @@
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from retry_scheduler import current_failure
+from tracing import trace_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVICE_PORT = 8765
+
+# URLs accepted at once, queued or in flight, before new requests get a 503
+DEFAULT_MAX_PENDING = 64
+
+# Seconds a request waits for its URLs before it gets a 504
+DEFAULT_REQUEST_TIMEOUT = 60.0
+
+# URLs accepted in one request body, and the largest body read
+MAX_URLS_PER_REQUEST = 100
+MAX_BODY_BYTES = 1024 * 1024
+
+# Seconds a client is told to wait after a 503
+RETRY_AFTER_SECONDS = 1
+
+# ChatGPT batching for the service: misses from concurrent requests are
+# grouped, but a batch is never held back for more than a blink
+SERVICE_LLM_BATCH_SIZE = 8
+SERVICE_LLM_BATCH_WAIT = 0.05
+
+
+# Local HTTP/JSON front end for a Classifier. The classifier, its browser
+# pool and models stay loaded between requests. Requests are served on
+# threads and their URLs classified on the service's event loop; once
+# max_pending URLs are queued or in flight, new requests are turned away with
+# 503 and Retry-After rather than queued without bound.
+class ClassifierService:
+    def __init__(
+        self,
+        classifier,
+        domain_limiter,
+        tracer,
+        concurrency=1,
+        max_pending=DEFAULT_MAX_PENDING,
+        request_timeout=DEFAULT_REQUEST_TIMEOUT,
+    ):
+        self.classifier = classifier
+        self.stats = classifier.stats
+        self.domain_limiter = domain_limiter
+        self.tracer = tracer
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.request_timeout = request_timeout
+        # Only touched from the event loop, so no lock is needed
+        self.pending = 0
+        self.in_flight = 0
+        self.loop = None
+        self._slots = None
+        self._ids = itertools.count(1)
+
+    # Serve on host:port until cancelled
+    async def serve(self, host, port):
+        self.loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.concurrency)
+        server = ThreadingHTTPServer((host, port), ServiceHandler)
+        server.daemon_threads = True
+        server.service = self
+        thread = threading.Thread(target=server.serve_forever, name="http", daemon=True)
+        thread.start()
+        logger.info(
+            f"Classifier service listening on http://{host}:{server.server_port} "
+            f"({self.concurrency} concurrent, {self.max_pending} pending at most)."
+        )
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await asyncio.to_thread(server.shutdown)
+            server.server_close()
+            await self.classifier.flush()
+            logger.info("Classifier service stopped.")
+
+    # Classify a request's URLs; returns None when the service is saturated
+    async def classify_urls(self, urls):
+        if self.pending + len(urls) > self.max_pending:
+            self.stats.increment("service_rejected_requests")
+            return None
+        self.pending += len(urls)
+        self.stats.record_peak("service_peak_pending", self.pending)
+        self.stats.increment("service_requests")
+        try:
+            return await asyncio.gather(*(self.classify_url(url) for url in urls))
+        finally:
+            self.pending -= len(urls)
+
+    # Classify one URL in its own task, so it gets its own trace
+    async def classify_url(self, url):
+        trace = self.tracer.start(next(self._ids), url)
+        current_failure.set(None)
+        try:
+            with trace_stage("queue_wait"):
+                await self._slots.acquire()
+            self.in_flight += 1
+            try:
+                async with self.domain_limiter.for_url(url):
+                    category, status = await self.classifier.classify(url)
+            finally:
+                self.in_flight -= 1
+                self._slots.release()
+        except Exception as e:
+            logger.error(f"Unexpected error while classifying {url}: {e}")
+            self.stats.increment("other_errors")
+            category, status = "-", 0
+            trace.set(error=str(e))
+
+        self.stats.increment("service_urls")
+        trace.set(category=category, status=status)
+        self.tracer.finish(trace)
+        result = {
+            "url": url,
+            "category": category,
+            "status": status,
+            "elapsed_ms": trace.record["stages_ms"]["total"],
+        }
+        if status != 1:
+            result["error"] = current_failure.get() or "other"
+        return result
+
+    # Health and metrics are read on the loop, never mid-update
+    async def health(self):
+        return {
+            "status": "ok",
+            "pending": self.pending,
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "uptime_sec": round(time.time() - self.stats.start_time, 1),
+            "browser_restarts": self.classifier.browser_pool.restarts,
+        }
+
+    async def metrics_text(self):
+        text = self.tracer.prometheus_text(self.stats)
+        return text + (
+            "# TYPE classifier_service_pending gauge\n"
+            f"classifier_service_pending {self.pending}\n"
+            "# TYPE classifier_service_in_flight gauge\n"
+            f"classifier_service_in_flight {self.in_flight}\n"
+        )
+
+    # Run a coroutine on the service's loop from a request thread
+    def call(self, coroutine, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+
+# Function to read the URLs of a /classify body: {"url": ...} or {"urls": [...]}.
+# Returns (urls, single) or raises ValueError.
+def parse_classify_request(body):
+    try:
+        payload = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ValueError(f"Body is not valid JSON: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError('Body must be a JSON object with "url" or "urls"')
+
+    if "url" in payload:
+        urls, single = [payload["url"]], True
+    elif "urls" in payload:
+        urls, single = payload["urls"], False
+    else:
+        raise ValueError('Body must have "url" or "urls"')
+
+    if not isinstance(urls, list) or not urls:
+        raise ValueError('"urls" must be a non-empty list')
+    if len(urls) > MAX_URLS_PER_REQUEST:
+        raise ValueError(f"At most {MAX_URLS_PER_REQUEST} URLs per request")
+    if not all(isinstance(url, str) and url.strip() for url in urls):
+        raise ValueError("Every URL must be a non-empty string")
+    return [url.strip() for url in urls], single
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = "WebsiteClassifier/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json", headers)
+
+    def _send_error(self, status, message, headers=None):
+        self._send_json(status, {"error": message}, headers)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/healthz":
+            self._send_json(200, service.call(service.health()))
+        elif self.path == "/metrics":
+            text = service.call(service.metrics_text())
+            self._send(200, text.encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._send_error(404, "Not found")
+
+    def do_POST(self):
+        service = self.server.service
+        if self.path != "/classify":
+            self._send_error(404, "Not found")
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_error(413, "Request body too large")
+            return
+        try:
+            urls, single = parse_classify_request(self.rfile.read(length))
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        try:
+            results = service.call(service.classify_urls(urls), service.request_timeout)
+        except concurrent.futures.TimeoutError:
+            self._send_error(504, "Timed out classifying the request's URLs")
+            return
+        if results is None:
+            self._send_error(
+                503,
+                "Service is saturated; retry later",
+                {"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
+            return
+        self._send_json(200, results[0] if single else {"results": results})
@@ -0,0 +1,266 @@
+import logging
+from html.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+# Browser-like request headers so storefronts serve their normal markup
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 "
+        "(KHTML, like Gecko) Version/17.0 Safari/605.1.15"
+    ),
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-GB,en;q=0.9",
+}
+
+# Stop reading once this much HTML has been parsed
+MAX_HTML_BYTES = 512 * 1024
+
+# Stop reading early once the head is parsed and this many headings were seen
+ENOUGH_HEADINGS = 20
+
+# Below this much visible body text a page is assumed to be rendered by JavaScript
+MIN_BODY_TEXT_CHARS = 200
+
+# Meta tags read by the classifier, keyed by their property or name attribute
+OG_PROPERTIES = {
+    "og:title": "og_title",
+    "og:description": "og_description",
+    "og:keywords": "og_keywords",
+}
+META_NAMES = {
+    "description": "meta_description",
+    "keywords": "meta_keywords",
+}
+
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+CATEGORY_LINK_MARKERS = ("clothing", "shoes", "lingerie")
+IGNORED_TEXT_TAGS = {"script", "style", "noscript", "template", "svg"}
+
+# Returned by fetch_fields when a conditional request finds the page unchanged
+NOT_MODIFIED = "not_modified"
+
+# Markers of single-page-app shells whose real content is rendered client-side
+JS_APP_MARKERS = (
+    "enable javascript",
+    "javascript is required",
+    "javascript is disabled",
+    "you need to enable javascript",
+)
+
+
+# Streaming HTML parser that collects the same fields as METADATA_EXTRACT_SCRIPT
+class MetadataParser(HTMLParser):
+    def __init__(self, max_headings, max_links, max_text_length):
+        super().__init__(convert_charrefs=True)
+        self.max_headings = max_headings
+        self.max_links = max_links
+        self.max_text_length = max_text_length
+
+        self.fields = {
+            "og_title": None,
+            "title": None,
+            "og_description": None,
+            "og_keywords": None,
+            "meta_description": None,
+            "meta_keywords": None,
+            "lang": None,
+            "headings": [],
+            "category_links": [],
+        }
+        self.head_done = False
+        self.body_text_chars = 0
+        self.js_app_marker = False
+
+        self._open_title = False
+        self._title_parts = []
+        self._heading_parts = None
+        self._link_parts = None
+        self._ignored_depth = 0
+
+    # True once everything the classifier needs has been read
+    @property
+    def has_enough(self):
+        return self.head_done and len(self.fields["headings"]) >= ENOUGH_HEADINGS
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+
+        if tag == "html" and self.fields["lang"] is None:
+            self.fields["lang"] = attrs.get("lang")
+        elif tag == "meta":
+            self._handle_meta(attrs)
+        elif tag == "title" and self.fields["title"] is None:
+            self._open_title = True
+        elif tag == "body":
+            self.head_done = True
+        elif tag in HEADING_TAGS and self._heading_parts is None:
+            self._heading_parts = []
+        elif tag == "a" and self._link_parts is None:
+            href = (attrs.get("href") or "").lower()
+            if any(marker in href for marker in CATEGORY_LINK_MARKERS):
+                self._link_parts = []
+
+        if tag in IGNORED_TEXT_TAGS:
+            self._ignored_depth += 1
+
+    def _handle_meta(self, attrs):
+        content = attrs.get("content")
+        if content is None:
+            return
+        og_property = (attrs.get("property") or "").lower()
+        name = (attrs.get("name") or "").lower()
+        key = OG_PROPERTIES.get(og_property) or META_NAMES.get(name)
+        # Like querySelector, keep the first matching tag
+        if key and self.fields[key] is None:
+            self.fields[key] = content
+
+    def handle_endtag(self, tag):
+        if tag in IGNORED_TEXT_TAGS and self._ignored_depth:
+            self._ignored_depth -= 1
+
+        if tag == "title" and self._open_title:
+            self._open_title = False
+            self.fields["title"] = " ".join("".join(self._title_parts).split())
+        elif tag == "head":
+            self.head_done = True
+        elif tag in HEADING_TAGS and self._heading_parts is not None:
+            self._append_text("headings", self._heading_parts, self.max_headings)
+            self._heading_parts = None
+        elif tag == "a" and self._link_parts is not None:
+            self._append_text("category_links", self._link_parts, self.max_links)
+            self._link_parts = None
+
+    def _append_text(self, field, parts, limit):
+        text = " ".join("".join(parts).split())
+        if text and len(self.fields[field]) < limit:
+            self.fields[field].append(text[: self.max_text_length])
+
+    def handle_data(self, data):
+        if self._open_title:
+            self._title_parts.append(data)
+            return
+
+        if self._ignored_depth:
+            # <noscript> banners are how most app shells announce themselves
+            if any(marker in data.lower() for marker in JS_APP_MARKERS):
+                self.js_app_marker = True
+            return
+
+        if self._heading_parts is not None:
+            self._heading_parts.append(data)
+        if self._link_parts is not None:
+            self._link_parts.append(data)
+        if self.head_done:
+            self.body_text_chars += len(data.strip())
+
+
+# Fast tier: fetch static HTML over a pooled HTTP/2 client and parse the
+# metadata without a browser. Returns None when the page needs Playwright.
+class HttpFetcher:
+    def __init__(
+        self,
+        max_connections=100,
+        timeout=10.0,
+        max_headings=200,
+        max_links=100,
+        max_text_length=200,
+        keep_html=False,
+    ):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_headings = max_headings
+        self.max_links = max_links
+        self.max_text_length = max_text_length
+        # Return the HTML read as fields["html"], e.g. for the snapshot archive
+        self.keep_html = keep_html
+        self._client = None
+
+    async def __aenter__(self):
+        # Imported here so importing the fetcher does not load httpx
+        import httpx
+
+        self._client = httpx.AsyncClient(
+            http2=True,
+            follow_redirects=True,
+            headers=DEFAULT_HEADERS,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_connections,
+            ),
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._client.aclose()
+        self._client = None
+
+    # Function to fetch and parse a page; returns the extracted fields or None.
+    # With the validators of an earlier visit the request is conditional, and
+    # NOT_MODIFIED is returned if the server answers 304.
+    async def fetch_fields(self, url, etag=None, last_modified=None):
+        import httpx
+
+        parser = MetadataParser(self.max_headings, self.max_links, self.max_text_length)
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        try:
+            async with self._client.stream("GET", url, headers=headers) as response:
+                if response.status_code == 304 and headers:
+                    return NOT_MODIFIED
+                validators = {
+                    "etag": response.headers.get("etag"),
+                    "last_modified": response.headers.get("last-modified"),
+                }
+                content_type = response.headers.get("content-type", "")
+                if response.status_code >= 400 or "html" not in content_type:
+                    logger.info(
+                        f"HTTP tier skipped {url}: status {response.status_code}, "
+                        f"content type '{content_type}'"
+                    )
+                    return None
+
+                bytes_read = 0
+                chunks = [] if self.keep_html else None
+                async for chunk in response.aiter_text():
+                    parser.feed(chunk)
+                    if chunks is not None:
+                        chunks.append(chunk)
+                    bytes_read += len(chunk)
+                    # Stop reading once we have enough, without downloading the rest
+                    if parser.has_enough or bytes_read >= MAX_HTML_BYTES:
+                        break
+            parser.close()
+        except (httpx.HTTPError, UnicodeDecodeError) as e:
+            logger.info(f"HTTP tier failed for {url}: {e}")
+            return None
+
+        if looks_js_rendered(parser):
+            logger.info(f"Page looks JavaScript-rendered, falling back to the browser: {url}")
+            return None
+
+        fields = parser.fields
+        fields["title"] = fields["title"] or "Untitled Page"
+        # Kept so the next visit can ask whether the page changed
+        fields.update(validators)
+        if chunks is not None:
+            fields["html"] = "".join(chunks)
+        return fields
+
+
+# Function to decide whether the static HTML is too thin to classify
+def looks_js_rendered(parser):
+    fields = parser.fields
+    has_head_text = any(
+        fields[key]
+        for key in ("og_title", "og_description", "meta_description", "title")
+    )
+    if not has_head_text and not fields["headings"]:
+        return True
+    if parser.js_app_marker and parser.body_text_chars < MIN_BODY_TEXT_CHARS:
+        return True
+    return not fields["headings"] and parser.body_text_chars < MIN_BODY_TEXT_CHARS
@@ -0,0 +1,131 @@
+import os
+from urllib.parse import urlparse
+
+# Resource types that are never needed for metadata extraction
+DEFAULT_BLOCKED_RESOURCE_TYPES = ("image", "font", "media", "stylesheet")
+
+# Bundled ad, analytics and chat-widget domains
+DEFAULT_BLOCKLIST_FILE = os.path.join(os.path.dirname(__file__), "blocklist.txt")
+
+# Second-level labels under which registries sell domains ("shop.co.uk"),
+# used to tell first- from third-party hosts without a public suffix list
+COMMON_SECOND_LEVEL_LABELS = {"co", "com", "net", "org", "gov", "ac", "edu", "ne", "or"}
+
+
+# Function to read a blocklist file into a set of lowercase domains
+def load_blocklist(path=DEFAULT_BLOCKLIST_FILE):
+    domains = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            domain = line.split("#", 1)[0].strip().lower().lstrip(".")
+            if domain:
+                domains.add(domain)
+    return domains
+
+
+# Function to check a hostname and each parent domain against a domain set.
+# Costs one set lookup per label, however long the blocklist is.
+def matches_domain_suffix(hostname, domains):
+    labels = hostname.split(".")
+    for i in range(len(labels) - 1):
+        if ".".join(labels[i:]) in domains:
+            return True
+    return False
+
+
+# Function to approximate the registrable domain ("www.shop.co.uk" -> "shop.co.uk")
+def site_of(hostname):
+    labels = (hostname or "").lower().rstrip(".").split(".")
+    if (
+        len(labels) >= 3
+        and len(labels[-1]) == 2
+        and labels[-2] in COMMON_SECOND_LEVEL_LABELS
+    ):
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+# Requests seen while loading one URL, and the site that URL resolved to
+class PageTraffic:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.site = None
+        self.allowed_requests = 0
+        self.allowed_bytes = 0
+        self.blocked_requests = 0
+        self.blocked_by_reason = {}
+
+    def allow(self):
+        self.allowed_requests += 1
+
+    def block(self, reason):
+        self.blocked_requests += 1
+        self.blocked_by_reason[reason] = self.blocked_by_reason.get(reason, 0) + 1
+
+    # Count the body size the server declared; chunked responses count as 0
+    def record_response(self, response):
+        try:
+            self.allowed_bytes += int(response.headers.get("content-length") or 0)
+        except ValueError:
+            pass
+
+
+# Decides which browser requests are aborted: by resource type, by a domain
+# blocklist and, optionally, every script served from another site
+class InterceptionPolicy:
+    def __init__(
+        self,
+        blocked_resource_types=DEFAULT_BLOCKED_RESOURCE_TYPES,
+        blocklist=None,
+        block_third_party_scripts=False,
+    ):
+        self.blocked_resource_types = set(blocked_resource_types)
+        self.blocklist = set(blocklist or ())
+        self.block_third_party_scripts = block_third_party_scripts
+
+    # Return why a request should be blocked, or None to let it through.
+    # The top-level document is never blocked; ad iframes still can be.
+    def block_reason(self, request, page_site=None, main_document=False):
+        if main_document:
+            return None
+        resource_type = request.resource_type
+        if resource_type in self.blocked_resource_types:
+            return "resource_type"
+
+        hostname = (urlparse(request.url).hostname or "").lower()
+        if not hostname:
+            return None
+        if self.blocklist and matches_domain_suffix(hostname, self.blocklist):
+            return "blocklist"
+        if (
+            self.block_third_party_scripts
+            and resource_type == "script"
+            and page_site
+            and site_of(hostname) != page_site
+        ):
+            return "third_party_script"
+        return None
+
+    # Route handler body: abort or continue the request and count it
+    async def handle(self, route, traffic):
+        request = route.request
+        main_document = False
+        if request.resource_type == "document" and request.is_navigation_request():
+            try:
+                main_document = request.frame.parent_frame is None
+            except Exception:
+                main_document = False
+            if main_document:
+                # Follow the main frame through redirects so "third party" is
+                # judged against the site the page actually ended up on
+                traffic.site = site_of(urlparse(request.url).hostname)
+
+        reason = self.block_reason(request, traffic.site, main_document)
+        if reason is None:
+            traffic.allow()
+            await route.continue_()
+        else:
+            traffic.block(reason)
+            await route.abort()
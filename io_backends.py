@@ -0,0 +1,441 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Columns every file sink writes, one record per classified row
+OUTPUT_FIELDS = ["row", "url", "product", "status"]
+
+# File extensions understood by open_source and file_sink
+CSV_EXTENSIONS = (".csv",)
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+PARQUET_EXTENSIONS = (".parquet",)
+
+
+# Values of the Duplicate column that do not mark a row as a duplicate
+NOT_DUPLICATE_VALUES = {"", "0", "n", "no", "false", "none"}
+
+
+# Function to yield (row, url) for every record that still needs classifying.
+# `records` yields (row, record dict) pairs from any source. Rows marked in
+# `duplicate_column` are added to the `duplicate_rows` set as they are yielded.
+def rows_to_process(
+    records,
+    url_column,
+    status_column,
+    resume=False,
+    stats=None,
+    duplicate_column=None,
+    duplicate_rows=None,
+):
+    for row, record in records:
+        url = str(record.get(url_column) or "").strip()
+
+        if not url:  # Skip rows with empty URL
+            logger.info(f"Skipping row {row} due to empty URL.")
+            continue
+        if stats is not None:
+            stats.increment("valid_urls")
+
+        # In resume mode, rows already marked successful are left untouched
+        if resume and str(record.get(status_column)).strip() == "1":
+            if stats is not None:
+                stats.increment("skipped_rows")
+            continue
+
+        if duplicate_rows is not None and duplicate_column:
+            marker = str(record.get(duplicate_column) or "").strip().lower()
+            if marker not in NOT_DUPLICATE_VALUES:
+                duplicate_rows.add(row)
+        yield row, url
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            "Parquet input/output needs pyarrow: pip install pyarrow"
+        ) from None
+    return pyarrow
+
+
+# Streams rows from a CSV file with a header line. Row numbers are file line
+# numbers, so the header is row 1 as in the sheet.
+class CsvSource:
+    def __init__(
+        self, path, url_column="URL", status_column="Status", duplicate_column="Duplicate"
+    ):
+        self.path = path
+        self.url_column = url_column
+        self.status_column = status_column
+        self.duplicate_column = duplicate_column
+        # Rows marked in the Duplicate column, filled in as rows are read
+        self.duplicate_rows = set()
+
+    def rows(self, resume=False, stats=None):
+        with open(self.path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            yield from rows_to_process(
+                enumerate(reader, start=2),
+                self.url_column,
+                self.status_column,
+                resume,
+                stats,
+                self.duplicate_column,
+                self.duplicate_rows,
+            )
+
+
+# Streams rows from a JSON-lines file; row numbers are line numbers
+class JsonlSource:
+    def __init__(
+        self, path, url_column="URL", status_column="Status", duplicate_column="Duplicate"
+    ):
+        self.path = path
+        self.url_column = url_column
+        self.status_column = status_column
+        self.duplicate_column = duplicate_column
+        self.duplicate_rows = set()
+
+    def _records(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping line {line_number}: not valid JSON")
+
+    def rows(self, resume=False, stats=None):
+        yield from rows_to_process(
+            self._records(),
+            self.url_column,
+            self.status_column,
+            resume,
+            stats,
+            self.duplicate_column,
+            self.duplicate_rows,
+        )
+
+
+# Streams rows from a Parquet file one record batch at a time; row numbers
+# count from 1 in file order
+class ParquetSource:
+    def __init__(
+        self,
+        path,
+        url_column="URL",
+        status_column="Status",
+        duplicate_column="Duplicate",
+        batch_size=10000,
+    ):
+        self.path = path
+        self.url_column = url_column
+        self.status_column = status_column
+        self.duplicate_column = duplicate_column
+        self.duplicate_rows = set()
+        self.batch_size = batch_size
+
+    def _records(self):
+        pyarrow = _import_pyarrow()
+        parquet_file = pyarrow.parquet.ParquetFile(self.path)
+        names = parquet_file.schema_arrow.names
+        columns = [
+            c
+            for c in (self.url_column, self.status_column, self.duplicate_column)
+            if c in names
+        ]
+        row = 1
+        for batch in parquet_file.iter_batches(self.batch_size, columns=columns):
+            for record in batch.to_pylist():
+                yield row, record
+                row += 1
+
+    def rows(self, resume=False, stats=None):
+        yield from rows_to_process(
+            self._records(),
+            self.url_column,
+            self.status_column,
+            resume,
+            stats,
+            self.duplicate_column,
+            self.duplicate_rows,
+        )
+
+
+# Function to iterate a source's rows whether it yields them synchronously
+# (files, sheets) or asynchronously (the shared work queue)
+async def iterate_rows(rows):
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+# Function to pick the source class for an input file from its extension
+def open_source(path, url_column="URL"):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in CSV_EXTENSIONS:
+        return CsvSource(path, url_column)
+    if extension in JSONL_EXTENSIONS:
+        return JsonlSource(path, url_column)
+    if extension in PARQUET_EXTENSIONS:
+        return ParquetSource(path, url_column)
+    raise ValueError(f"Unsupported input file type '{extension}' for {path}")
+
+
+# Buffers (row, url, Product, Status) results and writes them in batches every
+# batch_size rows or flush_interval seconds. Subclasses implement _write_batch.
+# URL traces handed in with a row are finished once that row's write completes.
+class BatchedWriter:
+    def __init__(self, stats, batch_size=50, flush_interval=10.0, tracer=None):
+        self.stats = stats
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.tracer = tracer
+
+        self._buffer = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Runs on normal exit, on errors and on Ctrl-C cancellation alike
+        await self.close()
+
+    # Start the timer that flushes the buffer every flush_interval seconds
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # Stop the timer and write whatever is still buffered
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        await self._close_output()
+
+    # Queue one row result, flushing once batch_size rows are buffered
+    async def add(self, row, url, product_code, status, trace=None):
+        self._buffer.append((row, url, product_code, status, trace, time.perf_counter()))
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    # Write everything buffered; returns False if the batch could not be written
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._buffer:
+                return True
+            batch, self._buffer = self._buffer, []
+            results = [(row, url, code, status) for row, url, code, status, _, _ in batch]
+
+            write_start = time.perf_counter()
+            written = await self._write_counted(results)
+            write_seconds = time.perf_counter() - write_start
+
+            if self.tracer is not None:
+                for _, _, _, _, trace, queued in batch:
+                    if trace is not None:
+                        trace.add_stage("write_queue", write_start - queued)
+                        trace.add_stage("write", write_seconds)
+                        trace.set(written=written)
+                        self.tracer.finish(trace)
+            return written
+
+    # Write results straight away, bypassing the buffer; returns True on success
+    async def write(self, results):
+        async with self._flush_lock:
+            return await self._write_counted(results)
+
+    async def _write_counted(self, results):
+        written = await self._write_batch(results)
+        if written:
+            self.stats.increment("url_processed", len(results))
+            logger.info(f"Successfully wrote {len(results)} row(s) in one batch.")
+        else:
+            self.stats.increment("write_errors", len(results))
+            rows = ", ".join(str(result[0]) for result in results)
+            logger.error(f"Failed to write rows {rows}.")
+        return written
+
+    # Write one batch of (row, url, product, status); return True on success
+    async def _write_batch(self, results):
+        raise NotImplementedError
+
+    async def _close_output(self):
+        pass
+
+
+# Function to end a file with a newline if its last line was cut short, so the
+# next append starts on a line of its own
+def terminate_last_line(path):
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+# Base for sinks that append results to a local file. A fresh run replaces the
+# file; a resumed run keeps it and skips rows it already holds as successful,
+# so results restored from the checkpoint are not written twice. A failed row
+# that is retried gets a second record; the last record for a row wins.
+class FileSink(BatchedWriter):
+    # Line-based formats can be repaired after a run killed mid-write
+    line_based = True
+
+    def __init__(self, path, stats, resume=False, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.path = path
+        self._written_rows = set()
+        if resume and os.path.exists(path):
+            if self.line_based:
+                terminate_last_line(path)
+            self._written_rows = set(self._existing_rows())
+            logger.info(f"{len(self._written_rows)} successful row(s) already in {path}")
+        elif os.path.exists(path):
+            os.remove(path)
+
+    async def _write_batch(self, results):
+        results = [result for result in results if result[0] not in self._written_rows]
+        if not results:
+            return True
+        try:
+            # File writes run in a worker thread so a slow disk never stalls pages
+            await asyncio.to_thread(self._append, results)
+        except OSError as e:
+            logger.error(f"Error writing to {self.path}: {e}")
+            return False
+        self._written_rows.update(result[0] for result in results if result[3] == 1)
+        return True
+
+    # Rows the file already holds with Status 1
+    def _existing_rows(self):
+        raise NotImplementedError
+
+    def _append(self, results):
+        raise NotImplementedError
+
+
+class CsvSink(FileSink):
+    def _existing_rows(self):
+        with open(self.path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                try:
+                    if int(record["status"]) == 1:
+                        yield int(record["row"])
+                except (KeyError, TypeError, ValueError):
+                    continue
+
+    def _append(self, results):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if new_file:
+                writer.writerow(OUTPUT_FIELDS)
+            writer.writerows(results)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class JsonlSink(FileSink):
+    def _existing_rows(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    if record["status"] == 1:
+                        yield record["row"]
+                except (json.JSONDecodeError, KeyError):
+                    # The last line may be cut short if the run was killed mid-write
+                    continue
+
+    def _append(self, results):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(dict(zip(OUTPUT_FIELDS, result))) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# Writes one Parquet row group per batch. Parquet files cannot be appended to,
+# so a resumed run copies the previous file's row groups into the new one.
+class ParquetSink(FileSink):
+    line_based = False
+
+    def __init__(self, path, stats, resume=False, **kwargs):
+        self._pyarrow = _import_pyarrow()
+        self._schema = self._pyarrow.schema(
+            [
+                ("row", self._pyarrow.int64()),
+                ("url", self._pyarrow.string()),
+                ("product", self._pyarrow.string()),
+                ("status", self._pyarrow.int64()),
+            ]
+        )
+        super().__init__(path, stats, resume=resume, **kwargs)
+        previous = None
+        # A fresh run has already removed the file
+        if os.path.exists(path):
+            previous = f"{path}.previous"
+            os.replace(path, previous)
+        self._writer = self._pyarrow.parquet.ParquetWriter(path, self._schema)
+        if previous:
+            parquet_file = self._pyarrow.parquet.ParquetFile(previous)
+            for index in range(parquet_file.num_row_groups):
+                self._writer.write_table(parquet_file.read_row_group(index))
+            os.remove(previous)
+
+    def _existing_rows(self):
+        parquet_file = self._pyarrow.parquet.ParquetFile(self.path)
+        for batch in parquet_file.iter_batches(columns=["row", "status"]):
+            for row, status in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+                if status == 1:
+                    yield row
+
+    def _append(self, results):
+        columns = list(zip(*results))
+        table = self._pyarrow.table(
+            {name: list(values) for name, values in zip(OUTPUT_FIELDS, columns)},
+            schema=self._schema,
+        )
+        self._writer.write_table(table)
+
+    async def _close_output(self):
+        await asyncio.to_thread(self._writer.close)
+
+
+# Function to pick the sink class for an output file from its extension
+def file_sink(path, stats, resume=False, **kwargs):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in CSV_EXTENSIONS:
+        return CsvSink(path, stats, resume=resume, **kwargs)
+    if extension in JSONL_EXTENSIONS:
+        return JsonlSink(path, stats, resume=resume, **kwargs)
+    if extension in PARQUET_EXTENSIONS:
+        return ParquetSink(path, stats, resume=resume, **kwargs)
+    raise ValueError(f"Unsupported output file type '{extension}' for {path}")
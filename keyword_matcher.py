@@ -0,0 +1,120 @@
+import collections
+import json
+import os
+import re
+import string
+
+# Keyword dictionary bundled with the classifier
+DEFAULT_KEYWORDS_FILE = os.path.join(os.path.dirname(__file__), "keywords.json")
+
+
+# Function to load {language: {category: [keywords]}} dictionaries from a JSON
+# file. A flat {category: [keywords]} file is treated as English keywords.
+def load_keywords(path=DEFAULT_KEYWORDS_FILE):
+    with open(path, encoding="utf-8") as f:
+        keywords = json.load(f)
+
+    if isinstance(keywords, dict) and all(
+        isinstance(words, list) for words in keywords.values()
+    ):
+        keywords = {"en": keywords}
+
+    if not isinstance(keywords, dict) or not all(
+        isinstance(categories, dict)
+        and all(isinstance(words, list) for words in categories.values())
+        for categories in keywords.values()
+    ):
+        raise ValueError(
+            f"{path} must map each language to a {{category: [keywords]}} dictionary"
+        )
+    return keywords
+
+
+# Words are runs of letters and digits, so "top" never matches inside "desktop"
+WORD_RE = re.compile(r"[^\W_]+")
+
+# Maps ASCII punctuation to spaces; str.translate + split is several times
+# faster than a regex scan for plain ASCII text
+ASCII_PUNCTUATION_TO_SPACE = str.maketrans(
+    {char: " " for char in string.punctuation}
+)
+
+
+# Function to split lowercased text into words in one pass
+def tokenize(text):
+    text = text.lower()
+    if text.isascii():
+        return text.translate(ASCII_PUNCTUATION_TO_SPACE).split()
+    return WORD_RE.findall(text)
+
+
+# Keyword sets compiled once into hash lookups over the words of the text.
+# The text is tokenised in a single C-level pass and each word is one dict
+# lookup, so matching respects word boundaries and costs the same however many
+# keywords there are.
+# A multi-word keyword is matched as a phrase and counted once, not once per
+# keyword inside it.
+class KeywordMatcher:
+    def __init__(self, keywords):
+        self.categories = list(keywords)
+        self._words = {}
+        # Phrases by their first word, so they are only looked for when it occurs
+        self._phrases = {}
+
+        for category, words in keywords.items():
+            for keyword in words:
+                parts = tuple(tokenize(keyword))
+                if len(parts) == 1:
+                    self._words.setdefault(parts[0], category)
+                elif parts:
+                    self._phrases.setdefault(parts[0], {}).setdefault(parts, category)
+
+        # Category of every single-word keyword, and None for the other words of
+        # phrases, which are only collected to decide whether a phrase can occur
+        self._index = dict.fromkeys(
+            part
+            for phrases in self._phrases.values()
+            for phrase in phrases
+            for part in phrase
+        )
+        self._index.update(self._words)
+
+        if not self._index:
+            raise ValueError("Keyword dictionary does not contain any keywords")
+
+    # Return per-category hit counts for the given text
+    def match(self, text):
+        tokens = tokenize(text)
+        found = list(filter(self._index.__contains__, tokens))
+        hits = collections.Counter(self._index[word] for word in found)
+        del hits[None]
+
+        if self._phrases:
+            found = set(found)
+            joined = None
+            for first in self._phrases.keys() & found:
+                for phrase, category in self._phrases[first].items():
+                    if not found.issuperset(phrase):
+                        continue
+                    if joined is None:
+                        # Space-delimited words make phrase counting a C-level
+                        # substring count
+                        joined = " " + " ".join(tokens) + " "
+                    count = joined.count(" " + " ".join(phrase) + " ")
+                    if not count:
+                        continue
+                    hits[category] += count
+                    # A phrase is one hit, not one per keyword inside it
+                    for part in phrase:
+                        if part in self._words:
+                            hits[self._words[part]] -= count
+
+        return +hits
+
+
+# Function to compile one matcher per language in the keyword file
+def load_matchers(path=DEFAULT_KEYWORDS_FILE):
+    return {
+        language: KeywordMatcher(categories)
+        for language, categories in load_keywords(path).items()
+    }
@@ -0,0 +1,122 @@
+import re
+
+from keyword_matcher import tokenize
+
+# Legacy region-only tags seen in the wild that mean English
+ENGLISH_REGION_TAGS = {"gb", "us", "uk"}
+
+# Primary language subtags are 2-3 letters (ISO 639), optionally followed by
+# script/region/variant subtags: "en", "EN", "en-AU", "en_GB", "zh-Hant-TW"
+LANGUAGE_TAG_RE = re.compile(r"^([a-z]{2,3})(?:[-_][a-z0-9]{1,8})*$")
+
+# Detection needs at least this many profile hits before it claims a language
+MIN_DETECTION_HITS = 3
+
+# Detected languages below this confidence fall back to the declared <html lang>
+DEFAULT_CONFIDENCE_THRESHOLD = 0.6
+
+# Function words plus common storefront vocabulary for each supported language.
+# Metadata is short and keyword-heavy, so shop phrases ("free delivery",
+# "kostenloser Versand") carry as much signal as articles and prepositions.
+LANGUAGE_PROFILES = {
+    "en": (
+        "the and for with you your our from this that are all new shop online "
+        "free delivery shipping returns sale women men kids official store "
+        "collection discover buy"
+    ),
+    "de": (
+        "der die das und für mit sie ihr unsere von ist im auf den dem des zu "
+        "ein eine jetzt online kaufen kostenloser versand damen herren kinder "
+        "neue entdecken bei rückgabe"
+    ),
+    "fr": (
+        "le la les et pour avec vous votre nos de du des est en un une sur au "
+        "aux livraison gratuite achetez femme homme enfant nouvelle découvrez "
+        "boutique officielle retours"
+    ),
+    "es": (
+        "el la los las y para con tu su nuestra de del es en un una por al "
+        "envío gratis compra mujer hombre niños nueva descubre tienda oficial "
+        "devoluciones"
+    ),
+    "it": (
+        "il lo la gli le e per con tu tuo nostra di del della è in un una su al "
+        "spedizione gratuita acquista donna uomo bambini nuova scopri negozio "
+        "ufficiale resi"
+    ),
+    "nl": (
+        "de het een en voor met je jouw onze van is in op bij naar ook nu "
+        "gratis verzending bestel dames heren kinderen nieuwe ontdek winkel "
+        "officiële retourneren"
+    ),
+    "pt": (
+        "o a os as e para com você seu sua nossa de do da é em um uma no na "
+        "frete envio grátis compre mulher homem crianças nova descubra loja "
+        "oficial devoluções"
+    ),
+    "sv": (
+        "och för med du din vår från är på en ett av till det som nu fri frakt "
+        "köp dam herr barn nya upptäck butik officiella returer"
+    ),
+    "da": (
+        "og for med du din vores fra er på en et af til det som nu fri fragt "
+        "køb dame herre børn nye opdag butik officielle returnering"
+    ),
+    "pl": (
+        "i w na z do dla się jest to nie od po jak twoje nasze darmowa dostawa "
+        "kup damska męska dzieci nowa odkryj sklep oficjalny zwroty"
+    ),
+}
+
+# word -> languages it belongs to, built once from the profiles
+_WORD_LANGUAGES = {}
+for _language, _words in LANGUAGE_PROFILES.items():
+    for _word in _words.split():
+        _WORD_LANGUAGES.setdefault(_word, []).append(_language)
+
+
+# Function to reduce a BCP-47 tag to its lowercase primary language subtag
+def normalise_language_tag(tag):
+    if not tag:
+        return None
+    tag = tag.strip().lower()
+    if tag in ENGLISH_REGION_TAGS:
+        return "en"
+    match = LANGUAGE_TAG_RE.match(tag)
+    return match.group(1) if match else None
+
+
+# Function to detect the language of extracted text from word profiles.
+# Returns (language, confidence) where confidence is the share of profile
+# hits that went to the winning language.
+def detect_language(text):
+    scores = {}
+    for word in tokenize(text or ""):
+        for language in _WORD_LANGUAGES.get(word, ()):
+            scores[language] = scores.get(language, 0) + 1
+
+    if not scores:
+        return None, 0.0
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best_language, best_hits = ranked[0]
+    if best_hits < MIN_DETECTION_HITS:
+        return best_language, 0.0
+
+    runner_up_hits = ranked[1][1] if len(ranked) > 1 else 0
+    return best_language, best_hits / (best_hits + runner_up_hits)
+
+
+# Function to combine the declared <html lang> tag with the detected language.
+# Confident detection wins because storefront templates often ship the wrong
+# lang attribute; otherwise the declared tag is trusted.
+def resolve_language(declared_tag, text, threshold=DEFAULT_CONFIDENCE_THRESHOLD):
+    declared = normalise_language_tag(declared_tag)
+    detected, confidence = detect_language(text)
+
+    if detected and confidence >= threshold:
+        return detected, confidence
+    if declared:
+        # A declared tag the detector agrees with, even weakly, is confident
+        return declared, 1.0 if declared == detected else threshold
+    return detected, confidence
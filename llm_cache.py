@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# Cache hits whose last_used time is written in one transaction
+TOUCH_BATCH_SIZE = 500
+
+# Seconds a write waits for another process holding the cache file. The cache
+# is used on the event loop, so a write is skipped rather than stalling it.
+LOCK_TIMEOUT = 0.5
+
+# Matches the "Language: xx" suffix build_metadata appends; regional storefronts
+# of the same brand differ only there, so it is left out of the cache key
+LANGUAGE_SUFFIX_RE = re.compile(r"\blanguage:\s*\S+\s*$")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+# Function to normalise metadata so near-identical pages share a cache key
+def normalise_metadata(metadata):
+    text = WHITESPACE_RE.sub(" ", (metadata or "").lower()).strip()
+    return LANGUAGE_SUFFIX_RE.sub("", text).strip()
+
+
+# Function to build the content-addressed cache key for one ChatGPT request
+def cache_key(metadata, model, prompt_version, temperature):
+    payload = json.dumps(
+        [normalise_metadata(metadata), model, prompt_version, temperature],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Persistent SQLite cache of ChatGPT category codes with TTL and size eviction.
+# Shard workers may share the file, so database errors such as "database is
+# locked" never fail a URL: a lookup that fails is a miss and a write that
+# fails is skipped. Hits only read; their last_used times are kept in memory
+# and written in batches.
+class LLMCache:
+    def __init__(self, path, max_entries=100000, ttl_seconds=30 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._puts_since_evict = 0
+        # Keys hit since the last batch of last_used updates, with the hit time
+        self._touched = {}
+        self._conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_results ("
+            " key TEXT PRIMARY KEY,"
+            " category TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_results_last_used ON llm_results (last_used)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.evict()
+        self._conn.close()
+
+    # Return the cached category for a key, or None if missing or expired.
+    # Expired entries are left for evict() to delete.
+    def get(self, key):
+        try:
+            row = self._conn.execute(
+                "SELECT category, created FROM llm_results WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading the ChatGPT cache {self.path}: {e}")
+            return None
+        if row is None:
+            return None
+
+        category, created = row
+        now = time.time()
+        if now - created > self.ttl_seconds:
+            return None
+
+        self._touched[key] = now
+        if len(self._touched) >= TOUCH_BATCH_SIZE:
+            self.flush_touched()
+        return category
+
+    def put(self, key, category):
+        now = time.time()
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_results (key, category, created, last_used)"
+                    " VALUES (?, ?, ?, ?)",
+                    (key, category, now, now),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Error writing to the ChatGPT cache {self.path}: {e}")
+            return
+
+        self._puts_since_evict += 1
+        if self._puts_since_evict >= 1000:
+            self.evict()
+
+    # Write the last_used times of recent hits in one transaction. If the file
+    # is locked they are kept and written with the next batch.
+    def flush_touched(self):
+        if not self._touched:
+            return
+        try:
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE llm_results SET last_used = ? WHERE key = ?",
+                    [(used, key) for key, used in self._touched.items()],
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Error updating the ChatGPT cache {self.path}: {e}")
+            return
+        self._touched.clear()
+
+    # Drop expired entries, then the least recently used beyond max_entries
+    def evict(self):
+        self._puts_since_evict = 0
+        self.flush_touched()
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM llm_results WHERE created < ?",
+                    (time.time() - self.ttl_seconds,),
+                )
+                self._conn.execute(
+                    "DELETE FROM llm_results WHERE key IN ("
+                    " SELECT key FROM llm_results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Error evicting entries from the ChatGPT cache {self.path}: {e}")
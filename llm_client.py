@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# Chat model used unless another is given
+DEFAULT_MODEL = "gpt-4"
+
+# Rough characters-per-token ratio used to budget prompts before sending them
+CHARS_PER_TOKEN = 4
+
+
+# Function to estimate the tokens a chat request will consume
+def estimate_tokens(messages, max_tokens):
+    prompt_chars = sum(len(message["content"]) for message in messages)
+    return prompt_chars // CHARS_PER_TOKEN + max_tokens
+
+
+# Requests-per-minute and tokens-per-minute budgets enforced as token buckets
+# that refill continuously. Waiting callers sleep without blocking the loop.
+class RateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_allowance = float(requests_per_minute)
+        self._token_allowance = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._request_allowance = min(
+            self.requests_per_minute,
+            self._request_allowance + elapsed * self.requests_per_minute / 60,
+        )
+        self._token_allowance = min(
+            self.tokens_per_minute,
+            self._token_allowance + elapsed * self.tokens_per_minute / 60,
+        )
+
+    # Wait until one request of the given token size fits in both budgets
+    async def acquire(self, tokens):
+        # A request larger than the whole budget waits for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._request_allowance >= 1 and self._token_allowance >= tokens:
+                    self._request_allowance -= 1
+                    self._token_allowance -= tokens
+                    return
+                wait = max(
+                    (1 - self._request_allowance) * 60 / self.requests_per_minute,
+                    (tokens - self._token_allowance) * 60 / self.tokens_per_minute,
+                )
+                await asyncio.sleep(wait)
+
+    # Return tokens that were budgeted but not used by the actual response
+    def refund(self, tokens):
+        self._token_allowance = min(
+            self.tokens_per_minute, self._token_allowance + max(tokens, 0)
+        )
+
+
+# Async chat-completions client shared by every worker of a run. Calls are
+# capped in flight, paced by the rate limiter and retried with jittered
+# exponential backoff on 429, 5xx and connection errors.
+class LLMClient:
+    def __init__(
+        self,
+        api_key,
+        base_url=None,
+        model=DEFAULT_MODEL,
+        requests_per_minute=500,
+        tokens_per_minute=30000,
+        max_in_flight=8,
+        retries=5,
+        base_delay=1.0,
+        max_delay=60.0,
+        timeout=60.0,
+    ):
+        self.model = model
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        # Imported here so importing the client does not load the OpenAI SDK
+        import openai
+
+        # Retries are handled here so they go through the rate limiter too
+        self._client = openai.AsyncOpenAI(
+            api_key=api_key, base_url=base_url, max_retries=0, timeout=timeout
+        )
+
+    async def close(self):
+        await self._client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    # Send one chat completion request and return the response
+    async def complete(self, messages, max_tokens=50, temperature=0.0):
+        import openai
+
+        budget = estimate_tokens(messages, max_tokens)
+
+        for attempt in range(1, self.retries + 1):
+            await self.limiter.acquire(budget)
+            try:
+                async with self._in_flight:
+                    response = await self._client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature,
+                    )
+                if response.usage is not None:
+                    self.limiter.refund(budget - response.usage.total_tokens)
+                return response
+            except (openai.RateLimitError, openai.InternalServerError) as e:
+                reason = f"HTTP {e.status_code}"
+            except (openai.APIConnectionError, openai.APITimeoutError) as e:
+                reason = str(e) or type(e).__name__
+
+            if attempt == self.retries:
+                raise RuntimeError(
+                    f"ChatGPT request failed after {self.retries} attempts ({reason})"
+                )
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            delay = random.uniform(delay / 2, delay)
+            logger.warning(
+                f"ChatGPT request failed ({reason}). Retrying in {delay:.1f}s "
+                f"(Attempt {attempt}/{self.retries})"
+            )
+            await asyncio.sleep(delay)
+
+
+# Collects individual requests and hands them to `handler` in batches of up to
+# `batch_size`, or whatever has arrived once `max_wait` seconds have passed.
+# The handler takes a list of items and returns one result per item.
+class MicroBatcher:
+    def __init__(self, handler, batch_size=8, max_wait=2.0):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+
+    # Queue one item and wait for its result
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.max_wait, self._dispatch
+            )
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    # Send whatever is pending now and wait for every batch in flight
+    async def flush(self):
+        self._dispatch()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = await self.handler(items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
@@ -0,0 +1,184 @@
+import asyncio
+import contextlib
+import logging
+import os
+import resource
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Per-page caps; a page over either is closed and its context discarded.
+# The JS heap is only reported by Chromium; the DOM cap applies to every engine.
+DEFAULT_MAX_DOM_NODES = 200_000
+DEFAULT_MAX_JS_HEAP_MB = 512
+
+# Seconds between checks of a page's DOM and heap
+PAGE_CHECK_INTERVAL = 1.0
+
+# Browser memory above which idle contexts are recycled, then the browser
+# restarted if that was not enough; and the page count after which the
+# browser is restarted regardless
+DEFAULT_MAX_BROWSER_RSS_MB = 3072
+DEFAULT_PAGES_PER_BROWSER = 2000
+
+# Seconds between RSS samples of the browser processes
+RSS_SAMPLE_INTERVAL = 5.0
+
+# DOM size and JS heap of the current document
+PAGE_USAGE_SCRIPT = """
+() => ({
+    nodes: document.getElementsByTagName("*").length,
+    heap: (performance.memory && performance.memory.usedJSHeapSize) || null,
+})
+"""
+
+
+# Function to sum the resident memory of a process and all its descendants.
+# Reads /proc on Linux; elsewhere falls back to getrusage peaks.
+def process_tree_rss_bytes(pid=None):
+    pid = pid or os.getpid()
+    if not os.path.isdir("/proc"):
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        scale = 1 if sys.platform == "darwin" else 1024
+        return (own + children) * scale
+
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            pass
+        stack.extend(children.get(current, ()))
+    return total
+
+
+# Function to measure the Playwright driver and browser processes, which are
+# all descendants of this process
+def browser_rss_bytes():
+    with open("/proc/self/statm") as f:
+        own = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    return process_tree_rss_bytes() - own
+
+
+# Function to read this process's peak RSS
+def own_peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Caps on a single page's DOM size and JS heap
+class PageLimits:
+    def __init__(
+        self,
+        max_dom_nodes=DEFAULT_MAX_DOM_NODES,
+        max_js_heap_mb=DEFAULT_MAX_JS_HEAP_MB,
+        interval=PAGE_CHECK_INTERVAL,
+    ):
+        self.max_dom_nodes = max_dom_nodes
+        self.max_js_heap_bytes = max_js_heap_mb * 1024 * 1024 if max_js_heap_mb else None
+        self.interval = interval
+
+    # Returns "dom_nodes" or "js_heap" if the usage is over a cap, else None
+    def exceeded(self, usage):
+        if self.max_dom_nodes and usage.get("nodes", 0) > self.max_dom_nodes:
+            return "dom_nodes"
+        heap = usage.get("heap")
+        if self.max_js_heap_bytes and heap and heap > self.max_js_heap_bytes:
+            return "js_heap"
+        return None
+
+    # Poll a page until it goes over a cap and return which one. Runs until
+    # cancelled otherwise.
+    async def watch(self, page):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                usage = await asyncio.wait_for(
+                    page.evaluate(PAGE_USAGE_SCRIPT), self.interval * 2
+                )
+            except Exception:
+                # Busy main thread or a document being replaced mid-navigation;
+                # the page budget still bounds how long the page lives
+                continue
+            reason = self.exceeded(usage)
+            if reason is not None:
+                return reason
+
+
+# Samples the RSS of the browser processes in the background and keeps it
+# under max_rss_mb: the first sample over the cap recycles the pool's idle
+# contexts, a second one in a row restarts the browser once in-flight pages
+# finish. Peak browser RSS is recorded in stats as a gauge.
+class MemorySupervisor:
+    def __init__(
+        self,
+        browser_pool,
+        stats,
+        max_rss_mb=DEFAULT_MAX_BROWSER_RSS_MB,
+        interval=RSS_SAMPLE_INTERVAL,
+    ):
+        self.browser_pool = browser_pool
+        self.stats = stats
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024 if max_rss_mb else None
+        self.interval = interval
+        self.peak = 0
+        self._over_cap = False
+        self._task = None
+
+    async def __aenter__(self):
+        if not os.path.isdir("/proc"):
+            logger.warning("Browser memory cannot be sampled on this platform.")
+            return self
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sample()
+            except OSError as e:
+                logger.warning(f"Could not sample browser memory: {e}")
+
+    async def sample(self):
+        rss = await asyncio.to_thread(browser_rss_bytes)
+        self.peak = max(self.peak, rss)
+        self.stats.record_peak("peak_browser_rss_bytes", rss)
+        if self.max_rss_bytes is None or rss <= self.max_rss_bytes:
+            self._over_cap = False
+            return
+
+        rss_mb = rss / 1024 / 1024
+        if not self._over_cap:
+            logger.warning(f"Browser RSS {rss_mb:.0f} MB over the cap; recycling idle contexts.")
+            self.stats.increment("rss_context_recycles")
+            await self.browser_pool.recycle_idle_contexts()
+            self._over_cap = True
+        else:
+            logger.warning(f"Browser RSS still {rss_mb:.0f} MB; restarting the browser.")
+            self.stats.increment("rss_browser_restarts")
+            await self.browser_pool.request_restart("memory cap")
+            self._over_cap = False
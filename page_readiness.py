@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Hard limit on the time one URL may spend in the browser, in seconds
+DEFAULT_PAGE_BUDGET = 30.0
+
+# Share of the budget navigation may use before readiness polling starts
+NAVIGATION_SHARE = 0.6
+
+# Time kept back from readiness polling so extraction can still run, in seconds
+EXTRACTION_RESERVE = 2.0
+
+# Headings a page needs before it counts as ready; storefront navigation
+# menus are usually rendered as a handful of headings
+DEFAULT_MIN_HEADINGS = 3
+
+# How often the readiness check runs in the page, in milliseconds
+POLL_INTERVAL_MS = 250
+
+# Navigation errors worth another attempt if budget remains
+RETRYABLE_NAVIGATION_ERRORS = (
+    "net::ERR_CONNECTION_RESET",
+    "net::ERR_CONNECTION_CLOSED",
+    "net::ERR_EMPTY_RESPONSE",
+    "net::ERR_NETWORK_CHANGED",
+    "NS_ERROR_NET_RESET",
+    "Connection reset",
+)
+
+# Minimum budget left, in seconds, for another navigation attempt to be useful
+MIN_RETRY_BUDGET = 5.0
+
+# In-page check that the fields metadata extraction needs are present. A page
+# with a title and a description/OpenGraph tag is ready as it is; headings are
+# only waited for when one of the two is missing, so pages with few headings
+# are not held until the readiness stage runs out.
+READINESS_CHECK_SCRIPT = """
+({ minHeadings }) => {
+    const title = document.querySelector("title");
+    const hasTitle = !!(title && title.textContent.trim());
+    const hasMeta = !!document.querySelector(
+        'meta[property="og:title"], meta[property="og:description"], meta[name="description"]'
+    );
+    if (hasTitle && hasMeta) {
+        return true;
+    }
+    const headings = document.querySelectorAll("h1, h2, h3, h4, h5, h6").length;
+    return headings >= minHeadings && (hasTitle || hasMeta);
+}
+"""
+
+
+# Per-URL time budget shared by navigation, readiness polling and extraction
+class PageBudget:
+    def __init__(self, seconds=DEFAULT_PAGE_BUDGET):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+
+    # Seconds left before the deadline
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+    # Milliseconds a stage may use: its cap, limited by what is left overall
+    def stage_timeout(self, cap_seconds=None, reserve=0.0):
+        seconds = self.remaining() - reserve
+        if cap_seconds is not None:
+            seconds = min(seconds, cap_seconds)
+        return max(0, int(seconds * 1000))
+
+
+# Function to navigate to a URL within the budget, retrying transient network
+# errors while enough budget remains. Only waits for DOMContentLoaded; readiness
+# is checked separately so slow trackers and ads never hold up extraction.
+# Returns True once the document has loaded; timeouts are raised to the caller.
+async def navigate_within_budget(page, url, budget, retry_delay=1.0):
+    # Imported here so the module can be imported without Playwright
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    navigation_cap = budget.seconds * NAVIGATION_SHARE
+    attempt = 1
+    while True:
+        timeout = budget.stage_timeout(navigation_cap, reserve=EXTRACTION_RESERVE)
+        if timeout <= 0:
+            raise PlaywrightTimeoutError(f"Page budget exhausted before loading {url}")
+        try:
+            await page.goto(url, wait_until="domcontentloaded", timeout=timeout)
+            return True
+        except PlaywrightTimeoutError:
+            raise
+        except Exception as e:
+            retryable = any(error in str(e) for error in RETRYABLE_NAVIGATION_ERRORS)
+            if not retryable or budget.remaining() < MIN_RETRY_BUDGET + retry_delay:
+                raise
+            logger.warning(
+                f"Error while trying to load {url}: {e}. Retrying "
+                f"(Attempt {attempt + 1}, {budget.remaining():.0f}s of budget left)"
+            )
+        attempt += 1
+        await asyncio.sleep(retry_delay)
+
+
+# Function to poll the page until the metadata fields are present or the
+# readiness stage runs out. Returns True if the page became ready; on False
+# the caller extracts whatever has rendered so far.
+async def wait_until_ready(page, budget, min_headings=DEFAULT_MIN_HEADINGS):
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    timeout = budget.stage_timeout(reserve=EXTRACTION_RESERVE)
+    if timeout <= 0:
+        return False
+    try:
+        await page.wait_for_function(
+            READINESS_CHECK_SCRIPT,
+            arg={"minHeadings": min_headings},
+            polling=POLL_INTERVAL_MS,
+            timeout=timeout,
+        )
+        return True
+    except PlaywrightTimeoutError:
+        return False
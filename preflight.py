@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import socket
+import ssl
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Seconds allowed for each of the DNS lookup, TCP connect and TLS handshake
+DEFAULT_PROBE_TIMEOUT = 3.0
+
+# Seconds a DNS answer or probe result is reused for the same host. Failures
+# are kept briefly so a retry later in the run probes the host again.
+DEFAULT_CACHE_TTL = 600.0
+FAILURE_CACHE_TTL = 20.0
+
+# Addresses of a host tried before it is declared unreachable
+MAX_ADDRESSES_PER_HOST = 2
+
+# Consecutive host failures that open a domain's circuit, and seconds it stays
+# open before one URL is let through to test the host again
+DEFAULT_BREAKER_THRESHOLD = 3
+DEFAULT_BREAKER_COOLDOWN = 300.0
+
+# Error classes that say something about the host rather than the page
+HOST_ERROR_CLASSES = {"dns", "network", "timeout", "ssl"}
+
+# getaddrinfo errors that mean the name does not exist, as opposed to a
+# resolver that is temporarily unavailable
+NONEXISTENT_NAME_ERRORS = {
+    getattr(socket, name)
+    for name in ("EAI_NONAME", "EAI_NODATA")
+    if hasattr(socket, name)
+}
+
+
+# Function to split a URL into (scheme, host, port) for probing
+def url_endpoint(url):
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    return parsed.scheme, (parsed.hostname or "").lower(), port
+
+
+# Caches results of an async lookup per key for `ttl_for(result)` seconds.
+# Concurrent lookups of the same key share one in-flight task.
+class TtlCache:
+    def __init__(self, ttl_for):
+        self.ttl_for = ttl_for
+        self._entries = {}
+        self._in_flight = {}
+
+    async def get(self, key, lookup):
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(lookup())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        result = await asyncio.shield(task)
+        self._entries[key] = (result, time.monotonic() + self.ttl_for(result))
+        return result
+
+
+# Pre-flight liveness check run before a URL gets an HTTP fetch or a browser
+# page: resolve the host through a cached resolver, then open a TCP connection
+# and, for https, complete a TLS handshake. Dead domains and hosts refusing
+# connections are rejected in milliseconds instead of a full page timeout.
+class Preflight:
+    def __init__(self, timeout=DEFAULT_PROBE_TIMEOUT, cache_ttl=DEFAULT_CACHE_TTL):
+        self.timeout = timeout
+        self._addresses = TtlCache(
+            lambda result: cache_ttl if result[1] is None else FAILURE_CACHE_TTL
+        )
+        self._probes = TtlCache(
+            lambda error_class: cache_ttl if error_class is None else FAILURE_CACHE_TTL
+        )
+        self._tls_context = ssl.create_default_context()
+
+    # Returns None if the URL's host is reachable, otherwise its error class
+    async def check(self, url):
+        scheme, host, port = url_endpoint(url)
+        if not host:
+            return "other"
+        return await self._probes.get(
+            (scheme, host, port), lambda: self._probe(scheme, host, port)
+        )
+
+    # Resolve a host once per TTL; returns (addresses, error class)
+    async def resolve(self, host, port):
+        return await self._addresses.get((host, port), lambda: self._resolve(host, port))
+
+    async def _resolve(self, host, port):
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(host, port, type=socket.SOCK_STREAM), self.timeout
+            )
+        except asyncio.TimeoutError:
+            return [], "network"
+        except socket.gaierror as e:
+            # A missing name is permanent; a failing resolver is not
+            return [], "dns" if e.errno in NONEXISTENT_NAME_ERRORS else "network"
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        return addresses, None
+
+    async def _probe(self, scheme, host, port):
+        addresses, error_class = await self.resolve(host, port)
+        if error_class is not None:
+            logger.info(f"Pre-flight: {host} did not resolve ({error_class})")
+            return error_class
+
+        error_class = "network"
+        for address in addresses[:MAX_ADDRESSES_PER_HOST]:
+            error_class = await self._connect(scheme, host, address, port)
+            if error_class is None:
+                return None
+        logger.info(f"Pre-flight: {host}:{port} unreachable ({error_class})")
+        return error_class
+
+    # Open (and for https, handshake) one connection to an address
+    async def _connect(self, scheme, host, address, port):
+        tls = scheme == "https"
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    address,
+                    port,
+                    ssl=self._tls_context if tls else None,
+                    server_hostname=host if tls else None,
+                ),
+                # The handshake gets its own share of the budget
+                self.timeout * (2 if tls else 1),
+            )
+        except asyncio.TimeoutError:
+            return "timeout"
+        except ssl.SSLError:
+            return "ssl"
+        except OSError:
+            return "network"
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+        return None
+
+
+# Per-domain circuit breaker. After `threshold` consecutive host failures a
+# domain's circuit opens and its remaining URLs fail fast. After `cooldown`
+# seconds one URL is let through; success closes the circuit, failure opens it
+# for another cooldown.
+class CircuitBreaker:
+    def __init__(self, threshold=DEFAULT_BREAKER_THRESHOLD, cooldown=DEFAULT_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._failures = {}
+        self._open_until = {}
+        self._trial_in_flight = set()
+
+    # True if a URL for this domain may be attempted now
+    def allow(self, domain):
+        open_until = self._open_until.get(domain)
+        if open_until is None:
+            return True
+        if time.monotonic() < open_until or domain in self._trial_in_flight:
+            return False
+        # Half-open: let a single URL test the host
+        self._trial_in_flight.add(domain)
+        return True
+
+    # Record an attempt's outcome; returns True if it opened the circuit
+    def record(self, domain, error_class):
+        self._trial_in_flight.discard(domain)
+        if error_class not in HOST_ERROR_CLASSES:
+            # Success, or a failure that says nothing about the host
+            self._failures.pop(domain, None)
+            self._open_until.pop(domain, None)
+            return False
+
+        failures = self._failures.get(domain, 0) + 1
+        self._failures[domain] = failures
+        if failures >= self.threshold:
+            was_open = domain in self._open_until
+            self._open_until[domain] = time.monotonic() + self.cooldown
+            return not was_open
+        return False
+
+    def open_domains(self):
+        return sorted(self._open_until)
@@ -0,0 +1,256 @@
+import argparse
+import logging
+import sqlite3
+import time
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Error class of the URL the current worker task is classifying, set where
+# the failure happens and read by the worker once classify returns status 0
+current_failure = ContextVar("current_failure", default=None)
+
+# Seconds a run waits at its end for scheduled retries to come due
+DEFAULT_RETRY_WAIT = 120.0
+
+# Longest page budget a retried timeout can be given, in seconds
+MAX_RETRY_PAGE_BUDGET = 120.0
+
+# Error message fragments from Playwright's engines and libcurl, by class
+ERROR_MARKERS = (
+    ("dns", ("ERR_NAME_NOT_RESOLVED", "NS_ERROR_UNKNOWN_HOST", "Could not resolve host")),
+    ("ssl", ("SSL peer certificate or SSH remote key was not OK", "SSL connect error",
+             "ERR_SSL_", "ERR_CERT_", "SSL_ERROR_", "SEC_ERROR_")),
+    ("timeout", ("TimeoutError", "Timeout")),
+    ("network", ("ERR_CONNECTION_", "NS_ERROR_CONNECTION_REFUSED", "NS_ERROR_NET_",
+                 "Could not connect", "Connection refused", "ERR_ADDRESS_UNREACHABLE")),
+)
+
+
+# How one class of error is retried
+class RetryPolicy:
+    def __init__(self, max_retries, base_delay, budget_factor=1.0, downgrade_to_http=False):
+        self.max_retries = max_retries
+        # Seconds before the first retry; doubles with every further retry
+        self.base_delay = base_delay
+        # Page budget multiplier applied once per earlier attempt
+        self.budget_factor = budget_factor
+        # Retry https:// URLs over plain http://
+        self.downgrade_to_http = downgrade_to_http
+
+    def delay(self, attempts):
+        return self.base_delay * 2 ** (attempts - 1)
+
+
+# Retry policy per error class. Classes without a policy are permanent and go
+# straight to the dead-letter list.
+RETRY_POLICIES = {
+    "timeout": RetryPolicy(max_retries=2, base_delay=30, budget_factor=2.0),
+    "extraction": RetryPolicy(max_retries=2, base_delay=30, budget_factor=2.0),
+    "ssl": RetryPolicy(max_retries=1, base_delay=0, downgrade_to_http=True),
+    "network": RetryPolicy(max_retries=2, base_delay=120),
+    "llm": RetryPolicy(max_retries=3, base_delay=60),
+    "other": RetryPolicy(max_retries=1, base_delay=60),
+    # Domains whose circuit breaker was open; the delay matches the breaker
+    # cooldown, so these are normally left for a follow-up run
+    "circuit_open": RetryPolicy(max_retries=1, base_delay=300),
+}
+
+# Failures that say nothing about the URL, such as a page left for ChatGPT in a
+# run without it. They are neither retried nor dead-lettered, so the row is
+# simply classified by a later run.
+UNSCHEDULED_FAILURES = {"llm_disabled"}
+
+
+# Function to record why the URL being classified failed
+def note_failure(error_class):
+    current_failure.set(error_class)
+
+
+# Function to map an exception message to an error class
+def classify_error(message):
+    for error_class, markers in ERROR_MARKERS:
+        if any(marker in message for marker in markers):
+            return error_class
+    return "other"
+
+
+# Persistent schedule of failed rows. Failures are retried after a backoff
+# that depends on their error class, in a pass at the end of the run or in a
+# follow-up --resume run; rows that keep failing, or fail permanently, are
+# moved to a dead-letter list and left alone.
+class RetrySchedule:
+    def __init__(self, path, resume=False, policies=None):
+        self.path = path
+        self.policies = policies or RETRY_POLICIES
+        # Rows that failed during this run, so a retry within the run is not
+        # counted as a second failed row
+        self._failed_this_run = set()
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS retries ("
+            " row INTEGER PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " error_class TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " next_attempt REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            " row INTEGER PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " error_class TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL,"
+            " failed_at REAL NOT NULL)"
+        )
+        if not resume:
+            # A fresh run starts a fresh schedule
+            with self._conn:
+                self._conn.execute("DELETE FROM retries")
+                self._conn.execute("DELETE FROM dead_letters")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    # Record a failed attempt; returns "scheduled" or "dead_letter"
+    def record_failure(self, row, url, error_class):
+        entry = self._conn.execute(
+            "SELECT url, attempts FROM retries WHERE row = ?", (row,)
+        ).fetchone()
+        attempts = entry[1] + 1 if entry is not None and entry[0] == url else 1
+        policy = self.policies.get(error_class)
+        self._failed_this_run.add(row)
+
+        with self._conn:
+            if policy is None or attempts > policy.max_retries:
+                self._conn.execute("DELETE FROM retries WHERE row = ?", (row,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead_letters VALUES (?, ?, ?, ?, ?)",
+                    (row, url, error_class, attempts, time.time()),
+                )
+                return "dead_letter"
+            self._conn.execute(
+                "INSERT OR REPLACE INTO retries VALUES (?, ?, ?, ?, ?)",
+                (row, url, error_class, attempts, time.time() + policy.delay(attempts)),
+            )
+        return "scheduled"
+
+    def failed_this_run(self, row):
+        return row in self._failed_this_run
+
+    # Forget a row once it succeeds, including entries left from an older URL
+    def record_success(self, row):
+        scheduled = self._conn.execute(
+            "SELECT EXISTS (SELECT 1 FROM retries WHERE row = ?)"
+            " OR EXISTS (SELECT 1 FROM dead_letters WHERE row = ?)",
+            (row, row),
+        ).fetchone()[0]
+        if not scheduled:
+            return
+        with self._conn:
+            self._conn.execute("DELETE FROM retries WHERE row = ?", (row,))
+            self._conn.execute("DELETE FROM dead_letters WHERE row = ?", (row,))
+
+    # Return (url, overrides) for the next attempt at a scheduled row, or None
+    # if the row is not scheduled for this URL. Overrides are keyword
+    # arguments for classify_page.
+    def retry_options(self, row, url, page_budget):
+        entry = self._conn.execute(
+            "SELECT url, error_class, attempts FROM retries WHERE row = ?", (row,)
+        ).fetchone()
+        if entry is None or entry[0] != url:
+            return None
+        _, error_class, attempts = entry
+        policy = self.policies.get(error_class, self.policies["other"])
+
+        overrides = {}
+        if policy.budget_factor != 1.0:
+            overrides["page_budget"] = min(
+                page_budget * policy.budget_factor**attempts, MAX_RETRY_PAGE_BUDGET
+            )
+        if policy.downgrade_to_http:
+            url = "http://" + url.split("://", 1)[-1]
+        return url, overrides
+
+    # True if the row is scheduled for a later retry that is not due yet
+    def deferred(self, row, url, now=None):
+        entry = self._conn.execute(
+            "SELECT url, next_attempt FROM retries WHERE row = ?", (row,)
+        ).fetchone()
+        return entry is not None and entry[0] == url and entry[1] > (now or time.time())
+
+    def is_dead(self, row, url):
+        entry = self._conn.execute(
+            "SELECT url FROM dead_letters WHERE row = ?", (row,)
+        ).fetchone()
+        return entry is not None and entry[0] == url
+
+    # Scheduled (row, url) pairs whose retry is due by `now`
+    def due(self, now=None):
+        return self._conn.execute(
+            "SELECT row, url FROM retries WHERE next_attempt <= ? ORDER BY row",
+            (now or time.time(),),
+        ).fetchall()
+
+    # Time of the earliest scheduled retry, or None if nothing is scheduled
+    def next_due(self):
+        return self._conn.execute("SELECT MIN(next_attempt) FROM retries").fetchone()[0]
+
+    def pending(self):
+        return self._conn.execute("SELECT COUNT(*) FROM retries").fetchone()[0]
+
+    def scheduled(self):
+        return self._conn.execute(
+            "SELECT row, url, error_class, attempts, next_attempt FROM retries"
+            " ORDER BY row"
+        ).fetchall()
+
+    def dead_letters(self):
+        return self._conn.execute(
+            "SELECT row, url, error_class, attempts, failed_at FROM dead_letters"
+            " ORDER BY row"
+        ).fetchall()
+
+
+# Yields the scheduled rows that are due, for a retry pass
+class DueRetrySource:
+    def __init__(self, retry_schedule):
+        self.retry_schedule = retry_schedule
+
+    def rows(self, resume=False, stats=None):
+        yield from self.retry_schedule.due()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="List scheduled retries and dead-lettered rows."
+    )
+    parser.add_argument(
+        "schedule",
+        nargs="?",
+        default="classifier_retries.sqlite3",
+        help="Retry schedule file (default: classifier_retries.sqlite3)",
+    )
+    args = parser.parse_args(argv)
+
+    with RetrySchedule(args.schedule, resume=True) as schedule:
+        rows = schedule.scheduled()
+        print(f"{len(rows)} row(s) scheduled for retry:")
+        for row, url, error_class, attempts, next_attempt in rows:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(next_attempt))
+            print(f"  row {row}: {url} ({error_class}, {attempts} attempt(s), due {when})")
+        dead_letters = schedule.dead_letters()
+        print(f"{len(dead_letters)} dead-lettered row(s):")
+        for row, url, error_class, attempts, _ in dead_letters:
+            print(f"  row {row}: {url} ({error_class} after {attempts} attempt(s))")
+
+
+if __name__ == "__main__":
+    main()
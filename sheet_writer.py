@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import random
+
+import gspread
+from gspread.utils import rowcol_to_a1
+
+from io_backends import BatchedWriter, rows_to_process
+
+logger = logging.getLogger(__name__)
+
+# Sheet columns written for every processed row
+PRODUCT_COLUMN = 3
+STATUS_COLUMN = 4
+
+# HTTP status codes worth retrying: quota exhaustion and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+# Read the HTTP status code from a gspread API error, if there is one
+def api_error_code(error):
+    code = getattr(error, "code", None)
+    if code is None and getattr(error, "response", None) is not None:
+        code = error.response.status_code
+    return code
+
+
+# Columns expected in the Google Sheet
+SHEET_HEADERS = [
+    "Duplicate",
+    "URL",
+    "Product",
+    "Status",
+    "Email",
+    "Name",
+    "Competitor",
+    "Response",
+    "Comments",
+]
+
+
+# Reads rows from the first worksheet. The Sheets API only returns whole
+# sheets, so the records are fetched once and then yielded row by row.
+class SheetSource:
+    def __init__(
+        self, sheet, url_column="URL", status_column="Status", duplicate_column="Duplicate"
+    ):
+        self.sheet = sheet
+        self.url_column = url_column
+        self.status_column = status_column
+        self.duplicate_column = duplicate_column
+        # Rows marked in the Duplicate column, filled in as rows are read
+        self.duplicate_rows = set()
+
+    def rows(self, resume=False, stats=None):
+        logger.info("Fetching records from the Google Sheet...")
+        records = self.sheet.get_all_records(expected_headers=SHEET_HEADERS)
+        yield from rows_to_process(
+            enumerate(records, start=2),  # Starting from row 2
+            self.url_column,
+            self.status_column,
+            resume,
+            stats,
+            self.duplicate_column,
+            self.duplicate_rows,
+        )
+
+
+# Writes (row, Product, Status) batches with one batch_update. Writes run in a
+# worker thread so retries never block the event loop.
+class BatchedSheetWriter(BatchedWriter):
+    def __init__(
+        self,
+        sheet,
+        stats,
+        batch_size=50,
+        flush_interval=10.0,
+        retries=5,
+        base_delay=2.0,
+        max_delay=64.0,
+        tracer=None,
+    ):
+        super().__init__(
+            stats, batch_size=batch_size, flush_interval=flush_interval, tracer=tracer
+        )
+        self.sheet = sheet
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def _write_batch(self, results):
+        data = [
+            {
+                "range": f"{rowcol_to_a1(row, PRODUCT_COLUMN)}:{rowcol_to_a1(row, STATUS_COLUMN)}",
+                "values": [[product_code, status]],
+            }
+            for row, _, product_code, status in results
+        ]
+        return await self._batch_update_with_retry(data)
+
+    # Retry logic for batch updates with exponential backoff and jitter
+    async def _batch_update_with_retry(self, data):
+        for attempt in range(1, self.retries + 1):
+            try:
+                await asyncio.to_thread(
+                    self.sheet.batch_update, data, value_input_option="USER_ENTERED"
+                )
+                return True
+            except gspread.exceptions.APIError as e:
+                code = api_error_code(e)
+                if code not in RETRYABLE_STATUS_CODES:
+                    logger.error(f"Error updating sheet (HTTP {code}): {e}")
+                    return False
+                logger.warning(
+                    f"Sheet write rejected with HTTP {code}. Attempt {attempt}/{self.retries}"
+                )
+            except gspread.exceptions.GSpreadException as e:
+                logger.warning(f"Error updating sheet: {e}. Attempt {attempt}/{self.retries}")
+
+            if attempt < self.retries:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        logger.error(f"Sheet update failed after {self.retries} attempts.")
+        return False
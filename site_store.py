@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from llm_cache import normalise_metadata
+from url_canonical import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# Visit of the URL the current worker task is classifying, so the HTTP tier
+# and the categoriser can check it against the site's stored result
+current_visit = ContextVar("current_visit", default=None)
+
+# Days a stored result may be reused before the site is fully classified again
+DEFAULT_MAX_AGE_DAYS = 30.0
+
+
+# Function to hash extracted metadata; whitespace, case and the language
+# suffix do not change the fingerprint
+def metadata_fingerprint(metadata):
+    return hashlib.sha256(normalise_metadata(metadata).encode("utf-8")).hexdigest()
+
+
+# What is known about one URL while it is being classified: the stored entry
+# from an earlier run, if still within the max age, and what this visit saw
+class SiteVisit:
+    def __init__(self, key, url, previous=None):
+        self.key = key
+        self.url = url
+        # (etag, last_modified, fingerprint, category) or None
+        self.previous = previous
+        self.etag = None
+        self.last_modified = None
+        self.fingerprint = None
+        # How the stored result was reused ("not_modified", "fingerprint"), if it was
+        self.reused = None
+
+    # Keyword arguments for HttpFetcher.fetch_fields making the request conditional
+    def conditional_headers(self):
+        if self.previous is None:
+            return {}
+        etag, last_modified, _, _ = self.previous
+        return {"etag": etag, "last_modified": last_modified}
+
+    def note_validators(self, fields):
+        self.etag = fields.get("etag")
+        self.last_modified = fields.get("last_modified")
+
+    # Record the extracted metadata; returns the stored category if it matches
+    def match_fingerprint(self, metadata):
+        self.fingerprint = metadata_fingerprint(metadata)
+        if self.previous is None or self.previous[2] != self.fingerprint:
+            return None
+        self.reused = "fingerprint"
+        return self.previous[3]
+
+    # The stored category, for a conditional request answered with 304
+    def not_modified(self):
+        self.reused = "not_modified"
+        etag, last_modified, fingerprint, category = self.previous
+        self.etag, self.last_modified, self.fingerprint = etag, last_modified, fingerprint
+        return category
+
+
+# Persistent per-site record of the HTTP validators (ETag, Last-Modified) and
+# metadata fingerprint last seen, with the category they led to. Re-runs reuse
+# the category while a site is unchanged; after max_age_days the entry is
+# ignored and the site is fully classified again.
+class SiteStore:
+    def __init__(self, path, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sites ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " fingerprint TEXT,"
+            " category TEXT NOT NULL,"
+            " classified_at REAL NOT NULL,"
+            " checked_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    # Start a visit to a URL, with the stored entry if it is recent enough
+    def visit(self, url):
+        key = canonical_url(url)
+        if key is None:
+            return None
+        previous = None
+        if self.max_age_seconds > 0:
+            previous = self._conn.execute(
+                "SELECT etag, last_modified, fingerprint, category FROM sites"
+                " WHERE key = ? AND classified_at >= ?",
+                (key, time.time() - self.max_age_seconds),
+            ).fetchone()
+        return SiteVisit(key, url, previous)
+
+    # Store a successful visit. A reused result keeps its classification
+    # time, so the max age still forces a full refresh.
+    def record(self, visit, category):
+        now = time.time()
+        with self._conn:
+            if visit.reused is not None:
+                self._conn.execute(
+                    "UPDATE sites SET etag = COALESCE(?, etag),"
+                    " last_modified = COALESCE(?, last_modified), checked_at = ?"
+                    " WHERE key = ?",
+                    (visit.etag, visit.last_modified, now, visit.key),
+                )
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sites VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    visit.key,
+                    visit.url,
+                    visit.etag,
+                    visit.last_modified,
+                    visit.fingerprint,
+                    category,
+                    now,
+                    now,
+                ),
+            )
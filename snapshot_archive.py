@@ -0,0 +1,209 @@
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from url_canonical import canonical_url
+
+logger = logging.getLogger(__name__)
+
+# Capture of the URL the current worker task is classifying; the HTTP tier
+# and metadata_extract hand their fields to it
+current_capture = ContextVar("current_capture", default=None)
+
+# Extracted fields kept in a snapshot; enough to rebuild the metadata string
+SNAPSHOT_FIELDS = (
+    "og_title",
+    "og_description",
+    "og_keywords",
+    "meta_description",
+    "meta_keywords",
+    "title",
+    "lang",
+    "headings",
+    "category_links",
+)
+
+DEFAULT_COMPRESSION_LEVEL = 9
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError(
+            "The snapshot archive needs zstandard: pip install zstandard"
+        ) from None
+    return zstandard
+
+
+# Fields, and optionally the HTML, extracted for one URL
+class SnapshotCapture:
+    def __init__(self, wants_html=False):
+        self.wants_html = wants_html
+        self.fields = None
+        self.html = None
+
+
+# Function to hand the fields extracted for the current URL to its capture
+def capture_fields(fields, html=None):
+    capture = current_capture.get()
+    if capture is None:
+        return
+    capture.fields = {name: fields.get(name) for name in SNAPSHOT_FIELDS}
+    html = html if html is not None else fields.get("html")
+    if capture.wants_html and html:
+        capture.html = html
+
+
+# True if the current URL's capture also keeps the page HTML
+def wants_html():
+    capture = current_capture.get()
+    return capture is not None and capture.wants_html
+
+
+# Archive of what was extracted from each site, for replaying the
+# categorisers offline. Fields and HTML are stored as zstd-compressed blobs
+# addressed by the SHA-256 of their content, so identical pages (regional
+# storefronts, unchanged sites across runs) are stored once. The latest
+# snapshot per canonical URL points at its blobs and keeps the category the
+# run assigned.
+class SnapshotArchive:
+    def __init__(self, path, store_html=False, level=DEFAULT_COMPRESSION_LEVEL):
+        zstandard = _import_zstandard()
+        self.path = path
+        self.store_html = store_html
+        self._compressor = zstandard.ZstdCompressor(level=level)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._conn = sqlite3.connect(path, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            " hash TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " data BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS snapshots ("
+            " key TEXT PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " fields_hash TEXT NOT NULL,"
+            " html_hash TEXT,"
+            " category TEXT,"
+            " status INTEGER,"
+            " captured_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def capture(self):
+        return SnapshotCapture(self.store_html)
+
+    # Store a blob unless the same content is already there; returns its hash
+    def _put_blob(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        self._conn.execute(
+            "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)",
+            (digest, len(data), self._compressor.compress(data)),
+        )
+        return digest
+
+    def _get_blob(self, digest):
+        row = self._conn.execute(
+            "SELECT data FROM blobs WHERE hash = ?", (digest,)
+        ).fetchone()
+        return None if row is None else self._decompressor.decompress(row[0])
+
+    # Record the snapshot of one URL with the category it was given
+    def record(self, url, capture, category_code, status):
+        key = canonical_url(url)
+        if key is None or capture.fields is None:
+            return
+        payload = json.dumps(
+            capture.fields, ensure_ascii=False, sort_keys=True, separators=(",", ":")
+        )
+        with self._conn:
+            fields_hash = self._put_blob(payload.encode("utf-8"))
+            html_hash = None
+            if capture.html:
+                html_hash = self._put_blob(capture.html.encode("utf-8"))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, fields_hash, html_hash, category_code, status, time.time()),
+            )
+
+    # Yield (url, fields, category, status) for every snapshot, in key order
+    def snapshots(self):
+        cursor = self._conn.execute(
+            "SELECT url, fields_hash, category, status FROM snapshots ORDER BY key"
+        )
+        for url, fields_hash, category, status in cursor:
+            data = self._get_blob(fields_hash)
+            if data is None:
+                logger.warning(f"Snapshot of {url} is missing its fields blob.")
+                continue
+            yield url, json.loads(data), category, status
+
+    def html_for(self, url):
+        row = self._conn.execute(
+            "SELECT html_hash FROM snapshots WHERE key = ?", (canonical_url(url),)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return self._get_blob(row[0]).decode("utf-8")
+
+    # Delete blobs no snapshot points at any more
+    def prune(self):
+        with self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM blobs WHERE hash NOT IN ("
+                " SELECT fields_hash FROM snapshots"
+                " UNION SELECT html_hash FROM snapshots WHERE html_hash IS NOT NULL)"
+            )
+        return cursor.rowcount
+
+    # Returns (snapshots, blobs, uncompressed bytes, compressed bytes)
+    def sizes(self):
+        snapshots = self._conn.execute("SELECT COUNT(*) FROM snapshots").fetchone()[0]
+        blobs, raw, compressed = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0)"
+            " FROM blobs"
+        ).fetchone()
+        return snapshots, blobs, raw, compressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Show the size of a snapshot archive, or prune unused blobs."
+    )
+    parser.add_argument("archive", help="Snapshot archive file")
+    parser.add_argument(
+        "--prune", action="store_true", help="Delete blobs no snapshot refers to"
+    )
+    args = parser.parse_args(argv)
+
+    with SnapshotArchive(args.archive) as archive:
+        if args.prune:
+            print(f"Pruned {archive.prune()} unused blob(s).")
+        snapshots, blobs, raw, compressed = archive.sizes()
+        ratio = raw / compressed if compressed else 0
+        print(f"{snapshots} snapshot(s) in {blobs} blob(s)")
+        print(
+            f"{raw / 1024 / 1024:.1f} MB of fields and HTML stored in "
+            f"{compressed / 1024 / 1024:.1f} MB ({ratio:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
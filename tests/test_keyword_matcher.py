@@ -0,0 +1,55 @@
+import pytest
+
+from keyword_matcher import KeywordMatcher, load_matchers, tokenize
+
+
+@pytest.fixture(scope="module")
+def matchers():
+    return load_matchers()
+
+
+def test_keywords_only_match_whole_words(matchers):
+    text = "Shop the best desktop computers and brand laptops, stop by"
+    assert matchers["en"].match(text) == {}
+
+
+def test_hits_are_counted_per_category(matchers):
+    hits = matchers["en"].match("Dresses, TOPS & tops; trainers and bras")
+    assert hits == {"clothing": 3, "shoes": 1, "lingerie": 1}
+
+
+def test_phrase_counts_once():
+    matcher = KeywordMatcher(
+        {"clothing": ["sports wear"], "lingerie": ["lingerie", "lingerie sets"]}
+    )
+    hits = matcher.match("Lingerie-sets and sports  wear; more lingerie")
+    assert hits == {"clothing": 1, "lingerie": 2}
+    assert matcher.match("sports shoes, wear and tear") == {}
+
+
+@pytest.mark.parametrize(
+    "language, text",
+    [
+        ("de", "Abholung im Markt, modernes Design"),
+        ("da", "Skole og uddannelse"),
+        ("nl", "Jaarlijks rapport over brokken"),
+        ("fr", "Mode de paiement sécurisé, livraison par Jean Dupont"),
+        ("sv", "Skolor och skogsvård"),
+    ],
+)
+def test_short_keywords_do_not_match_inside_words(matchers, language, text):
+    assert matchers[language].match(text) == {}
+
+
+def test_tokenize_handles_non_ascii_text():
+    assert tokenize("Schuhe & Röcke – Größe 38") == ["schuhe", "röcke", "größe", "38"]
+
+
+def test_empty_dictionary_is_rejected():
+    with pytest.raises(ValueError):
+        KeywordMatcher({"clothing": []})
+
+
+def test_short_keywords_match_as_whole_words(matchers):
+    assert matchers["de"].match("BH und Slip, Hosen & Hose") == {"lingerie": 2, "clothing": 2}
+    assert matchers["fr"].match("Mode femme : robes et jeans") == {"clothing": 3}
@@ -0,0 +1,79 @@
+import sqlite3
+import time
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache, cache_key
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "llm_cache.sqlite3")
+
+
+def test_key_ignores_case_whitespace_and_language_suffix():
+    first = cache_key("Shop  Dresses\nLanguage: en", "gpt-4", 1, 0)
+    assert first == cache_key("shop dresses language: fr", "gpt-4", 1, 0)
+    assert first != cache_key("shop dresses", "gpt-4", 2, 0)
+
+
+def test_hits_and_expiry(cache_path):
+    with LLMCache(cache_path, ttl_seconds=60) as cache:
+        assert cache.get("a") is None
+        cache.put("a", "8")
+        assert cache.get("a") == "8"
+        cache._conn.execute("UPDATE llm_results SET created = ?", (time.time() - 61,))
+        assert cache.get("a") is None
+
+
+def test_hits_update_last_used_in_batches(cache_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "TOUCH_BATCH_SIZE", 2)
+    with LLMCache(cache_path, max_entries=2) as cache:
+        for key in ("a", "b"):
+            cache.put(key, "8")
+        cache._conn.execute("UPDATE llm_results SET last_used = 0")
+
+        cache.get("a")
+        assert cache._conn.execute(
+            "SELECT last_used FROM llm_results WHERE key = 'a'"
+        ).fetchone()[0] == 0
+        cache.get("a")
+        cache.get("b")
+        assert cache._conn.execute(
+            "SELECT MIN(last_used) FROM llm_results"
+        ).fetchone()[0] > 0
+
+        # Eviction writes pending hits first, so "a" counts as recently used
+        cache.get("a")
+        time.sleep(0.01)
+        cache.put("c", "7")
+        cache.evict()
+        assert cache.get("a") == "8"
+        assert cache.get("b") is None
+
+
+def test_locked_file_skips_writes(cache_path):
+    with LLMCache(cache_path) as cache:
+        cache.put("a", "8")
+        other = sqlite3.connect(cache_path, isolation_level=None)
+        other.execute("BEGIN EXCLUSIVE")
+        try:
+            cache.put("b", "7")
+            assert cache.get("a") == "8"
+            cache.flush_touched()
+            assert cache._touched
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+        assert cache.get("b") is None
+        cache.flush_touched()
+        assert not cache._touched
+
+
+def test_database_errors_are_cache_misses(cache_path):
+    cache = LLMCache(cache_path)
+    cache.put("a", "8")
+    cache._conn.close()
+    assert cache.get("a") is None
+    cache.put("b", "7")
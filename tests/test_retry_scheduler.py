@@ -0,0 +1,112 @@
+import time
+
+import pytest
+
+from retry_scheduler import (
+    MAX_RETRY_PAGE_BUDGET,
+    RETRY_POLICIES,
+    DueRetrySource,
+    RetrySchedule,
+    classify_error,
+)
+
+
+@pytest.fixture
+def schedule_path(tmp_path):
+    return str(tmp_path / "retries.sqlite3")
+
+
+@pytest.mark.parametrize(
+    "message, error_class",
+    [
+        ("net::ERR_NAME_NOT_RESOLVED at https://gone.example", "dns"),
+        ("net::ERR_CERT_DATE_INVALID", "ssl"),
+        ("TimeoutError: page.goto: Timeout 30000ms exceeded", "timeout"),
+        ("net::ERR_CONNECTION_RESET", "network"),
+        ("Target page, context or browser has been closed", "other"),
+    ],
+)
+def test_classify_error(message, error_class):
+    assert classify_error(message) == error_class
+
+
+def test_delay_doubles_with_every_attempt():
+    policy = RETRY_POLICIES["network"]
+    assert [policy.delay(n) for n in (1, 2, 3)] == [120, 240, 480]
+
+
+def test_failures_are_scheduled_then_dead_lettered(schedule_path):
+    with RetrySchedule(schedule_path) as schedule:
+        before = time.time()
+        assert schedule.record_failure(2, "a.com", "timeout") == "scheduled"
+        assert schedule.deferred(2, "a.com")
+        assert schedule.next_due() >= before + 30
+        assert schedule.record_failure(2, "a.com", "timeout") == "scheduled"
+        assert schedule.scheduled()[0][3] == 2
+        assert schedule.record_failure(2, "a.com", "timeout") == "dead_letter"
+        assert schedule.pending() == 0
+        assert schedule.is_dead(2, "a.com")
+        assert schedule.failed_this_run(2)
+
+
+def test_permanent_errors_go_straight_to_dead_letters(schedule_path):
+    with RetrySchedule(schedule_path) as schedule:
+        assert schedule.record_failure(2, "gone.example", "dns") == "dead_letter"
+        assert not schedule.is_dead(2, "other.example")
+
+
+def test_a_new_url_in_the_row_restarts_the_attempt_count(schedule_path):
+    with RetrySchedule(schedule_path) as schedule:
+        schedule.record_failure(2, "old.com", "other")
+        assert schedule.record_failure(2, "new.com", "other") == "scheduled"
+        assert schedule.retry_options(2, "old.com", 30) is None
+
+
+def test_retry_options(schedule_path):
+    with RetrySchedule(schedule_path) as schedule:
+        schedule.record_failure(2, "https://slow.com", "timeout")
+        schedule.record_failure(3, "https://badcert.com", "ssl")
+        assert schedule.retry_options(2, "https://slow.com", 30) == (
+            "https://slow.com",
+            {"page_budget": 60},
+        )
+        assert schedule.retry_options(2, "https://slow.com", 90) == (
+            "https://slow.com",
+            {"page_budget": MAX_RETRY_PAGE_BUDGET},
+        )
+        assert schedule.retry_options(3, "https://badcert.com", 30) == (
+            "http://badcert.com",
+            {},
+        )
+
+
+def test_due_rows_and_success(schedule_path):
+    with RetrySchedule(schedule_path) as schedule:
+        schedule.record_failure(2, "a.com", "ssl")
+        schedule.record_failure(3, "b.com", "network")
+        assert schedule.due() == [(2, "a.com")]
+        assert list(DueRetrySource(schedule).rows()) == [(2, "a.com")]
+        assert schedule.due(now=time.time() + 121) == [(2, "a.com"), (3, "b.com")]
+        schedule.record_success(2)
+        assert schedule.pending() == 1
+        assert schedule.retry_options(2, "a.com", 30) is None
+
+
+def test_resume_keeps_the_schedule_and_a_fresh_run_clears_it(schedule_path):
+    with RetrySchedule(schedule_path) as schedule:
+        schedule.record_failure(2, "a.com", "timeout")
+        schedule.record_failure(3, "b.com", "dns")
+
+    with RetrySchedule(schedule_path, resume=True) as schedule:
+        assert [entry[:4] for entry in schedule.scheduled()] == [
+            (2, "a.com", "timeout", 1)
+        ]
+        assert schedule.is_dead(3, "b.com")
+        assert not schedule.failed_this_run(2)
+        # The attempt count carries over from the earlier run
+        assert schedule.record_failure(2, "a.com", "timeout") == "scheduled"
+        assert schedule.record_failure(2, "a.com", "timeout") == "dead_letter"
+
+    with RetrySchedule(schedule_path) as schedule:
+        assert schedule.pending() == 0
+        assert schedule.dead_letters() == []
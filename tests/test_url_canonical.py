@@ -0,0 +1,128 @@
+import pytest
+
+from url_canonical import (
+    SiteGroups,
+    canonical_host,
+    canonical_url,
+    is_tracking_param,
+    registrable_domain,
+)
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://www.example.com/shop/",
+        "http://example.com/shop",
+        "example.com/shop#top",
+        "//WWW2.Example.com.:443/shop/",
+        "https://example.com/shop?utm_source=mail&gclid=abc",
+    ],
+)
+def test_equivalent_urls_share_a_key(url):
+    assert canonical_url(url) == "example.com/shop"
+
+
+def test_query_is_kept_sorted_without_tracking_params():
+    url = "https://example.com/p?size=m&fbclid=x&colour=red&UTM_medium=cpc"
+    assert canonical_url(url) == "example.com/p?colour=red&size=m"
+
+
+def test_non_default_port_is_part_of_the_key():
+    assert canonical_url("http://example.com:8080/a") == "example.com:8080/a"
+    assert canonical_url("http://example.com:8080/a", "site") == "example.com:8080"
+
+
+def test_site_and_domain_levels():
+    url = "https://shop.example.co.uk/women/dresses?page=2"
+    assert canonical_url(url, "site") == "shop.example.co.uk"
+    assert canonical_url(url, "domain") == "example.co.uk"
+    assert canonical_url("https://blog.example.com/", "domain") == "example.com"
+
+
+@pytest.mark.parametrize("url", ["", "https://", "http://[::1", "https://:80/"])
+def test_urls_without_a_host_have_no_key(url):
+    assert canonical_url(url) is None
+
+
+def test_hosts_are_normalised():
+    assert canonical_host(" WWW.Example.COM. ") == "example.com"
+    assert canonical_host("bücher.de") == "xn--bcher-kva.de"
+    # Only www-like prefixes are dropped
+    assert canonical_host("web.example.com") == "web.example.com"
+
+
+def test_registrable_domain_keeps_ip_addresses():
+    assert registrable_domain("192.168.0.10") == "192.168.0.10"
+    assert registrable_domain("[::1]") == "[::1]"
+    assert registrable_domain("example.com") == "example.com"
+
+
+def test_tracking_params():
+    assert is_tracking_param("utm_campaign")
+    assert is_tracking_param("_ga")
+    assert not is_tracking_param("page")
+
+
+def test_site_groups_fan_out_the_leader_result():
+    groups = SiteGroups("site")
+    assert groups.join(2, "https://example.com/") is None
+    group = groups.join(3, "http://www.example.com/sale")
+    assert group is not None and group.result is None
+    assert groups.join(4, "https://other.com") is None
+
+    assert groups.finish(2, "https://example.com/", "8", 1) == (
+        [(3, "http://www.example.com/sale")],
+        0,
+    )
+    # Rows joining after a successful result get it straight away
+    late = groups.join(5, "example.com/men")
+    assert late.result == ("8", 1)
+    assert late.followers == []
+
+
+def test_site_groups_keep_followers_of_a_failed_leader():
+    groups = SiteGroups("site")
+    groups.join(2, "https://example.com/")
+    groups.join(3, "https://example.com/a")
+    assert groups.finish(2, "https://example.com/", "-", 0) == (
+        [(3, "https://example.com/a")],
+        0,
+    )
+
+    # The leader is retried, and its followers get the successful result too,
+    # which supersedes the failure they were given
+    assert groups.join(2, "https://example.com/") is None
+    assert groups.finish(2, "https://example.com/", "7", 1) == (
+        [(3, "https://example.com/a")],
+        1,
+    )
+
+
+def test_site_groups_ignore_results_from_non_leaders():
+    groups = SiteGroups("url")
+    groups.join(2, "https://example.com/a")
+    groups.join(3, "https://example.com/a")
+    assert groups.finish(3, "https://example.com/a", "8", 1) == ([], 0)
+    assert groups.finish(9, "https://unknown.com", "8", 1) == ([], 0)
+
+
+def test_followers_of_a_held_row_wait_for_it():
+    groups = SiteGroups("site")
+    groups.hold(2, "https://example.com/")
+    group = groups.join(3, "https://example.com/a")
+    assert group.held and group.leader == 2 and group.result is None
+
+    # A row held after its site already has a leader does not take over
+    groups.hold(4, "https://other.com/")
+    groups.join(5, "https://other.com/b")
+    groups.hold(6, "https://other.com/")
+    assert groups.join(7, "https://other.com/c").leader == 4
+
+    # Once the held row's retry comes due it leads the site again
+    assert groups.join(2, "https://example.com/") is None
+    assert not group.held
+    assert groups.finish(2, "https://example.com/", "8", 1) == (
+        [(3, "https://example.com/a")],
+        0,
+    )
@@ -0,0 +1,100 @@
+import asyncio
+
+from retry_scheduler import RetrySchedule
+from url_canonical import SiteGroups
+from website_classifier import RunStats, fan_out, produce_rows
+
+
+class ListSource:
+    def __init__(self, rows):
+        self._rows = rows
+
+    def rows(self, resume=False, stats=None):
+        return iter(self._rows)
+
+
+class MemoryWriter:
+    def __init__(self):
+        self.rows = {}
+
+    async def add(self, idx, url, product_code, status, trace=None):
+        self.rows[idx] = (product_code, status)
+
+
+class NoCheckpoint:
+    def result_for(self, row, url):
+        return None
+
+    def record(self, row, url, product_code, status):
+        pass
+
+
+# Function to run produce_rows and return the rows it queued
+def produce(rows, writer, stats, retry_schedule, site_groups):
+    queue = asyncio.Queue()
+
+    async def run():
+        await produce_rows(
+            queue, ListSource(rows), writer, NoCheckpoint(), 1, True, stats,
+            retry_schedule, site_groups,
+        )
+        queued = []
+        while (item := queue.get_nowait()) is not None:
+            queued.append(item)
+        return queued
+
+    return asyncio.run(run())
+
+
+def test_rows_of_a_dead_lettered_site_are_not_fetched(tmp_path):
+    schedule = RetrySchedule(str(tmp_path / "retries.sqlite3"))
+    schedule.record_failure(2, "https://gone.com", "dns")
+    schedule.record_failure(4, "https://slow.com", "network")
+    stats = RunStats()
+    writer = MemoryWriter()
+    rows = [
+        (2, "https://gone.com"),
+        (3, "https://www.gone.com/shop"),
+        (4, "https://slow.com"),
+        (5, "http://slow.com/a"),
+        (6, "https://fine.com"),
+    ]
+
+    queued = produce(rows, writer, stats, schedule, SiteGroups("site"))
+
+    assert queued == [(6, "https://fine.com")]
+    assert writer.rows == {}
+    assert stats["dedupe_held_rows"] == 2
+    schedule.close()
+
+
+def test_fanned_out_failures_count_as_failed_rows():
+    stats = RunStats()
+    writer = MemoryWriter()
+    groups = SiteGroups("site")
+    queued = produce(
+        [(2, "https://a.com"), (3, "https://a.com/x"), (4, "https://a.com/y")],
+        writer, stats, None, groups,
+    )
+    assert queued == [(2, "https://a.com")]
+
+    async def finish(product_code, status):
+        await fan_out(
+            groups, 2, "https://a.com", product_code, status, writer, NoCheckpoint(), stats
+        )
+
+    asyncio.run(finish("-", 0))
+    assert writer.rows == {3: ("-", 0), 4: ("-", 0)}
+    assert stats["rows_failed"] == 2
+    assert stats.gauges["rows_failed_net"] == 2
+
+    # A row of the site seen after the failure is given it too
+    produce([(5, "https://a.com/z")], writer, stats, None, groups)
+    assert stats["rows_failed"] == 3
+
+    # The leader's successful retry supersedes every follower's failure
+    groups.join(2, "https://a.com")
+    asyncio.run(finish("8", 1))
+    assert writer.rows == {3: ("8", 1), 4: ("8", 1), 5: ("8", 1)}
+    assert stats["rows_retried_after_failure"] == 3
+    assert stats.gauges["rows_failed_net"] == 0
@@ -0,0 +1,117 @@
+import time
+
+import pytest
+
+from work_queue import WorkQueue, shard_path
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "queue.sqlite3")
+
+
+# Function to finish every leased row with the given status
+def complete_all(work_queue, leased, status):
+    work_queue.complete(
+        [(row, url, "8" if status == 1 else "-", status) for row, url in leased]
+    )
+
+
+def test_enqueue_skips_rows_already_queued(queue_path):
+    with WorkQueue(queue_path) as work_queue:
+        assert work_queue.enqueue([(2, "a.com"), (3, "b.com")]) == 2
+        assert work_queue.enqueue([(2, "a.com"), (3, "b.com"), (4, "c.com")]) == 1
+        assert work_queue.unfinished() == 3
+
+
+def test_lease_hands_each_row_to_one_worker(queue_path):
+    with WorkQueue(queue_path) as work_queue:
+        work_queue.enqueue([(row, f"site{row}.com") for row in range(2, 7)])
+        first = work_queue.lease("worker-1", 3)
+        second = work_queue.lease("worker-2", 3)
+        assert [row for row, _ in first] == [2, 3, 4]
+        assert [row for row, _ in second] == [5, 6]
+        assert work_queue.lease("worker-3", 3) == []
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue_path):
+    with WorkQueue(queue_path, lease_seconds=0.05) as work_queue:
+        work_queue.enqueue([(2, "a.com")])
+        assert work_queue.lease("crashed", 1) == [(2, "a.com")]
+        assert work_queue.lease("worker-2", 1) == []
+        time.sleep(0.1)
+        assert work_queue.lease("worker-2", 1) == [(2, "a.com")]
+
+        # The crashed worker's late result does not overwrite the first one kept
+        work_queue.complete([(2, "a.com", "8", 1)])
+        work_queue.complete([(2, "a.com", "-", 0)])
+        assert work_queue.unmerged(10) == [(2, "a.com", "8", 1)]
+
+
+def test_renewed_lease_is_not_reclaimed(queue_path):
+    with WorkQueue(queue_path, lease_seconds=0.2) as work_queue:
+        work_queue.enqueue([(2, "a.com")])
+        work_queue.lease("worker-1", 1)
+        time.sleep(0.15)
+        work_queue.renew("worker-1")
+        time.sleep(0.1)
+        assert work_queue.lease("worker-2", 1) == []
+
+
+def test_release_returns_rows_to_the_pool(queue_path):
+    with WorkQueue(queue_path) as work_queue:
+        work_queue.enqueue([(2, "a.com"), (3, "b.com")])
+        work_queue.lease("worker-1", 2)
+        work_queue.release("worker-1")
+        assert work_queue.counts() == {"pending": 2}
+        assert len(work_queue.lease("worker-2", 2)) == 2
+
+
+def test_drained_waits_for_seeding_and_unfinished_rows(queue_path):
+    with WorkQueue(queue_path) as work_queue:
+        work_queue.set_seeding(True)
+        assert not work_queue.drained()
+        work_queue.enqueue([(2, "a.com")])
+        work_queue.set_seeding(False)
+        assert not work_queue.drained()
+        complete_all(work_queue, work_queue.lease("worker-1", 1), status=1)
+        assert work_queue.drained()
+
+
+def test_merged_rows_are_not_returned_again(queue_path):
+    with WorkQueue(queue_path) as work_queue:
+        work_queue.enqueue([(2, "a.com"), (3, "b.com")])
+        complete_all(work_queue, work_queue.lease("worker-1", 2), status=1)
+        assert [row for row, _, _, _ in work_queue.unmerged(10)] == [2, 3]
+        work_queue.mark_merged([2])
+        assert [row for row, _, _, _ in work_queue.unmerged(10)] == [3]
+
+
+def test_resume_requeues_failed_rows_only(queue_path):
+    with WorkQueue(queue_path) as work_queue:
+        work_queue.enqueue([(2, "ok.com"), (3, "failed.com")])
+        work_queue.complete([(2, "ok.com", "8", 1), (3, "failed.com", "-", 0)])
+        work_queue.mark_merged([2, 3])
+        assert work_queue.drained()
+
+    # A --resume run reopens the queue and seeds the same rows again
+    with WorkQueue(queue_path) as work_queue:
+        assert work_queue.enqueue([(2, "ok.com"), (3, "failed.com")]) == 1
+        assert not work_queue.drained()
+        assert work_queue.lease("worker-1", 10) == [(3, "failed.com")]
+        work_queue.complete([(3, "failed.com", "7", 1)])
+        assert work_queue.unmerged(10) == [(3, "failed.com", "7", 1)]
+        assert work_queue.drained()
+
+
+def test_resume_leaves_pending_and_leased_rows_alone(queue_path):
+    with WorkQueue(queue_path) as work_queue:
+        work_queue.enqueue([(2, "a.com"), (3, "b.com")])
+        work_queue.lease("worker-1", 1)
+        assert work_queue.enqueue([(2, "a.com"), (3, "b.com")]) == 0
+        assert work_queue.counts() == {"leased": 1, "pending": 1}
+
+
+def test_shard_path_names_a_file_per_worker():
+    assert shard_path("trace.jsonl", "host-1") == "trace.host-1.jsonl"
+    assert shard_path(None, "host-1") is None
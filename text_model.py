@@ -0,0 +1,280 @@
+import argparse
+import array
+import csv
+import json
+import math
+import random
+import sys
+import time
+import zlib
+
+from keyword_matcher import tokenize
+
+# Category codes the model predicts, in weight-matrix order
+CLASSES = ["9", "8", "7", "6", "-"]
+
+# Size of the hashed feature space; collisions are rare at a few thousand pages
+DEFAULT_FEATURE_BITS = 18
+
+MODEL_FORMAT = "hashed-ngram-logreg/1"
+
+
+# Function to hash word unigrams and bigrams of the text into feature indices
+def hashed_features(text, n_features):
+    tokens = tokenize(text or "")
+    grams = set(tokens)
+    grams.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return {zlib.crc32(gram.encode("utf-8")) % n_features for gram in grams}
+
+
+# Multinomial logistic regression over hashed word n-grams. Each class has its
+# own flat float array of weights, so the model file loads with one read per
+# class and scoring is a C-level sum over the features present in the text.
+class HashedTextClassifier:
+    def __init__(
+        self,
+        feature_bits=DEFAULT_FEATURE_BITS,
+        classes=CLASSES,
+        weights=None,
+        bias=None,
+    ):
+        self.feature_bits = feature_bits
+        self.n_features = 1 << feature_bits
+        self.classes = list(classes)
+        self.n_classes = len(self.classes)
+        self.weights = weights or [
+            array.array("f", bytes(4 * self.n_features)) for _ in self.classes
+        ]
+        self.bias = bias or [0.0] * self.n_classes
+
+    def _scores(self, features):
+        # Features are binary and scaled so long and short texts score alike
+        scale = 1.0 / math.sqrt(len(features) or 1)
+        return [
+            b + scale * sum(map(w.__getitem__, features))
+            for w, b in zip(self.weights, self.bias)
+        ]
+
+    @staticmethod
+    def _softmax(scores):
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    # Return the most likely category code and its probability
+    def predict(self, text):
+        features = hashed_features(text, self.n_features)
+        probabilities = self._softmax(self._scores(features))
+        best = max(range(self.n_classes), key=probabilities.__getitem__)
+        return self.classes[best], probabilities[best]
+
+    # Fit with plain SGD on the cross-entropy loss and light L2 regularisation
+    def train(self, examples, epochs=8, learning_rate=0.5, l2=1e-6, seed=0):
+        rng = random.Random(seed)
+        class_index = {code: i for i, code in enumerate(self.classes)}
+        data = [
+            (list(hashed_features(text, self.n_features)), class_index[label])
+            for text, label in examples
+            if label in class_index
+        ]
+
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            rate = learning_rate / (1 + epoch)
+            loss = 0.0
+            for features, target in data:
+                probabilities = self._softmax(self._scores(features))
+                loss -= math.log(max(probabilities[target], 1e-12))
+                scale = 1.0 / math.sqrt(len(features) or 1)
+                for c, probability in enumerate(probabilities):
+                    gradient = probability - (1.0 if c == target else 0.0)
+                    self.bias[c] -= rate * gradient
+                    step = rate * gradient * scale
+                    decay = 1.0 - rate * l2
+                    w = self.weights[c]
+                    for index in features:
+                        w[index] = w[index] * decay - step
+            mean_loss = loss / max(len(data), 1)
+            print(f"Epoch {epoch + 1}/{epochs}: mean loss {mean_loss:.4f}")
+        return self
+
+    def save(self, path):
+        header = {
+            "format": MODEL_FORMAT,
+            "feature_bits": self.feature_bits,
+            "classes": self.classes,
+            "bias": self.bias,
+        }
+        with open(path, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for w in self.weights:
+                w.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            if header.get("format") != MODEL_FORMAT:
+                raise ValueError(f"{path} is not a {MODEL_FORMAT} model file")
+            n_features = 1 << header["feature_bits"]
+            weights = []
+            for _ in header["classes"]:
+                w = array.array("f")
+                try:
+                    w.fromfile(f, n_features)
+                except EOFError:
+                    raise ValueError(f"{path} is truncated")
+                weights.append(w)
+
+        return cls(
+            header["feature_bits"],
+            header["classes"],
+            weights=weights,
+            bias=header["bias"],
+        )
+
+
+# Appends (url, metadata, category code) for every successfully classified
+# page, building the training set for the local model as runs go by
+class ExampleLog:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def record(self, url, metadata, category_code, source):
+        entry = {
+            "url": url,
+            "metadata": metadata,
+            "label": category_code,
+            "source": source,
+        }
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+# Function to read training examples, optionally relabelled from a sheet export.
+# Product codes in the sheet are the reviewed labels, so they win over the
+# codes the pipeline produced at the time.
+def load_examples(data_path, labels_path=None):
+    sheet_labels = {}
+    if labels_path:
+        with open(labels_path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                url = (record.get("URL") or "").strip()
+                product = str(record.get("Product") or "").strip()
+                if url and product in CLASSES:
+                    sheet_labels[url] = product
+
+    examples = {}
+    with open(data_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            label = sheet_labels.get(entry.get("url"), entry.get("label"))
+            if entry.get("metadata") and label in CLASSES:
+                # The latest metadata seen for a URL is the one kept
+                key = entry.get("url") or entry["metadata"]
+                examples[key] = (entry["metadata"], label)
+    return list(examples.values())
+
+
+# Function to split examples into train and held-out sets reproducibly
+def split_examples(examples, holdout, seed):
+    examples = list(examples)
+    random.Random(seed).shuffle(examples)
+    cut = int(len(examples) * (1 - holdout))
+    return examples[:cut], examples[cut:]
+
+
+# Function to report accuracy, coverage at the threshold and throughput
+def evaluate(model, examples, threshold):
+    if not examples:
+        print("No examples to evaluate.")
+        return
+
+    start = time.perf_counter()
+    predictions = [model.predict(text) for text, _ in examples]
+    elapsed = time.perf_counter() - start
+
+    correct = sum(
+        1 for (code, _), (_, label) in zip(predictions, examples) if code == label
+    )
+    confident = [
+        (code, label)
+        for (code, confidence), (_, label) in zip(predictions, examples)
+        if confidence >= threshold
+    ]
+    confident_correct = sum(1 for code, label in confident if code == label)
+
+    print(f"Examples evaluated: {len(examples)}")
+    print(f"Accuracy: {correct / len(examples):.1%}")
+    print(
+        f"Confident (>= {threshold:.2f}): {len(confident) / len(examples):.1%} of pages, "
+        f"accuracy {confident_correct / max(len(confident), 1):.1%}"
+    )
+    for code in model.classes:
+        predicted = sum(1 for p, _ in zip(predictions, examples) if p[0] == code)
+        actual = sum(1 for _, label in examples if label == code)
+        hits = sum(
+            1 for (p, _), (_, label) in zip(predictions, examples) if p == code == label
+        )
+        print(
+            f"  {code}: precision {hits / max(predicted, 1):.1%}, "
+            f"recall {hits / max(actual, 1):.1%} ({actual} examples)"
+        )
+    print(f"Throughput: {len(examples) / elapsed:,.0f} metadata strings/sec")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Train or evaluate the local product category model."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("train", "evaluate"):
+        sub = subparsers.add_parser(name)
+        sub.add_argument("--data", required=True, help="JSONL written by --save-examples")
+        sub.add_argument("--labels", help="CSV export of the sheet with URL and Product")
+        sub.add_argument("--model", default="text_model.bin", help="Model file")
+        sub.add_argument("--holdout", type=float, default=0.2)
+        sub.add_argument("--threshold", type=float, default=0.8)
+        sub.add_argument("--seed", type=int, default=0)
+    subparsers.choices["train"].add_argument("--epochs", type=int, default=8)
+    subparsers.choices["train"].add_argument(
+        "--feature-bits", type=int, default=DEFAULT_FEATURE_BITS
+    )
+    args = parser.parse_args(argv)
+
+    examples = load_examples(args.data, args.labels)
+    print(f"Loaded {len(examples)} labeled examples.")
+    train_set, holdout_set = split_examples(examples, args.holdout, args.seed)
+
+    if args.command == "train":
+        if not train_set:
+            sys.exit("No training examples found.")
+        model = HashedTextClassifier(args.feature_bits)
+        model.train(train_set, epochs=args.epochs, seed=args.seed)
+        model.save(args.model)
+        print(f"Saved model to {args.model}")
+    else:
+        start = time.perf_counter()
+        model = HashedTextClassifier.load(args.model)
+        print(f"Loaded model in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    evaluate(model, holdout_set, args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import bisect
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import time
+
+# Trace of the URL the current worker task is processing. Each worker is its
+# own asyncio task, so code deep inside a classification can add timings
+# without the trace being passed through every call.
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Upper bounds of the Prometheus histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Quantiles exported for every stage
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+
+# Most recent samples per stage that quantiles are computed from; a run of
+# fewer URLs gets exact quantiles
+LATENCY_WINDOW = 10000
+
+
+# Timings and outcome of one URL, written as one JSON line when it finishes
+class UrlTrace:
+    def __init__(self, row, url):
+        self.started = time.perf_counter()
+        self.record = {
+            "row": row,
+            "url": url,
+            "started_at": time.time(),
+            "stages_ms": {},
+        }
+
+    # Add the duration of a stage, in seconds; repeated stages accumulate
+    def add_stage(self, name, seconds):
+        stages = self.record["stages_ms"]
+        stages[name] = round(stages.get(name, 0.0) + seconds * 1000, 3)
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+    # Add to numeric fields such as token counts
+    def add(self, **amounts):
+        for name, amount in amounts.items():
+            self.record[name] = self.record.get(name, 0) + amount
+
+    def finish(self):
+        self.add_stage("total", time.perf_counter() - self.started)
+        return self.record
+
+
+# Time a block as a stage of the current URL's trace; a no-op outside a trace
+@contextlib.contextmanager
+def trace_stage(name):
+    trace = current_trace.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if trace is not None:
+            trace.add_stage(name, time.perf_counter() - start)
+
+
+# Add a stage measured elsewhere (e.g. by the browser) to the current trace
+def trace_add_stage(name, seconds):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_stage(name, seconds)
+
+
+# Set fields on the current URL's trace, if any
+def trace_set(**fields):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.set(**fields)
+
+
+# Add to numeric fields on the current URL's trace, if any
+def trace_add(**amounts):
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(**amounts)
+
+
+# Latencies of one stage in fixed-size memory: bucket counts, count and sum
+# cover every sample, quantiles the last `window` samples. A long-running
+# service therefore neither grows nor slows down as requests accumulate.
+class LatencyHistogram:
+    def __init__(self, window=LATENCY_WINDOW):
+        # Samples per bucket; the last slot holds those above every bound
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def quantile(self, q):
+        if not self.recent:
+            return 0.0
+        samples = sorted(self.recent)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    # Cumulative (upper bound, count) pairs, as Prometheus buckets are
+    def bucket_counts(self):
+        counts = []
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            cumulative += count
+            counts.append((bound, cumulative))
+        return counts
+
+
+# Collects URL traces for a run: writes each one as a JSON line, keeps
+# per-stage latency histograms and exports them with the run counters in the
+# Prometheus text format
+class Tracer:
+    def __init__(self, trace_path=None, metrics_path=None):
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self.histograms = {}
+        self._file = None
+        if trace_path:
+            self._file = open(trace_path, "a", encoding="utf-8", buffering=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Start tracing a URL in the current task
+    def start(self, row, url):
+        trace = UrlTrace(row, url)
+        current_trace.set(trace)
+        return trace
+
+    # Record a finished URL: its stage latencies and its JSON line
+    def finish(self, trace):
+        record = trace.finish()
+        for stage, milliseconds in record["stages_ms"].items():
+            self.histograms.setdefault(stage, LatencyHistogram()).observe(
+                milliseconds / 1000
+            )
+        if self._file is not None:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    # Render the stage latencies and run counters as Prometheus text
+    def prometheus_text(self, stats=None):
+        lines = [
+            "# HELP classifier_stage_duration_seconds Time spent per URL in each stage.",
+            "# TYPE classifier_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            for bound, count in histogram.bucket_counts():
+                lines.append(
+                    f'classifier_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}'
+                )
+            count = histogram.count
+            lines.append(
+                f'classifier_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}'
+            )
+            lines.append(
+                f'classifier_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}'
+            )
+            lines.append(f'classifier_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+        lines += [
+            "# HELP classifier_stage_latency_seconds Per-stage latency quantiles.",
+            "# TYPE classifier_stage_latency_seconds summary",
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            for q in LATENCY_QUANTILES:
+                lines.append(
+                    f'classifier_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} '
+                    f"{histogram.quantile(q):.6f}"
+                )
+            lines.append(
+                f'classifier_stage_latency_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}'
+            )
+            lines.append(
+                f'classifier_stage_latency_seconds_count{{stage="{stage}"}} {histogram.count}'
+            )
+
+        if stats is not None:
+            for name, value in sorted(stats.counts.items()):
+                metric = f"classifier_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+            for name, value in sorted(stats.gauges.items()):
+                metric = f"classifier_{name}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Write the Prometheus text file atomically so scrapers never see half of it
+    def write_metrics(self, stats=None):
+        if not self.metrics_path:
+            return
+        tmp_path = f"{self.metrics_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(stats))
+        os.replace(tmp_path, self.metrics_path)
+
+    # Text lines with p50/p95/p99 per stage for the end-of-run summary
+    def summary_lines(self):
+        return [
+            f"{stage}: p50 {h.quantile(0.5) * 1000:.0f} ms, "
+            f"p95 {h.quantile(0.95) * 1000:.0f} ms, "
+            f"p99 {h.quantile(0.99) * 1000:.0f} ms ({h.count} URLs)"
+            for stage, h in sorted(self.histograms.items())
+        ]
+
+    def close(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
@@ -0,0 +1,170 @@
+import ipaddress
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+# How far URLs are reduced before rows are grouped: the full canonical URL,
+# the host ("site"), the registrable domain, or no grouping at all
+DEDUPE_LEVELS = ("off", "url", "site", "domain")
+DEFAULT_DEDUPE_LEVEL = "site"
+
+# Query parameters that only track the visit and never change the page
+TRACKING_PARAMS = {
+    "gclid", "gbraid", "wbraid", "dclid", "fbclid", "msclkid", "yclid",
+    "igshid", "mc_cid", "mc_eid", "_ga", "_gl", "ref", "ref_src", "srsltid",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+
+# "www", "www2", "ww3" and similar host prefixes
+WWW_PREFIX_RE = re.compile(r"^w{2,3}\d*\.")
+
+# Public suffixes of more than one label that are common in our markets. A
+# host under one of these keeps three labels as its registrable domain.
+MULTI_LABEL_SUFFIXES = {
+    "co.uk", "org.uk", "me.uk", "ltd.uk", "plc.uk",
+    "com.au", "net.au", "org.au",
+    "co.nz", "net.nz", "org.nz",
+    "co.jp", "ne.jp", "or.jp",
+    "co.kr", "or.kr",
+    "com.br", "net.br",
+    "com.mx", "com.ar", "com.co", "com.pe", "com.tr", "com.cn", "com.hk",
+    "com.tw", "com.sg", "com.my", "com.ph", "com.vn", "com.ua", "com.pl",
+    "co.za", "co.in", "co.id", "co.il", "co.th",
+    "gv.at", "co.at", "or.at",
+}
+
+
+# Function to normalise a host: lowercase, no trailing dot, IDNs in punycode
+# and no www prefix
+def canonical_host(host):
+    host = host.strip().rstrip(".").lower()
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        # Labels the IDNA codec rejects (too long, empty) are kept as they are
+        pass
+    return WWW_PREFIX_RE.sub("", host)
+
+
+# Function to reduce a host to the domain a registrar sells, e.g.
+# shop.example.co.uk -> example.co.uk. IP addresses are returned unchanged.
+def registrable_domain(host):
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+        return host
+    except ValueError:
+        pass
+    labels = host.split(".")
+    if len(labels) > 2 and ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+# Function to build the key rows are grouped by. The scheme, www prefix,
+# default port, trailing slash, fragment and tracking parameters never count;
+# "site" also ignores the path and query, "domain" the subdomains.
+# Returns None for a URL without a host.
+def canonical_url(url, level="url"):
+    url = url.strip()
+    if url.startswith("//"):
+        url = "https:" + url
+    elif "://" not in url:
+        url = "https://" + url
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    host = canonical_host(parts.hostname or "")
+    if not host:
+        return None
+    if level == "domain":
+        return registrable_domain(host)
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    if level == "site":
+        return host
+
+    key = host + parts.path.rstrip("/")
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not is_tracking_param(name)
+    )
+    if query:
+        key += "?" + urlencode(query)
+    return key
+
+
+# Rows of one canonical site: the row classified for all of them, its result
+# once known, and the rows waiting for that result. A held group's leader is
+# dead-lettered or waiting for its retry to come due, so its followers wait too.
+class SiteGroup:
+    def __init__(self, leader, held=False):
+        self.leader = leader
+        self.result = None
+        self.followers = []
+        self.held = held
+        # Followers that were last given a failed result
+        self.failed_followers = 0
+
+
+# Rows of a run grouped by canonical key, so each site is fetched and
+# classified once and the result is fanned out to every row sharing the key.
+# Keys are kept for the whole run; follower rows only until their site has
+# been classified successfully, since a failed site may still be retried.
+class SiteGroups:
+    def __init__(self, level=DEFAULT_DEDUPE_LEVEL):
+        self.level = level
+        self._groups = {}
+
+    # Add a row to its site's group. Returns None if the row leads the group
+    # and must be classified; otherwise the group, whose result is None while
+    # the leader is still being classified.
+    def join(self, row, url):
+        key = canonical_url(url, self.level)
+        if key is None:
+            return None
+        group = self._groups.get(key)
+        if group is None:
+            self._groups[key] = SiteGroup(row)
+            return None
+        if group.leader == row:
+            # The leader is classified again, e.g. in a retry pass
+            group.result = None
+            group.held = False
+            return None
+        if group.result is None or group.result[1] != 1:
+            group.followers.append((row, url))
+        return group
+
+    # Register a row that is not classified in this pass, such as a
+    # dead-lettered row or a retry that is not due yet. If it is the first row
+    # of its site, the site's other rows wait for it instead of electing a new
+    # leader that would bypass the retry schedule.
+    def hold(self, row, url):
+        key = canonical_url(url, self.level)
+        if key is not None and key not in self._groups:
+            self._groups[key] = SiteGroup(row, held=True)
+
+    # Record the leader's result. Returns the (row, url) followers to write it
+    # to, and how many of them were given a failed result before, which this
+    # result supersedes.
+    def finish(self, row, url, product_code, status):
+        key = canonical_url(url, self.level)
+        group = self._groups.get(key)
+        if group is None or group.leader != row:
+            return [], 0
+        group.result = (product_code, status)
+        followers = list(group.followers)
+        superseded = group.failed_followers
+        if status == 1:
+            group.followers.clear()
+            group.failed_followers = 0
+        else:
+            group.failed_followers = len(followers)
+        return followers, superseded
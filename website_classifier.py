@@ -1,43 +1,142 @@
 import time
 import os
 import asyncio
-import openai as OpenApi
-import gspread
+import argparse
+import collections
+import contextlib
+import csv
+import functools
+import importlib
+import itertools
+import json
+import logging
+import multiprocessing
+import sqlite3
+import sys
+from urllib.parse import urlparse
 import ssl
-from dotenv import load_dotenv
-from google.oauth2 import service_account
-from playwright_stealth import stealth_async
-from playwright.async_api import (
-    async_playwright,
-    TimeoutError as PlaywrightTimeoutError,
+from browser_pool import BROWSER_ENGINES, BrowserPool
+from io_backends import file_sink, iterate_rows, open_source
+from checkpoint import Checkpoint
+from interception import (
+    DEFAULT_BLOCKED_RESOURCE_TYPES,
+    DEFAULT_BLOCKLIST_FILE,
+    InterceptionPolicy,
+    load_blocklist,
 )
+from keyword_matcher import DEFAULT_KEYWORDS_FILE, load_matchers
+from language import DEFAULT_CONFIDENCE_THRESHOLD, resolve_language
+from page_readiness import (
+    DEFAULT_MIN_HEADINGS,
+    DEFAULT_PAGE_BUDGET,
+    EXTRACTION_RESERVE,
+    PageBudget,
+    navigate_within_budget,
+    wait_until_ready,
+)
+from memory_governor import (
+    DEFAULT_MAX_BROWSER_RSS_MB,
+    DEFAULT_MAX_DOM_NODES,
+    DEFAULT_MAX_JS_HEAP_MB,
+    DEFAULT_PAGES_PER_BROWSER,
+    MemorySupervisor,
+    PageLimits,
+    own_peak_rss_bytes,
+)
+from preflight import (
+    DEFAULT_BREAKER_COOLDOWN,
+    DEFAULT_BREAKER_THRESHOLD,
+    DEFAULT_PROBE_TIMEOUT,
+    CircuitBreaker,
+    Preflight,
+    url_endpoint,
+)
+from retry_scheduler import (
+    DEFAULT_RETRY_WAIT,
+    UNSCHEDULED_FAILURES,
+    DueRetrySource,
+    RetrySchedule,
+    classify_error,
+    current_failure,
+    note_failure,
+)
+from site_store import DEFAULT_MAX_AGE_DAYS, SiteStore, current_visit
+from snapshot_archive import SnapshotArchive, capture_fields, current_capture, wants_html
+from text_model import ExampleLog, HashedTextClassifier
+from url_canonical import DEDUPE_LEVELS, DEFAULT_DEDUPE_LEVEL, SiteGroups
+from tracing import (
+    Tracer,
+    current_trace,
+    trace_add,
+    trace_add_stage,
+    trace_set,
+    trace_stage,
+)
+from work_queue import (
+    DEFAULT_LEASE_SECONDS,
+    QueueSink,
+    QueueSource,
+    WorkQueue,
+    merge_results,
+    remove_queue,
+    renew_leases,
+    shard_path,
+    worker_id,
+)
+from classifier_service import (
+    DEFAULT_MAX_PENDING,
+    DEFAULT_REQUEST_TIMEOUT,
+    DEFAULT_SERVICE_PORT,
+    SERVICE_LLM_BATCH_SIZE,
+    SERVICE_LLM_BATCH_WAIT,
+    ClassifierService,
+)
+from http_fetcher import NOT_MODIFIED, HttpFetcher
+from llm_client import DEFAULT_MODEL, LLMClient, MicroBatcher
+from llm_cache import LLMCache, cache_key
+
+logger = logging.getLogger(__name__)
+
+# Environment variables each backend needs; they are only checked for the
+# backends a command actually uses
+OPENAI_VARIABLES = ("OPENAI_API_KEY",)
+GOOGLE_SHEET_VARIABLES = ("GOOGLE_APPLICATION_CREDENTIALS", "GOOGLE_SHEET_ID")
+
 
-# Load environment variables from the .env file
-load_dotenv()
+# Counters for summary tracking, shared by every worker of a run.
+# Workers run on one event loop and never await between reading and
+# writing a counter, so increments stay correct under concurrency.
+class RunStats:
+    def __init__(self):
+        self.counts = collections.Counter()
+        # Highest values seen, such as peak memory, and current values such as
+        # the rows failed so far; exported as gauges
+        self.gauges = {}
+        # Record the start time of the run
+        self.start_time = time.time()
 
-# Read environment variables
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
-GOOGLE_APPLICATION_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+    def increment(self, name, amount=1):
+        self.counts[name] += amount
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY is not set in .env")
+    def record_peak(self, name, value):
+        self.gauges[name] = max(self.gauges.get(name, 0), value)
 
-OpenApi.api_key = OPENAI_API_KEY
+    # Counters are exported as Prometheus counters and must never go down;
+    # a figure that can is kept as a gauge instead
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
 
-# Initialize counters for summary tracking
-tokens_used = 0
-input_tokens = 0
-output_tokens = 0
-timeout_errors = 0
-ssl_errors = 0
-other_errors = 0
-metadata_extract_errors = 0
-gpt_errors = 0
-status = 0
+    def __getitem__(self, name):
+        return self.counts[name]
 
-# Record the start time of the script
-start_time = time.time()
+
+# Function to load the .env file into the environment. Called by the
+# command line rather than on import, so importing the module has no side
+# effects.
+def load_environment():
+    from dotenv import load_dotenv
+
+    load_dotenv()
 
 
 # Function to authenticate and connect to Google Sheets
@@ -47,6 +146,10 @@ def authenticate_google_sheets(credentials_file, spreadsheet_id):
     if not spreadsheet_id:
         raise ValueError("GOOGLE_SHEET_ID is not set in .env")
 
+    # Imported here so runs on files never load gspread or google-auth
+    import gspread
+    from google.oauth2 import service_account
+
     scope = [
         "https://spreadsheets.google.com/feeds",
         "https://www.googleapis.com/auth/spreadsheets",
@@ -59,35 +162,11 @@ def authenticate_google_sheets(credentials_file, spreadsheet_id):
     )
     client = gspread.authorize(creds)
 
-    print("Authentication successful!")
+    logger.info("Authentication successful!")
     spreadsheet = client.open_by_key(spreadsheet_id)
     return spreadsheet
 
 
-# Function to get the count of valid URLs from the sheet
-def get_url_count(sheet):
-    # Fetch all records and count how many rows contain a valid URL
-    records = sheet.get_all_records(
-        expected_headers=[
-            "Duplicate",
-            "URL",
-            "Product",
-            "Status",
-            "Email",
-            "Name",
-            "Competitor",
-            "Response",
-            "Comments",
-        ]
-    )
-    valid_url_count = 0
-    for record in records:
-        url = record.get("URL")
-        if url:  # Check if URL is not empty
-            valid_url_count += 1
-    return valid_url_count
-
-
 # Function to handle pop-ups using Playwright
 async def handle_popups(page):
     try:
@@ -95,11 +174,11 @@ async def handle_popups(page):
         accept_button = await page.query_selector('button:has-text("Accept")')
         if accept_button:
             await accept_button.click()
-            print("Cookie consent accepted.")
+            logger.info("Cookie consent accepted.")
         else:
-            print("No cookie consent pop-up found.")
+            logger.debug("No cookie consent pop-up found.")
     except Exception as e:
-        print("Error while handling cookie consent pop-up:", e)
+        logger.warning(f"Error while handling cookie consent pop-up: {e}")
 
     try:
         # Try to find and click the "Close" button for modals
@@ -108,11 +187,11 @@ async def handle_popups(page):
         )
         if close_button:
             await close_button.click()
-            print("Modal closed.")
+            logger.info("Modal closed.")
         else:
-            print("No modal found.")
+            logger.debug("No modal found.")
     except Exception as e:
-        print("Error while handling modal:", e)
+        logger.warning(f"Error while handling modal: {e}")
 
     try:
         # Detect and handle sign-up/login pop-ups
@@ -125,13 +204,13 @@ async def handle_popups(page):
             )
             if close_button:
                 await close_button.click()
-                print("Sign-up/Login pop-up closed.")
+                logger.info("Sign-up/Login pop-up closed.")
             else:
                 await page.keyboard.press("Escape")
-                print("Pressed Escape to close the pop-up.")
+                logger.info("Pressed Escape to close the pop-up.")
 
     except Exception as e:
-        print("Error while handling sign-up/login pop-up:", e)
+        logger.warning(f"Error while handling sign-up/login pop-up: {e}")
 
     try:
         # Handle country or language selection pop-up
@@ -141,7 +220,7 @@ async def handle_popups(page):
         )
 
         if language_popup:
-            print("Language/Country selection pop-up detected.")
+            logger.info("Language/Country selection pop-up detected.")
 
             # Look for dropdown or button options for English and United Kingdom
             english_option = await page.query_selector(
@@ -154,12 +233,12 @@ async def handle_popups(page):
             # Select English
             if english_option:
                 await english_option.click()
-                print("Selected English.")
+                logger.info("Selected English.")
 
             # Select United Kingdom
             if uk_option:
                 await uk_option.click()
-                print("Selected United Kingdom.")
+                logger.info("Selected United Kingdom.")
 
             # Look for a "Continue" or "Confirm" button
             confirm_button = await page.query_selector(
@@ -167,328 +246,471 @@ async def handle_popups(page):
             )
             if confirm_button:
                 await confirm_button.click()
-                print("Confirmed language/country selection.")
+                logger.info("Confirmed language/country selection.")
 
     except Exception as e:
-        print("Error while handling language/country selection pop-up:", e)
-
-
-# Function to handle retries while loading the URL
-async def navigate_with_retry(page, url, retries=3, delay=5):
-    attempt = 0
-    while attempt < retries:
-        try:
-            print(f"Attempting to navigate to {url} (Attempt {attempt + 1}/{retries})")
-            await page.goto(url, timeout=60000)  # Set a longer timeout for loading
-            return True  # Successfully navigated
-        except PlaywrightTimeoutError:
-            print(f"Timeout error occurred while trying to load {url}. Retrying...")
-        except Exception as e:
-            print(f"Error while trying to load {url}: {e}. Retrying...")
-
-        # Increment attempt counter and wait before retrying
-        attempt += 1
-        await asyncio.sleep(delay)
-
-    # If all retries failed, return False
-    print(f"Failed to navigate to {url} after {retries} attempts.")
-    return False
-
-
-# Retry logic for updating Google Sheets
-def update_cell_with_retry(sheet, row, col, value, retries=3, delay=3):
-    attempt = 0
-    while attempt < retries:
-        try:
-            sheet.update_cell(row, col, value)
-            print(f"Successfully updated row {row}, column {col} with value {value}.")
-            return True
-        except gspread.exceptions.GSpreadException as e:
-            attempt += 1
-            print(
-                f"Error updating row {row}, column {col}: {e}. Attempt {attempt}/{retries}"
-            )
-            if attempt < retries:
-                time.sleep(delay)
-            else:
-                print(f"Failed to update after {retries} attempts.")
-                return False
+        logger.warning(f"Error while handling language/country selection pop-up: {e}")
 
 
 # Function to categorize website based on metadata
-async def product_categorisation(metadata):
-    # Define category keywords for classification
-    clothing_keywords = [
-        "clothing",
-        "clothes",
-        "clothings",
-        "apparel",
-        "appaerls",
-        "dress",
-        "dresses",
-        "tops",
-        "top",
-        "pants",
-        "pant",
-        "trousers",
-        "trouser",
-        "jeans",
-        "jean",
-        "shorts",
-        "short",
-        "skirts",
-        "skirt",
-        "shirts",
-        "shirt",
-        "jackets",
-        "jacket",
-        "blouse",
-        "blouses",
-        "coats",
-        "coat",
-        "suits",
-        "suit",
-    ]
-    shoes_keywords = [
-        "shoes",
-        "shoe",
-        "footwears",
-        "footwear",
-        "boots",
-        "boot",
-        "trainers",
-        "trainer",
-        "sneakers",
-        "sneaker",
-        "sandals",
-        "sandal",
-        "heels",
-        "flats",
-    ]
-    lingerie_keywords = [
-        "bras",
-        "bra",
-        "lingerie",
-        "lingeries",
-        "lingerie sets",
-        "lingerie set",
-        "underwear",
-        "underwears",
-        "undergarments",
-        "undergarment",
-        "boxers",
-        "boxer",
-        "briefs",
-        "brief",
-        "panties",
-        "panty",
-    ]
+def product_categorisation(metadata, matcher):
+    # Count keyword hits per category in a single pass over the metadata
+    return category_from_hits(matcher.match(metadata))
 
-    # Convert metadata to lowercase for easier matching
-    metadata_lower = metadata.lower()
 
+# Function to turn per-category keyword hit counts into a category code
+def category_from_hits(hits):
     # Check if metadata matches any clothing keywords
-    if any(keyword in metadata_lower for keyword in clothing_keywords):
-        if any(keyword in metadata_lower for keyword in shoes_keywords):
+    if hits["clothing"]:
+        if hits["shoes"]:
             return "9"  # Clothing + Shoes category
         else:
             return "8"  # Clothing category
 
     # Check if metadata matches any shoes keywords
-    if any(keyword in metadata_lower for keyword in shoes_keywords):
+    if hits["shoes"]:
         return "7"  # Shoes category
 
     # Check if metadata matches any lingerie keywords
-    if any(keyword in metadata_lower for keyword in lingerie_keywords):
+    if hits["lingerie"]:
         return "6"  # Lingerie category
 
     # If no match found, return '-'
     return "-"
 
 
-async def metadata_extract(page):
-    global metadata_extract_errors
-
-    try:
-        # Wait for the page to load completely
-        await page.wait_for_load_state("networkidle")
+# Caps that keep the extraction payload small on very large pages
+MAX_HEADINGS = 200
+MAX_CATEGORY_LINKS = 100
+MAX_TEXT_LENGTH = 200
+
+# In-page script that collects every metadata field in a single round-trip
+METADATA_EXTRACT_SCRIPT = """
+({ maxHeadings, maxLinks, maxTextLength }) => {
+    const content = (selector) => {
+        const element = document.querySelector(selector);
+        return element ? element.getAttribute("content") : null;
+    };
+    const texts = (selector, limit) => {
+        const result = [];
+        for (const element of document.querySelectorAll(selector)) {
+            if (result.length >= limit) break;
+            const text = (element.innerText || element.textContent || "").trim();
+            if (text) result.push(text.slice(0, maxTextLength));
+        }
+        return result;
+    };
+    const title = document.querySelector("title");
+    const [navigation] = performance.getEntriesByType("navigation");
+    return {
+        og_title: content('meta[property="og:title"]'),
+        title: title ? title.textContent.trim() : "Untitled Page",
+        og_description: content('meta[property="og:description"]'),
+        og_keywords: content('meta[property="og:keywords"]'),
+        meta_description: content('meta[name="description"]'),
+        meta_keywords: content('meta[name="keywords"]'),
+        lang: document.documentElement.getAttribute("lang"),
+        headings: texts("h1, h2, h3, h4, h5, h6", maxHeadings),
+        category_links: texts(
+            'a[href*="clothing"], a[href*="shoes"], a[href*="lingerie"]',
+            maxLinks
+        ),
+        navigation_timing: navigation ? {
+            dns: navigation.domainLookupEnd - navigation.domainLookupStart,
+            connect: navigation.connectEnd - navigation.connectStart,
+            ttfb: navigation.responseStart - navigation.requestStart,
+        } : null,
+    };
+}
+"""
+
+
+# Function to combine extracted fields into the language tag and metadata text
+def build_metadata(fields):
+    metadata_parts = [
+        fields.get("og_title") or "",
+        fields.get("og_description") or "",
+        fields.get("og_keywords") or "",
+        fields.get("meta_description") or "",
+        fields.get("meta_keywords") or "",
+        fields.get("title") or "",
+    ]
+    metadata = " ".join(metadata_parts).strip()
 
-        og_title, page_title, og_description, og_keywords = None, None, None, None
-        meta_description, meta_keywords = None, None
+    header_texts = fields.get("headings") or []
+    if not header_texts:
+        logger.debug("No headers found on the page.")
+    category_texts = fields.get("category_links") or []
 
-        # Try to extract og:title
-        try:
-            og_title = await page.get_attribute('meta[property="og:title"]', "content")
-        except Exception:
-            pass
+    # Get the lang attribute from the <html> tag; None when the page omits it
+    lang = fields.get("lang") or None
 
-        # Try to extract title
-        try:
-            page_title = (
-                await page.inner_text("title")
-                if await page.query_selector("title")
-                else "Untitled Page"
-            )
-        except Exception:
-            pass
+    # Combine all extracted metadata into a single string
+    metadata += " " + " ".join(header_texts) + " " + " ".join(category_texts)
 
-        # Try to extract og:description
-        try:
-            og_description = await page.get_attribute(
-                'meta[property="og:description"]', "content"
-            )
-        except Exception:
-            pass
-
-        # Try to extract og:keywords
-        try:
-            og_keywords = await page.get_attribute(
-                'meta[property="og:keywords"]', "content"
-            )
-        except Exception:
-            pass
+    # Include the lang tag in the metadata
+    if lang:
+        metadata += f" Language: {lang}"
 
-        # Try to extract meta[name="description"]
-        try:
-            meta_description = await page.get_attribute(
-                'meta[name="description"]', "content"
-            )
-        except Exception:
-            pass
+    # Limit to first 500 words
+    metadata = " ".join(metadata.split()[:500])
 
-        # Try to extract meta[name="keywords"]
-        try:
-            meta_keywords = await page.get_attribute(
-                'meta[name="keywords"]', "content"
-            )
-        except Exception:
-            pass
-
-        metadata_parts = [
-            og_title or "",
-            og_description or "",
-            og_keywords or "",
-            meta_description or "",
-            meta_keywords or "",
-            page_title or "",
-        ]
-        metadata = " ".join(metadata_parts).strip()
+    return lang, metadata
 
-        # Extract headers (h1, h2, h3, h4, h5, h6) and any other relevant content
-        headers = await page.query_selector_all("h1, h2, h3, h4, h5, h6")
-        header_texts = [await header.inner_text() for header in headers]
 
-        if not header_texts:
-            print("No headers found on the page.")
+# Function to extract metadata once the page is ready or its readiness stage
+# has run out; whatever has rendered by then is used
+async def metadata_extract(page, stats, budget):
 
-        # Get other metadata like titles, categories, and classes
-        category_links = await page.query_selector_all(
-            'a[href*="clothing"], a[href*="shoes"], a[href*="lingerie"]'
+    try:
+        # Collect meta tags, title, lang, headings and category links in one call
+        fields = await asyncio.wait_for(
+            page.evaluate(
+                METADATA_EXTRACT_SCRIPT,
+                {
+                    "maxHeadings": MAX_HEADINGS,
+                    "maxLinks": MAX_CATEGORY_LINKS,
+                    "maxTextLength": MAX_TEXT_LENGTH,
+                },
+            ),
+            timeout=max(budget.remaining(), EXTRACTION_RESERVE),
         )
-        category_texts = [await link.inner_text() for link in category_links]
 
-        # Extract the lang attribute from the <html> tag
-        html_element = await page.query_selector("html")
-        lang = (
-            await html_element.get_attribute("lang") or "en"
-        )  # Get the lang attribute from <html> tag
+        # DNS, connect and time-to-first-byte as the browser measured them
+        for stage, milliseconds in (fields.get("navigation_timing") or {}).items():
+            trace_add_stage(stage, max(milliseconds, 0) / 1000)
 
-        # Combine all extracted metadata into a single string 
-        metadata += " " + " ".join(header_texts) + " " + " ".join(category_texts)
+        html = None
+        if wants_html():
+            try:
+                html = await page.content()
+            except Exception as e:
+                logger.warning(f"Could not read the page HTML for the archive: {e}")
+        capture_fields(fields, html)
+        return build_metadata(fields)
+    except Exception as e:
+        logger.error(f"Error extracting metadata: {e}")
+        stats.increment("metadata_extract_errors")
+        note_failure("extraction")
+        return None, None
 
-        # Include the lang tag in the metadata
-        metadata += f" Language: {lang}"
 
-        # Limit to first 500 words
-        metadata = " ".join(metadata.split()[:500])
+# Function to log and total the requests a browser page allowed and blocked
+def record_page_traffic(url, traffic, stats):
+    if traffic is None:
+        return
+    stats.increment("requests_allowed", traffic.allowed_requests)
+    stats.increment("requests_blocked", traffic.blocked_requests)
+    stats.increment("bytes_allowed", traffic.allowed_bytes)
+    for reason, count in traffic.blocked_by_reason.items():
+        stats.increment(f"blocked_{reason}", count)
+    trace_set(
+        requests_allowed=traffic.allowed_requests,
+        requests_blocked=traffic.blocked_requests,
+        bytes_allowed=traffic.allowed_bytes,
+    )
+    logger.debug(
+        f"Requests for {url}: {traffic.allowed_requests} allowed "
+        f"({traffic.allowed_bytes / 1024:.0f} KB), {traffic.blocked_requests} blocked "
+        f"{traffic.blocked_by_reason}"
+    )
 
-        return lang, metadata
-    except Exception as e:
-        print(f"Error extracting metadata: {e}")
-        metadata_extract_errors += 1
-        return None, None
 
+# Function to classify extracted metadata with keyword rules, the local model
+# or ChatGPT. `chatgpt` is chatgpt_categorisation with the run's client, cache
+# and batcher bound. Rule and ChatGPT answers are logged as training examples.
+async def categorise_metadata(
+    lang,
+    metadata,
+    stats,
+    matchers,
+    chatgpt,
+    text_model=None,
+    model_threshold=0.8,
+    example_log=None,
+    url=None,
+    confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD,
+):
+    if metadata is None:
+        # Metadata extraction failed and was already counted
+        return "-", 0
 
-# Function to handle the page language and classification process
-async def classify_page(url):
+    # A site whose metadata is unchanged since its last full classification
+    # keeps its category without the rules, model or ChatGPT
+    visit = current_visit.get()
+    if visit is not None:
+        stored_category = visit.match_fingerprint(metadata)
+        if stored_category is not None:
+            return reuse_stored_result(stored_category, "fingerprint", stats)
+
+    # Combine the declared <html lang> tag with language detection on the text
+    text = metadata.rsplit(" Language: ", 1)[0]
+    language, confidence = resolve_language(lang, text, confidence_threshold)
+    trace_set(language=language, language_confidence=round(confidence, 3))
+    logger.debug(
+        f"Detected language: {language} "
+        f"(declared: {lang}, confidence: {confidence:.2f})"
+    )
+
+    if language == "en":
+        logger.debug("Page is in English. Proceeding with rule-based categorization.")
+        category_code = product_categorisation(metadata, matchers["en"])
+        logger.info(f"Classified category code: {category_code}")
+        stats.increment("rule_classified_urls")
+        trace_set(classified_by="rules")
+        status = 1
+        if example_log is not None:
+            example_log.record(url, metadata, category_code, "rules")
+        return category_code, status
 
-    global timeout_errors, ssl_errors, other_errors
+    # Non-English pages are settled by that language's keyword rules when the
+    # language is known and the rules find something; unknown languages try
+    # the English rules
+    matcher = matchers.get(language if confidence >= confidence_threshold else "en")
+    if matcher is not None:
+        hits = matcher.match(metadata)
+        if hits:
+            category_code = category_from_hits(hits)
+            logger.info(
+                f"Page is in '{language}'. Classified with keyword rules: {category_code}"
+            )
+            stats.increment("rule_classified_urls")
+            stats.increment("rule_classified_non_english_urls")
+            trace_set(classified_by="rules")
+            if example_log is not None:
+                example_log.record(url, metadata, category_code, "rules")
+            return category_code, 1
+
+    # Next the local model; only low-confidence predictions go on to ChatGPT
+    if text_model is not None:
+        category_code, probability = text_model.predict(metadata)
+        if probability >= model_threshold:
+            logger.info(
+                f"Local model classified category code: {category_code} "
+                f"(confidence: {probability:.2f})"
+            )
+            stats.increment("model_classified_urls")
+            trace_set(classified_by="model", model_confidence=round(probability, 3))
+            return category_code, 1
+        stats.increment("model_escalations")
+
+    logger.debug("No confident local match, proceeding with ChatGPT categorization.")
+    trace_set(classified_by="chatgpt")
+    chatgpt_category_code, status = await chatgpt(metadata)
+    logger.info(f"ChatGPT classified category code: {chatgpt_category_code}")
+    if example_log is not None and status == 1:
+        example_log.record(url, metadata, chatgpt_category_code, "chatgpt")
+    return chatgpt_category_code, status
+
+
+# Function to handle the page language and classification process.
+# `categorise` is categorise_metadata with the run's classifiers bound.
+# Browser pages get `page_budget` seconds for navigation, readiness polling
+# and extraction together.
+async def classify_page(
+    url,
+    browser_pool,
+    stats,
+    categorise,
+    http_fetcher=None,
+    page_budget=DEFAULT_PAGE_BUDGET,
+    min_headings=DEFAULT_MIN_HEADINGS,
+):
 
     if not url:
-        print("Received empty URL", url)
+        logger.warning(f"Received empty URL: {url!r}")
         return "-", 0
 
     # Ensure URL starts with "http://" or "https://"
     if not url.startswith(("http://", "https://")):
         url = "https://" + url  # Assume "https://" if missing
 
-    try:
-        async with async_playwright() as p:
-            browser = await p.webkit.launch(headless=True)
-            page = await browser.new_page()
-            
-            # Block unnecessary resources to speed up loading
-            await page.route(
-                "**/*",
-                lambda route: route.abort()
-                if route.request.resource_type in ["image", "font", "media"]
-                else route.continue_(),
+    # Step 1: Try the plain HTTP tier first; most storefronts serve their
+    # metadata in the static HTML and never need a browser. A site stored by
+    # an earlier run is asked whether it changed since.
+    if http_fetcher is not None:
+        visit = current_visit.get()
+        with trace_stage("http_fetch"):
+            fields = await http_fetcher.fetch_fields(
+                url, **(visit.conditional_headers() if visit is not None else {})
             )
-
+        if fields == NOT_MODIFIED:
+            return reuse_stored_result(visit.not_modified(), "not_modified", stats)
+        if fields is not None:
+            if visit is not None:
+                visit.note_validators(fields)
+            capture_fields(fields)
+            stats.increment("http_tier_urls")
+            trace_set(tier="http")
+            lang, metadata = build_metadata(fields)
+            with trace_stage("classification"):
+                return await categorise(lang, metadata, url=url)
+
+    # Imported here so importing the module and the HTTP tier never load Playwright
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+    page_limit = None
+    try:
+        # Borrow a page from the shared browser pool instead of launching a browser
+        async with browser_pool.page() as page:
+            stats.increment("browser_tier_urls")
+            trace_set(tier="browser")
+            budget = PageBudget(page_budget)
             try:
-                await page.goto(url, wait_until='load', timeout=30000)
-            except PlaywrightTimeoutError:
-                print(f"Timeout error occurred for URL: {url}")
-                timeout_errors += 1
-                return "-", 0
-            except ssl.SSLError:
-                print(f"SSL error occurred for URL: {url}")
-                ssl_errors += 1
-                return "-", 0
-
-            # Step 2: Extract metadata and language tag from the page
-            lang, metadata = await metadata_extract(page)
-            print(f"Detected language: {lang}")
-
-            if lang and lang.lower() in {"en", "gb", "us", "en-gb", "en-us"}:
-                print(
-                    "Page is in English (or a variant: GB or US). Proceeding with rule-based categorization."
-                )
-                category_code = await product_categorisation(metadata)
-                print(f"Classified category code: {category_code}")
-                status = 1
-                return category_code, status
-
-            else:
-                print(
-                    "Page is not in English, proceeding with ChatGPT categorization."
-                )
-                chatgpt_category_code, status = await chatgpt_categorisation(metadata)
-                print(f"ChatGPT classified category code: {chatgpt_category_code}")
-                return chatgpt_category_code, status
+                try:
+                    with trace_stage("navigation"):
+                        await navigate_within_budget(page, url, budget)
+                except PlaywrightTimeoutError:
+                    logger.warning(f"Timeout error occurred for URL: {url}")
+                    stats.increment("timeout_errors")
+                    trace_set(error="timeout")
+                    note_failure("timeout")
+                    return "-", 0
+                except ssl.SSLError:
+                    logger.warning(f"SSL error occurred for URL: {url}")
+                    stats.increment("ssl_errors")
+                    trace_set(error="ssl")
+                    note_failure("ssl")
+                    return "-", 0
+
+                # Step 2: Extract metadata as soon as the fields we need are present,
+                # rather than waiting for every tracker and ad to finish loading
+                with trace_stage("readiness"):
+                    ready = await wait_until_ready(page, budget, min_headings)
+                if ready:
+                    stats.increment("pages_ready_early")
+                else:
+                    stats.increment("readiness_timeouts")
+                with trace_stage("extraction"):
+                    lang, metadata = await metadata_extract(page, stats, budget)
+            finally:
+                record_page_traffic(url, browser_pool.traffic(page), stats)
+                page_limit = browser_pool.page_limit(page)
+
+        if page_limit is not None:
+            return abort_over_limit(url, page_limit, stats)
+
+        # Step 3: Classify after the page is returned to the pool, so browser
+        # capacity is not held while waiting on ChatGPT
+        with trace_stage("classification"):
+            return await categorise(lang, metadata, url=url)
 
     except Exception as e:
-        print(f"Error during page classification: {e}")
-        if (
-            "SSL peer certificate or SSH remote key was not OK" in str(e)
-            or "SSL connect error" in str(e)
-        ):
-            ssl_errors += 1
-        elif "TimeoutError" in str(e):
-            timeout_errors += 1
+        if page_limit is not None:
+            # The watchdog closed the page under the pending call
+            return abort_over_limit(url, page_limit, stats)
+        logger.error(f"Error during page classification: {e}")
+        trace_set(error=str(e))
+        error_class = classify_error(str(e))
+        note_failure(error_class)
+        if error_class == "ssl":
+            stats.increment("ssl_errors")
+        elif error_class == "timeout":
+            stats.increment("timeout_errors")
         else:
-            other_errors += 1
+            stats.increment("other_errors")
         category_code = "-"
         status = 0
         return category_code, status
 
 
-# Function to classify product category using ChatGPT based on metadata
-async def chatgpt_categorisation(metadata):
-    global tokens_used, input_tokens, output_tokens, gpt_errors
+# Function to answer with a site's stored category, counted by how the site
+# was found unchanged ("not_modified" or "fingerprint")
+def reuse_stored_result(category_code, reason, stats):
+    logger.info(f"Site unchanged ({reason}); reusing category code {category_code}")
+    stats.increment(f"site_store_{reason}")
+    trace_set(classified_by="site_store", unchanged_by=reason)
+    return category_code, 1
+
+
+# Function to give up on a page the browser pool closed for going over its DOM
+# or JS heap cap. Such pages are not retried.
+def abort_over_limit(url, page_limit, stats):
+    logger.warning(f"Aborted {url}: page went over its {page_limit} cap")
+    stats.increment("page_limit_aborts")
+    trace_set(error=f"page_limit_{page_limit}")
+    note_failure("page_limit")
+    return "-", 0
+
+
+# Function to guard classify_page with the pre-flight check and the per-domain
+# circuit breaker: unreachable hosts never get an HTTP fetch or a browser
+# page, and domains that keep failing are skipped for the rest of their
+# cooldown. `overrides` are passed on to classify_page.
+async def guarded_classify(
+    url, classify, stats, preflight=None, circuit_breaker=None, **overrides
+):
+    domain = url_endpoint(url)[1]
+    if circuit_breaker is not None and not circuit_breaker.allow(domain):
+        logger.info(f"Circuit open for {domain}, skipping URL: {url}")
+        stats.increment("circuit_open_skips")
+        trace_set(error="circuit_open")
+        note_failure("circuit_open")
+        return "-", 0
+
     try:
-        # Define the system prompt with instructions for the classification task
-        system_prompt = """
+        if preflight is not None:
+            with trace_stage("preflight"):
+                error_class = await preflight.check(url)
+            if error_class is not None:
+                stats.increment("preflight_rejected")
+                stats.increment(f"preflight_{error_class}")
+                trace_set(error=f"preflight_{error_class}")
+                note_failure(error_class)
+                return "-", 0
+        return await classify(url, **overrides)
+    finally:
+        if circuit_breaker is not None and circuit_breaker.record(
+            domain, current_failure.get()
+        ):
+            stats.increment("circuits_opened")
+            logger.warning(f"Circuit opened for {domain} after repeated failures.")
+
+
+# Function to classify a URL against the site store: the site's entry from an
+# earlier run lets the HTTP tier send a conditional request and the
+# categoriser compare metadata fingerprints, and successful results are
+# stored for the next run. `overrides` are passed on to classify_page.
+async def incremental_classify(url, classify, site_store, **overrides):
+    visit = site_store.visit(url)
+    token = current_visit.set(visit)
+    try:
+        category_code, status = await classify(url, **overrides)
+    finally:
+        current_visit.reset(token)
+    if status == 1 and visit is not None:
+        site_store.record(visit, category_code)
+    return category_code, status
+
+
+# Function to classify a URL and keep what was extracted from it in the
+# snapshot archive, for replaying the categorisers offline later
+async def archived_classify(url, classify, snapshot_archive, **overrides):
+    capture = snapshot_archive.capture()
+    token = current_capture.set(capture)
+    try:
+        category_code, status = await classify(url, **overrides)
+    finally:
+        current_capture.reset(token)
+    if capture.fields is not None:
+        try:
+            snapshot_archive.record(url, capture, category_code, status)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not archive the snapshot of {url}: {e}")
+    return category_code, status
+
+
+# Bump whenever the prompts below change so cached answers are not reused
+PROMPT_VERSION = "1"
+
+# Temperature used for every classification request
+LLM_TEMPERATURE = 0.0
+
+# Category codes ChatGPT is allowed to answer with
+VALID_CATEGORY_CODES = {"9", "8", "7", "6", "-"}
+
+# Define the system prompt with instructions for the classification task
+SYSTEM_PROMPT = """
         You are a website product categorization assistant. You will be provided the content of a website and tasked with classifying whether the brand or content mentions selling one of the following categories:
 
         Categories: 
@@ -507,6 +729,87 @@ async def chatgpt_categorisation(metadata):
         Return only the corresponding category code (9, 8, 7, 6, or -).
         """
 
+# System prompt for classifying several websites in a single completion
+BATCH_SYSTEM_PROMPT = """
+        You are a website product categorization assistant. You will be provided the content of several websites, each introduced by a numeric id, and tasked with classifying whether each brand or its content mentions selling one of the following categories:
+
+        Categories:
+        9: Clothing + Shoes
+        8: Clothing
+        7: Shoes
+        6: Lingerie
+
+        If none of the categories match a website, use '-'.
+
+        Return only a JSON array with one object per website, for example:
+        [{"id": 1, "category": "8"}, {"id": 2, "category": "-"}]
+        """
+
+
+# Function to add the token usage of a ChatGPT response to the run summary
+def record_token_usage(response, stats):
+    stats.increment("input_tokens", response.usage.prompt_tokens)
+    stats.increment("output_tokens", response.usage.completion_tokens)
+    stats.increment("tokens_used", response.usage.total_tokens)
+    stats.increment("llm_calls")
+
+
+# Function to classify product category using ChatGPT based on metadata.
+# Answers are looked up in the persistent cache first; misses are sent one
+# per request or, with a batcher, grouped with other sites into one completion.
+async def chatgpt_categorisation(
+    metadata, stats, llm_client, llm_cache=None, llm_batcher=None
+):
+    key = None
+    if llm_cache is not None:
+        key = cache_key(metadata, llm_client.model, PROMPT_VERSION, LLM_TEMPERATURE)
+        cached_category = llm_cache.get(key)
+        if cached_category is not None:
+            stats.increment("llm_cache_hits")
+            trace_set(llm_cache_hit=True)
+            logger.debug("Using cached ChatGPT category.")
+            return cached_category, 1
+        stats.increment("llm_cache_misses")
+        trace_set(llm_cache_hit=False)
+
+    # Latency includes time spent waiting for a batch to fill
+    with trace_stage("llm"):
+        if llm_batcher is not None:
+            trace_set(llm_batched=True)
+            category, status = await llm_batcher.submit(metadata)
+        else:
+            category, status = await request_chatgpt_category(
+                metadata, stats, llm_client
+            )
+
+    if status == 1 and llm_cache is not None:
+        llm_cache.put(key, category)
+    elif status == 0:
+        note_failure("llm")
+    return category, status
+
+
+# Function standing in for ChatGPT when it is not used (--no-llm, or an
+# offline replay): answers come from the LLM cache, and misses are left
+# unclassified for a later run instead of sent
+async def cached_chatgpt_categorisation(
+    metadata, stats, llm_cache=None, model=DEFAULT_MODEL
+):
+    if llm_cache is not None:
+        category = llm_cache.get(cache_key(metadata, model, PROMPT_VERSION, LLM_TEMPERATURE))
+        if category is not None:
+            stats.increment("llm_cache_hits")
+            trace_set(llm_cache_hit=True)
+            return category, 1
+    stats.increment("llm_skipped")
+    trace_set(llm_skipped=True)
+    note_failure("llm_disabled")
+    return "-", 0
+
+
+# Function to send one website's metadata to ChatGPT
+async def request_chatgpt_category(metadata, stats, llm_client):
+    try:
         # Define the user prompt with the metadata extracted from the webpage
         user_prompt = f"""
         Given the following metadata extracted from a webpage, classify the website category:
@@ -514,13 +817,13 @@ async def chatgpt_categorisation(metadata):
         Webpage metadata: {metadata}
         """
 
-        # Call OpenAI API to get the category classification
-        response = OpenApi.chat.completions.create(
-            model="gpt-4",
+        # Call OpenAI API to get the category classification. The shared client
+        # is async and rate limited, so other pages keep loading while it waits.
+        response = await llm_client.complete(
             messages=[
                 {
                     "role": "system",
-                    "content": system_prompt,
+                    "content": SYSTEM_PROMPT,
                 },
                 {
                     "role": "user",
@@ -528,119 +831,1641 @@ async def chatgpt_categorisation(metadata):
                 },
             ],
             max_tokens=50,
-            temperature=0.0,
+            temperature=LLM_TEMPERATURE,
         )
 
         # Extract the input and output tokens
-        input_tokens += response.usage.prompt_tokens
-        output_tokens += response.usage.completion_tokens
-        tokens_used += response.usage.total_tokens
+        record_token_usage(response, stats)
+        trace_add(llm_calls=1, llm_tokens=response.usage.total_tokens)
 
         # Extract the category number from the response
         category = response.choices[0].message.content.strip()
         status = 1
 
         # Return the classified category (if valid, otherwise '-')
-        if category not in ["9", "8", "7", "6", "-"]:
-            print("Received an invalid category response from ChatGPT.")
+        if category not in VALID_CATEGORY_CODES:
+            logger.warning("Received an invalid category response from ChatGPT.")
             category = "-"
 
         return category, status
 
     except Exception as e:
-        print(f"Error during ChatGPT categorization: {e}")
-        gpt_errors += 1
+        logger.error(f"Error during ChatGPT categorization: {e}")
+        stats.increment("gpt_errors")
         return "-", 0  # Return '-' in case of error
 
 
-# Update the product column based on URL content
-async def update_product_column(spreadsheet):
-    sheet = spreadsheet.get_worksheet(0)
-    print("Fetching records from the Google Sheet...")
-
-    # Get the count of valid URLs
-    valid_url_count = get_url_count(sheet)
-    print(f"Total valid URLs found: {valid_url_count}")
-
-    records = sheet.get_all_records(
-        expected_headers=[
-            "Duplicate",
-            "URL",
-            "Product",
-            "Status",
-            "Email",
-            "Name",
-            "Competitor",
-            "Response",
-            "Comments",
-        ]
+# Function to parse the JSON array returned for a batch into {id: category}
+def parse_batch_response(content):
+    start, end = content.find("["), content.rfind("]")
+    if start == -1 or end < start:
+        raise ValueError("No JSON array in ChatGPT batch response")
+
+    categories = {}
+    for entry in json.loads(content[start : end + 1]):
+        category = str(entry.get("category", "")).strip()
+        categories[int(entry["id"])] = (
+            category if category in VALID_CATEGORY_CODES else "-"
+        )
+    return categories
+
+
+# Function to classify several websites in one ChatGPT completion, so the
+# long system prompt is paid once per batch instead of once per site
+async def chatgpt_categorisation_batch(metadatas, stats, llm_client):
+    # The batch runs in its own task; detach it from whichever URL's trace the
+    # task was created under so its tokens are not charged to that one URL
+    current_trace.set(None)
+    if len(metadatas) == 1:
+        return [await request_chatgpt_category(metadatas[0], stats, llm_client)]
+
+    sites = "\n\n".join(
+        f"Website {site_id} metadata: {metadata}"
+        for site_id, metadata in enumerate(metadatas, start=1)
     )
+    user_prompt = f"""
+        Given the following metadata extracted from {len(metadatas)} webpages, classify each website category:
+
+        {sites}
+        """
+
+    categories = {}
+    try:
+        response = await llm_client.complete(
+            messages=[
+                {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+                {"role": "user", "content": user_prompt},
+            ],
+            max_tokens=20 * len(metadatas) + 20,
+            temperature=LLM_TEMPERATURE,
+        )
+        record_token_usage(response, stats)
+        categories = parse_batch_response(response.choices[0].message.content)
+        stats.increment("llm_batched_sites", len(metadatas))
+    except Exception as e:
+        logger.warning(f"Error during batched ChatGPT categorization: {e}")
+
+    # Sites the batch answer left out are retried one by one
+    results = []
+    for site_id, metadata in enumerate(metadatas, start=1):
+        if site_id in categories:
+            results.append((categories[site_id], 1))
+        else:
+            results.append(await request_chatgpt_category(metadata, stats, llm_client))
+    return results
+
+
+# Archived sites categorised concurrently during a replay
+REPLAY_CHUNK_SIZE = 256
+
+# Seconds a ChatGPT batch waits to fill before it is sent anyway
+DEFAULT_LLM_BATCH_WAIT = 2.0
+
+# Classifies URLs with one set of shared resources: the browser pool, HTTP
+# tier, keyword rules, local model and ChatGPT client, cache and batcher.
+# Everything is passed in, so a batch run and the classification service each
+# hold their own Classifier and nothing is kept at module level.
+class Classifier:
+    def __init__(
+        self,
+        browser_pool,
+        stats=None,
+        matchers=None,
+        text_model=None,
+        model_threshold=0.8,
+        example_log=None,
+        http_fetcher=None,
+        llm_client=None,
+        llm_cache=None,
+        llm_batch_size=1,
+        llm_batch_wait=DEFAULT_LLM_BATCH_WAIT,
+        page_budget=DEFAULT_PAGE_BUDGET,
+        min_headings=DEFAULT_MIN_HEADINGS,
+        preflight=None,
+        circuit_breaker=None,
+        site_store=None,
+        snapshot_archive=None,
+    ):
+        self.browser_pool = browser_pool
+        self.stats = stats or RunStats()
+        self.page_budget = page_budget
+
+        # With a batch size above one, cache misses are grouped into shared completions
+        self.llm_batcher = None
+        if llm_client is not None and llm_batch_size > 1:
+            self.llm_batcher = MicroBatcher(
+                functools.partial(
+                    chatgpt_categorisation_batch, stats=self.stats, llm_client=llm_client
+                ),
+                batch_size=llm_batch_size,
+                max_wait=llm_batch_wait,
+            )
+        if llm_client is None:
+            # Without a ChatGPT client only cached answers are used
+            self.chatgpt = functools.partial(
+                cached_chatgpt_categorisation, stats=self.stats, llm_cache=llm_cache
+            )
+        else:
+            self.chatgpt = functools.partial(
+                chatgpt_categorisation,
+                stats=self.stats,
+                llm_client=llm_client,
+                llm_cache=llm_cache,
+                llm_batcher=self.llm_batcher,
+            )
+        self.categorise = functools.partial(
+            categorise_metadata,
+            stats=self.stats,
+            matchers=matchers or load_matchers(),
+            chatgpt=self.chatgpt,
+            text_model=text_model,
+            model_threshold=model_threshold,
+            example_log=example_log,
+        )
+        self._classify = functools.partial(
+            classify_page,
+            browser_pool=browser_pool,
+            stats=self.stats,
+            categorise=self.categorise,
+            http_fetcher=http_fetcher,
+            page_budget=page_budget,
+            min_headings=min_headings,
+        )
+        if site_store is not None:
+            self._classify = functools.partial(
+                incremental_classify, classify=self._classify, site_store=site_store
+            )
+        if snapshot_archive is not None:
+            self._classify = functools.partial(
+                archived_classify,
+                classify=self._classify,
+                snapshot_archive=snapshot_archive,
+            )
+        if preflight is not None or circuit_breaker is not None:
+            self._classify = functools.partial(
+                guarded_classify,
+                classify=self._classify,
+                stats=self.stats,
+                preflight=preflight,
+                circuit_breaker=circuit_breaker,
+            )
+
+    # Classify one URL; returns (category code, status). `overrides` such as
+    # page_budget are passed on to classify_page.
+    async def classify(self, url, **overrides):
+        return await self._classify(url, **overrides)
 
-    url_processed = 0
+    # Send any ChatGPT batch still waiting to fill
+    async def flush(self):
+        if self.llm_batcher is not None:
+            await self.llm_batcher.flush()
 
-    for idx, record in enumerate(records, start=2):  # Starting from row 2
-        url = record.get("URL")
 
-        if not url:  # Skip rows with empty URL
-            print(f"Skipping row {idx} due to empty URL.")
-            continue
+# Cap the number of pages in flight for any single domain
+class DomainLimiter:
+    def __init__(self, per_domain):
+        self.per_domain = per_domain
+        self._semaphores = collections.defaultdict(
+            lambda: asyncio.Semaphore(self.per_domain)
+        )
+
+    def for_url(self, url):
+        if not url.startswith(("http://", "https://")):
+            url = "https://" + url
+        domain = (urlparse(url).hostname or url).lower()
+        return self._semaphores[domain]
+
+
+# Worker that pulls rows from the queue and writes results to their own row
+# Each row gets a trace that the writer finishes once the row is in the sheet.
+# Rows in the retry schedule are attempted with their retry options, and
+# failures are scheduled for a later retry instead of being waited on here.
+# The result is also written to rows of the same site in `site_groups`.
+async def url_worker(
+    queue,
+    writer,
+    checkpoint,
+    domain_limiter,
+    classify,
+    stats,
+    tracer,
+    retry_schedule=None,
+    page_budget=DEFAULT_PAGE_BUDGET,
+    site_groups=None,
+):
+    while True:
+        item = await queue.get()
+        trace = None
+        try:
+            if item is None:
+                return
+            idx, url = item
+
+            trace = tracer.start(idx, url)
+            current_failure.set(None)
+            retry = None
+            if retry_schedule is not None:
+                retry = retry_schedule.retry_options(idx, url, page_budget)
+            attempt_url, overrides = retry or (url, {})
+            if retry is not None:
+                stats.increment("retries_attempted")
+                # The row's earlier failure is superseded by this attempt
+                if retry_schedule.failed_this_run(idx):
+                    stats.increment("rows_retried_after_failure")
+                    update_failed_rows(stats)
+                trace.set(retry=True, retry_url=attempt_url, **overrides)
+                logger.info(f"Retrying row {idx} with URL: {attempt_url}")
+            else:
+                logger.info(f"Processing row {idx} with URL: {url}")
+
+            async with domain_limiter.for_url(url):
+                product_code, status = await classify(attempt_url, **overrides)
+            trace.set(category=product_code, status=status)
+            checkpoint.record(idx, url, product_code, status)
+            if status == 1 and retry_schedule is not None:
+                retry_schedule.record_success(idx)
+                if retry is not None:
+                    stats.increment("retries_succeeded")
+            elif status != 1:
+                schedule_retry(retry_schedule, idx, url, stats, trace)
+
+            # Buffer the 'Product' and 'Status' values for the next batch write,
+            # for this row and every row of the same site
+            await fan_out(
+                site_groups, idx, url, product_code, status, writer, checkpoint, stats, trace
+            )
+            await writer.add(idx, url, product_code, status, trace)
+        except Exception as e:
+            # Keep the worker alive so one bad row cannot stall the queue
+            logger.error(f"Unexpected error while processing row {idx}: {e}")
+            stats.increment("other_errors")
+            note_failure(classify_error(str(e)))
+            schedule_retry(retry_schedule, idx, url, stats, trace)
+            if trace is not None:
+                trace.set(error=str(e))
+                tracer.finish(trace)
+            # Rows waiting on this site must not wait forever
+            await fan_out(site_groups, idx, url, "-", 0, writer, checkpoint, stats)
+        finally:
+            current_trace.set(None)
+            queue.task_done()
+
+
+# Function to write a site's result to the other rows grouped with it. Each
+# follower given a failure counts as a failed row, and a later result for the
+# site supersedes those failures, as a retry does for the leader.
+async def fan_out(
+    site_groups, idx, url, product_code, status, writer, checkpoint, stats, trace=None
+):
+    if site_groups is None:
+        return
+    followers, superseded = site_groups.finish(idx, url, product_code, status)
+    if trace is not None and followers:
+        trace.set(fanned_out=len(followers))
+    if superseded:
+        stats.increment("rows_retried_after_failure", superseded)
+    if status != 1 and followers:
+        stats.increment("rows_failed", len(followers))
+    if superseded or (status != 1 and followers):
+        update_failed_rows(stats)
+    for row, row_url in followers:
+        checkpoint.record(row, row_url, product_code, status)
+        await writer.add(row, row_url, product_code, status)
+
+
+# Function to publish the rows currently failed: every failure counted, less
+# the failures superseded by a retry later in the run
+def update_failed_rows(stats):
+    stats.set_gauge(
+        "rows_failed_net", stats["rows_failed"] - stats["rows_retried_after_failure"]
+    )
+
 
-        # Stop processing once the number of URLs processed exceeds valid_url_count
-        if url_processed >= valid_url_count:
-            print(
-                "Reached the limit of valid URLs to process. Stopping further updates."
+# Function to count a failed row and put it in the retry schedule, or on the
+# dead-letter list once its error class has no retries left
+def schedule_retry(retry_schedule, idx, url, stats, trace=None):
+    stats.increment("rows_failed")
+    update_failed_rows(stats)
+    if retry_schedule is None:
+        return
+    error_class = current_failure.get() or "other"
+    if error_class in UNSCHEDULED_FAILURES:
+        return
+    outcome = retry_schedule.record_failure(idx, url, error_class)
+    if outcome == "dead_letter":
+        stats.increment("dead_lettered")
+        logger.warning(f"Row {idx} moved to the dead-letter list ({error_class}).")
+    else:
+        stats.increment("retries_scheduled")
+    if trace is not None:
+        trace.set(error_class=error_class, retry_outcome=outcome)
+
+
+# Function to feed (row, url) pairs from the source to the workers through a
+# bounded queue, so memory stays flat however long the input is. Rows
+# classified before an interruption are written back from the checkpoint.
+# Dead-lettered rows are skipped, as are scheduled retries that are not due.
+# With `site_groups`, only the first row of each site is queued; the others
+# get its result, or wait with it when it is skipped. Rows marked in the Duplicate column are held back until the
+# source is exhausted, so they follow a matching row wherever it appears and
+# are only classified themselves if no row matches.
+async def produce_rows(
+    queue,
+    source,
+    writer,
+    checkpoint,
+    concurrency,
+    resume,
+    stats,
+    retry_schedule=None,
+    site_groups=None,
+):
+    duplicate_rows = getattr(source, "duplicate_rows", None)
+    marked_duplicates = []
+    try:
+        async for idx, url in iterate_rows(source.rows(resume=resume, stats=stats)):
+            if retry_schedule is not None:
+                if retry_schedule.is_dead(idx, url):
+                    stats.increment("dead_letter_skipped")
+                    if site_groups is not None:
+                        site_groups.hold(idx, url)
+                    continue
+                if retry_schedule.deferred(idx, url):
+                    stats.increment("retries_deferred")
+                    if site_groups is not None:
+                        site_groups.hold(idx, url)
+                    continue
+            saved_result = checkpoint.result_for(idx, url)
+            if saved_result is not None:
+                await writer.add(idx, url, *saved_result)
+                stats.increment("restored_rows")
+            elif site_groups is not None and duplicate_rows and idx in duplicate_rows:
+                stats.increment("duplicate_marked_rows")
+                marked_duplicates.append((idx, url))
+            else:
+                await queue_row(queue, idx, url, writer, checkpoint, stats, site_groups)
+        for idx, url in marked_duplicates:
+            await queue_row(queue, idx, url, writer, checkpoint, stats, site_groups)
+    finally:
+        # One sentinel per worker tells it to stop once the queue is drained
+        for _ in range(concurrency):
+            await queue.put(None)
+
+
+# Function to queue a row for classification, unless a row of the same site
+# was queued first, in which case it gets that row's result
+async def queue_row(queue, idx, url, writer, checkpoint, stats, site_groups=None):
+    group = site_groups.join(idx, url) if site_groups is not None else None
+    if group is None:
+        await queue.put((idx, url))
+        return
+    if group.held:
+        # Written once the leader's retry runs, in this run or a --resume run
+        stats.increment("dedupe_held_rows")
+        logger.debug(f"Row {idx} waits for row {group.leader}, which is not due: {url}")
+        return
+    stats.increment("dedupe_saved_fetches")
+    logger.debug(f"Row {idx} shares its site with row {group.leader}: {url}")
+    if group.result is not None:
+        if group.result[1] != 1:
+            # The site failed earlier in the run; a retry of its leader may still
+            # supersede this failure
+            group.failed_followers += 1
+            stats.increment("rows_failed")
+            update_failed_rows(stats)
+        checkpoint.record(idx, url, *group.result)
+        await writer.add(idx, url, *group.result)
+
+
+# Function to classify every row of a source with `concurrency` workers
+async def process_rows(
+    source,
+    writer,
+    checkpoint,
+    domain_limiter,
+    classify,
+    stats,
+    tracer,
+    concurrency=1,
+    resume=False,
+    retry_schedule=None,
+    page_budget=DEFAULT_PAGE_BUDGET,
+    site_groups=None,
+):
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+    await asyncio.gather(
+        produce_rows(
+            queue,
+            source,
+            writer,
+            checkpoint,
+            concurrency,
+            resume,
+            stats,
+            retry_schedule,
+            site_groups,
+        ),
+        *(
+            url_worker(
+                queue,
+                writer,
+                checkpoint,
+                domain_limiter,
+                classify,
+                stats,
+                tracer,
+                retry_schedule,
+                page_budget,
+                site_groups,
             )
-            break
-
-        # Process the valid URL
-        print(f"Processing row {idx} with URL: {url}")
-        product_code, status = await classify_page(url)
-
-        # Update the 'Product' column (column 3) with retry logic
-        if not update_cell_with_retry(sheet, idx, 3, product_code):
-            print(f"Failed to update row {idx} after multiple attempts.")
-            continue
-        url_processed += 1
-
-        # Update the 'Status' column (column 4) with retry logic
-        if not update_cell_with_retry(sheet, idx, 4, status):
-            print(f"Failed to update status for row {idx} after multiple attempts.")
-            continue
-
-    print("Product column update process completed.")
-    # Print summary of key metrics
-    print("\n----------- Summary of key Metrics------------")
-    print(f"Total URLs processed: {url_processed}")
-    print(f"Total valid URLs found: {valid_url_count}")
-    print("--------------------------------------------")
-    print(f"Total URLs failed due to timeout errors: {timeout_errors}")
-    print(f"Total URLs failed due to SSL errors: {ssl_errors}")
-    print(f"Total URLs failed during metadata extraction: {metadata_extract_errors}")
-    print(f"Total URLs failed during ChatGPT categorization: {gpt_errors}")
-    print(f"Total URLs failed due to other errors: {other_errors}")
-    print("------------------------------------")
-    total_failures = (
-        timeout_errors
-        + ssl_errors
-        + metadata_extract_errors
-        + gpt_errors
-        + other_errors
-    )
-    print(f"Total URLs failed: {total_failures} out of {valid_url_count}")
-    print(
+            for _ in range(concurrency)
+        ),
+    )
+
+
+# Function to run retry passes once the main pass is done. Only the run waits
+# for the next retry to come due, for at most `retry_wait` seconds; no worker
+# holds a page while it waits. Retries due later are left for a follow-up run.
+async def retry_due_rows(process, retry_schedule, retry_wait, stats):
+    while True:
+        next_due = retry_schedule.next_due()
+        if next_due is None:
+            return
+        wait = next_due - time.time()
+        if wait > retry_wait:
+            logger.info(
+                f"{retry_schedule.pending()} retry(ies) not due for another "
+                f"{wait:.0f} s; run again with --resume to process them."
+            )
+            return
+        if wait > 0:
+            logger.info(f"Waiting {wait:.0f} s for the next retry to come due.")
+            await asyncio.sleep(wait)
+        stats.increment("retry_passes")
+        logger.info(f"Retry pass {stats['retry_passes']}: {len(retry_schedule.due())} row(s) due.")
+        await process(DueRetrySource(retry_schedule))
+
+
+# Update the product column based on URL content. Rows are read from `source`
+# (a SheetSource, a file source or the shared work queue) and results go to
+# the sink built by `open_sink(stats, batch_size=..., flush_interval=..., tracer=...)`.
+# Failed rows go to `retry_schedule`, and rows coming due within `retry_wait`
+# seconds are retried before the run ends (None leaves them all for later).
+# URLs are classified by `classifier`, whose stats the run reports. Rows are
+# grouped by canonical site at `dedupe_level` (see url_canonical) so each
+# site is classified once.
+async def update_product_column(
+    source,
+    open_sink,
+    classifier,
+    concurrency=1,
+    per_domain=2,
+    batch_size=50,
+    flush_interval=10.0,
+    resume=False,
+    checkpoint_path="classifier_checkpoint.jsonl",
+    retry_schedule=None,
+    retry_wait=DEFAULT_RETRY_WAIT,
+    tracer=None,
+    dedupe_level=DEFAULT_DEDUPE_LEVEL,
+):
+    stats = classifier.stats
+    tracer = tracer or Tracer()
+    site_groups = None if dedupe_level == "off" else SiteGroups(dedupe_level)
+    with Checkpoint(checkpoint_path, resume=resume) as checkpoint:
+        domain_limiter = DomainLimiter(per_domain)
+        logger.info(f"Processing with {concurrency} worker(s), {per_domain} per domain.")
+        # The writer flushes every batch_size rows or flush_interval seconds,
+        # and once more on exit so Ctrl-C does not lose buffered results
+        async with open_sink(
+            stats, batch_size=batch_size, flush_interval=flush_interval, tracer=tracer
+        ) as writer:
+            process = functools.partial(
+                process_rows,
+                writer=writer,
+                checkpoint=checkpoint,
+                domain_limiter=domain_limiter,
+                classify=classifier.classify,
+                stats=stats,
+                tracer=tracer,
+                concurrency=concurrency,
+                retry_schedule=retry_schedule,
+                page_budget=classifier.page_budget,
+                site_groups=site_groups,
+            )
+            await process(source, resume=resume)
+            if retry_schedule is not None and retry_wait is not None:
+                await retry_due_rows(process, retry_schedule, retry_wait, stats)
+
+    logger.info(f"Total valid URLs found: {stats['valid_urls']}")
+    if resume:
+        logger.info(
+            f"Resumed: {stats['skipped_rows']} row(s) already successful, "
+            f"{stats['restored_rows']} restored from checkpoint."
+        )
+    logger.info("Product column update process completed.")
+    stats.increment("browser_restarts", classifier.browser_pool.restarts)
+    print_summary(stats, stats["valid_urls"], tracer)
+    tracer.write_metrics(stats)
+
+
+# Print summary of key metrics
+def print_summary(stats, valid_url_count, tracer=None):
+    logger.info("----------- Summary of key Metrics------------")
+    logger.info(f"Total URLs processed: {stats['url_processed']}")
+    logger.info(f"Total valid URLs found: {valid_url_count}")
+    logger.info(f"Total rows skipped as already classified: {stats['skipped_rows']}")
+    logger.info(f"Total rows restored from checkpoint: {stats['restored_rows']}")
+    logger.info(
+        f"Fetches saved by grouping rows of the same site: {stats['dedupe_saved_fetches']} "
+        f"({stats['duplicate_marked_rows']} row(s) marked Duplicate)"
+    )
+    logger.info(
+        f"Unchanged sites reusing their stored result: "
+        f"{stats['site_store_not_modified']} by conditional request, "
+        f"{stats['site_store_fingerprint']} by metadata fingerprint"
+    )
+    logger.info("--------------------------------------------")
+    logger.info(f"Total URLs failed due to timeout errors: {stats['timeout_errors']}")
+    logger.info(f"Total URLs failed due to SSL errors: {stats['ssl_errors']}")
+    logger.info(
+        f"Total URLs failed during metadata extraction: {stats['metadata_extract_errors']}"
+    )
+    logger.info(f"Total URLs failed during ChatGPT categorization: {stats['gpt_errors']}")
+    logger.info(f"Total URLs failed due to other errors: {stats['other_errors']}")
+    logger.info(f"Total rows not written to the output: {stats['write_errors']}")
+    logger.info("------------------------------------")
+    logger.info(f"URLs handled by the HTTP tier: {stats['http_tier_urls']}")
+    logger.info(f"URLs handled by the browser tier: {stats['browser_tier_urls']}")
+    logger.info(
+        f"Browser requests allowed: {stats['requests_allowed']} "
+        f"({stats['bytes_allowed'] / 1024 / 1024:.1f} MB declared)"
+    )
+    logger.info(
+        f"Browser requests blocked: {stats['requests_blocked']} "
+        f"(resource type: {stats['blocked_resource_type']}, "
+        f"blocklist: {stats['blocked_blocklist']}, "
+        f"third-party scripts: {stats['blocked_third_party_script']})"
+    )
+    logger.info(f"Browser pages ready before their budget ran out: {stats['pages_ready_early']}")
+    logger.info(f"Browser pages aborted over their DOM or JS heap cap: {stats['page_limit_aborts']}")
+    if "peak_browser_rss_bytes" in stats.gauges:
+        logger.info(
+            f"Peak browser memory: {stats.gauges['peak_browser_rss_bytes'] / 1024 / 1024:.0f} MB"
+        )
+    logger.info(
+        f"Browser restarts: {stats['browser_restarts']} "
+        f"({stats['rss_browser_restarts']} for memory); "
+        f"idle contexts recycled for memory: {stats['rss_context_recycles']} time(s)"
+    )
+    logger.info(f"Peak memory of the classifier process: {own_peak_rss_bytes() / 1024 / 1024:.0f} MB")
+    logger.info(f"Browser pages extracted at the readiness timeout: {stats['readiness_timeouts']}")
+    logger.info(f"URLs classified by keyword rules: {stats['rule_classified_urls']}")
+    logger.info(
+        f"Non-English URLs settled without ChatGPT: {stats['rule_classified_non_english_urls']}"
+    )
+    logger.info(f"URLs classified by the local model: {stats['model_classified_urls']}")
+    logger.info(f"Local model predictions escalated to ChatGPT: {stats['model_escalations']}")
+    if stats["llm_skipped"]:
+        logger.info(
+            f"URLs left unclassified for a run with ChatGPT: {stats['llm_skipped']}"
+        )
+    logger.info("------------------------------------")
+    logger.info(
+        f"URLs rejected by the pre-flight check: {stats['preflight_rejected']} "
+        f"(DNS: {stats['preflight_dns']}, network: {stats['preflight_network']}, "
+        f"timeout: {stats['preflight_timeout']}, TLS: {stats['preflight_ssl']})"
+    )
+    logger.info(
+        f"URLs skipped by open circuits: {stats['circuit_open_skips']} "
+        f"({stats['circuits_opened']} domain circuit(s) opened)"
+    )
+    logger.info(
+        f"Retries: {stats['retries_attempted']} attempted, "
+        f"{stats['retries_succeeded']} succeeded, {stats['retry_passes']} end-of-run pass(es)"
+    )
+    logger.info(f"Rows scheduled for a later retry: {stats['retries_scheduled']}")
+    logger.info(f"Rows moved to the dead-letter list: {stats['dead_lettered']}")
+    logger.info(
+        f"Rows skipped as dead-lettered or not yet due: "
+        f"{stats['dead_letter_skipped'] + stats['retries_deferred']} "
+        f"(plus {stats['dedupe_held_rows']} row(s) of the same sites)"
+    )
+    logger.info("------------------------------------")
+    # Error counters above count attempts; a row retried successfully is not a failure
+    total_failures = stats["rows_failed"] - stats["rows_retried_after_failure"]
+    logger.info(f"Total URLs failed: {total_failures} out of {valid_url_count}")
+    logger.info(
         f"Total URLs successfully updated: {valid_url_count - total_failures} out of {valid_url_count}"
     )
-    print("------------------------------------")
-    print(f"Time taken: {time.time() - start_time:.2f} seconds")
-    print(f"Total tokens used: {tokens_used}")
-    cost = (input_tokens * 0.00003) + (output_tokens * 0.00006)
-    print(f"Cost of tokens used: ${cost:.2f}")
-    print("---------------Process completed-----------********")
-    print("---------------------------------------------------")
+    logger.info("------------------------------------")
+    logger.info(f"Time taken: {time.time() - stats.start_time:.2f} seconds")
+    logger.info(f"Total tokens used: {stats['tokens_used']}")
+    logger.info(f"Total ChatGPT calls: {stats['llm_calls']}")
+    logger.info(f"Sites classified in batched ChatGPT calls: {stats['llm_batched_sites']}")
+    cache_lookups = stats["llm_cache_hits"] + stats["llm_cache_misses"]
+    if cache_lookups:
+        hit_rate = stats["llm_cache_hits"] / cache_lookups
+        logger.info(
+            f"ChatGPT cache hit rate: {hit_rate:.1%} "
+            f"({stats['llm_cache_hits']} of {cache_lookups})"
+        )
+    cost = (stats["input_tokens"] * 0.00003) + (stats["output_tokens"] * 0.00006)
+    logger.info(f"Cost of tokens used: ${cost:.2f}")
+    if tracer is not None and tracer.histograms:
+        logger.info("------------------------------------")
+        logger.info("Per-URL latency by stage:")
+        for line in tracer.summary_lines():
+            logger.info(f"  {line}")
+    logger.info("---------------Process completed-----------********")
+    logger.info("---------------------------------------------------")
+
+
+# Commands of the command line
+COMMANDS = ("classify", "serve", "replay", "bench")
+
+# Milliseconds importing this module may take, checked by bench_startup.py.
+# Playwright, OpenAI, gspread, google-auth and httpx are imported by the code
+# that uses them, so commands that never touch a backend never pay for it.
+IMPORT_TIME_BUDGET_MS = 250
+
+# Benchmarks the bench command runs, by name, and their scripts in benchmarks/
+BENCHMARKS = {
+    "startup": "bench_startup",
+    "end-to-end": "bench_end_to_end",
+    "keywords": "bench_keyword_matcher",
+}
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+
+# Function to parse the command line. The first argument picks the command;
+# without one the command line is a classify run, as before there were
+# subcommands.
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] not in (*COMMANDS, "-h", "--help"):
+        argv.insert(0, "classify")
+
+    # Options shared by several commands, added through argparse parents
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--log-level",
+        choices=("DEBUG", "INFO", "WARNING", "ERROR"),
+        default="INFO",
+        help="Logging verbosity (default: INFO)",
+    )
 
+    # How metadata is categorised: keyword rules, local model and ChatGPT
+    categoriser = argparse.ArgumentParser(add_help=False)
+    categoriser.add_argument(
+        "--keywords",
+        default=DEFAULT_KEYWORDS_FILE,
+        help="JSON file of per-language category keywords (default: keywords.json)",
+    )
+    categoriser.add_argument(
+        "--text-model",
+        help="Local model file from 'python text_model.py train' used before ChatGPT",
+    )
+    categoriser.add_argument(
+        "--model-threshold",
+        type=float,
+        default=0.8,
+        help="Minimum local model confidence to skip ChatGPT (default: 0.8)",
+    )
+    categoriser.add_argument(
+        "--llm-rpm",
+        type=int,
+        default=500,
+        help="ChatGPT requests-per-minute budget (default: 500)",
+    )
+    categoriser.add_argument(
+        "--llm-tpm",
+        type=int,
+        default=30000,
+        help="ChatGPT tokens-per-minute budget (default: 30000)",
+    )
+    categoriser.add_argument(
+        "--llm-concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of ChatGPT calls in flight (default: 8)",
+    )
+    categoriser.add_argument(
+        "--llm-cache",
+        default="llm_cache.sqlite3",
+        help="SQLite file caching ChatGPT answers (default: llm_cache.sqlite3)",
+    )
+    categoriser.add_argument(
+        "--no-llm-cache",
+        action="store_true",
+        help="Always call ChatGPT instead of reusing cached answers",
+    )
+    categoriser.add_argument(
+        "--llm-cache-ttl-days",
+        type=float,
+        default=30,
+        help="Expire cached ChatGPT answers after this many days (default: 30)",
+    )
+    categoriser.add_argument(
+        "--llm-cache-max-entries",
+        type=int,
+        default=100000,
+        help="Maximum number of cached ChatGPT answers (default: 100000)",
+    )
+    categoriser.add_argument(
+        "--llm-batch-size",
+        type=int,
+        help="Classify up to this many sites per ChatGPT call "
+        f"(default: 1, no batching; {SERVICE_LLM_BATCH_SIZE} for serve)",
+    )
+    categoriser.add_argument(
+        "--llm-batch-wait",
+        type=float,
+        help="Seconds a ChatGPT batch waits to fill before it is sent "
+        f"(default: {DEFAULT_LLM_BATCH_WAIT:g}; {SERVICE_LLM_BATCH_WAIT:g} for serve)",
+    )
+
+    # How pages are fetched and what is kept of them
+    crawler = argparse.ArgumentParser(add_help=False)
+    crawler.add_argument(
+        "--engine",
+        choices=BROWSER_ENGINES,
+        default="webkit",
+        help="Browser engine to launch (default: webkit)",
+    )
+    crawler.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of URLs processed concurrently (default: 1)",
+    )
+    crawler.add_argument(
+        "--per-domain",
+        type=int,
+        default=2,
+        help="Maximum number of pages in flight per domain (default: 2)",
+    )
+    crawler.add_argument(
+        "--no-llm",
+        action="store_true",
+        help="Never call ChatGPT, so no OpenAI key is needed; pages the keyword rules, "
+        "local model and LLM cache cannot classify are left for a later run",
+    )
+    crawler.add_argument(
+        "--no-http-tier",
+        action="store_true",
+        help="Always render pages in the browser instead of trying plain HTTP first",
+    )
+    crawler.add_argument(
+        "--pool-size",
+        type=int,
+        default=None,
+        help="Maximum number of browser contexts open at once (default: --concurrency)",
+    )
+    crawler.add_argument(
+        "--pages-per-context",
+        type=int,
+        default=50,
+        help="Recycle a browser context after this many pages (default: 50)",
+    )
+    crawler.add_argument(
+        "--block-resource-types",
+        default=",".join(DEFAULT_BLOCKED_RESOURCE_TYPES),
+        help="Comma-separated resource types the browser never downloads "
+        "(default: image,font,media,stylesheet; empty to allow all)",
+    )
+    crawler.add_argument(
+        "--blocklist",
+        default=DEFAULT_BLOCKLIST_FILE,
+        help="File of ad/analytics/widget domains to block, one per line "
+        "(default: bundled blocklist.txt)",
+    )
+    crawler.add_argument(
+        "--no-blocklist",
+        action="store_true",
+        help="Do not block any domains",
+    )
+    crawler.add_argument(
+        "--block-third-party-scripts",
+        action="store_true",
+        help="Block every script served from a site other than the page's own",
+    )
+    crawler.add_argument(
+        "--pages-per-browser",
+        type=int,
+        default=DEFAULT_PAGES_PER_BROWSER,
+        help="Restart the browser after this many pages "
+        f"(default: {DEFAULT_PAGES_PER_BROWSER}; 0 never)",
+    )
+    crawler.add_argument(
+        "--max-browser-rss-mb",
+        type=int,
+        default=DEFAULT_MAX_BROWSER_RSS_MB,
+        help="Recycle idle contexts, then restart the browser, when the browser "
+        f"processes use more memory than this (default: {DEFAULT_MAX_BROWSER_RSS_MB}; 0 no cap)",
+    )
+    crawler.add_argument(
+        "--max-dom-nodes",
+        type=int,
+        default=DEFAULT_MAX_DOM_NODES,
+        help="Abort pages with more DOM elements than this "
+        f"(default: {DEFAULT_MAX_DOM_NODES}; 0 no cap)",
+    )
+    crawler.add_argument(
+        "--max-js-heap-mb",
+        type=int,
+        default=DEFAULT_MAX_JS_HEAP_MB,
+        help="Abort pages whose JS heap grows past this, Chromium only "
+        f"(default: {DEFAULT_MAX_JS_HEAP_MB}; 0 no cap)",
+    )
+    crawler.add_argument(
+        "--page-budget",
+        type=float,
+        default=DEFAULT_PAGE_BUDGET,
+        help="Seconds a URL may spend loading and extracting in the browser (default: 30)",
+    )
+    crawler.add_argument(
+        "--min-headings",
+        type=int,
+        default=DEFAULT_MIN_HEADINGS,
+        help="Headings a page missing its title or meta description needs before "
+        "metadata is extracted (default: 3)",
+    )
+    crawler.add_argument(
+        "--site-store",
+        default="site_store.sqlite3",
+        help="SQLite file of each site's validators, metadata fingerprint and last "
+        "category, used to skip unchanged sites (default: site_store.sqlite3)",
+    )
+    crawler.add_argument(
+        "--no-site-store",
+        action="store_true",
+        help="Classify every site in full instead of reusing results for unchanged sites",
+    )
+    crawler.add_argument(
+        "--max-age-days",
+        type=float,
+        default=DEFAULT_MAX_AGE_DAYS,
+        help="Fully classify sites again once their stored result is this old "
+        f"(default: {DEFAULT_MAX_AGE_DAYS:g}; 0 refreshes every site)",
+    )
+    crawler.add_argument(
+        "--no-preflight",
+        action="store_true",
+        help="Do not check DNS and TCP/TLS reachability before fetching a URL",
+    )
+    crawler.add_argument(
+        "--preflight-timeout",
+        type=float,
+        default=DEFAULT_PROBE_TIMEOUT,
+        help="Seconds allowed for each pre-flight DNS lookup, connect and handshake "
+        f"(default: {DEFAULT_PROBE_TIMEOUT:g})",
+    )
+    crawler.add_argument(
+        "--breaker-threshold",
+        type=int,
+        default=DEFAULT_BREAKER_THRESHOLD,
+        help="Consecutive host failures that stop a domain being tried "
+        f"(default: {DEFAULT_BREAKER_THRESHOLD}; 0 disables the circuit breaker)",
+    )
+    crawler.add_argument(
+        "--breaker-cooldown",
+        type=float,
+        default=DEFAULT_BREAKER_COOLDOWN,
+        help="Seconds before a domain with an open circuit is tried again "
+        f"(default: {DEFAULT_BREAKER_COOLDOWN:g})",
+    )
+    crawler.add_argument(
+        "--save-examples",
+        help="Append classified metadata to this JSONL file as local model training data",
+    )
+    crawler.add_argument(
+        "--archive",
+        help="Keep the fields extracted from every site in this zstd-compressed "
+        "snapshot archive, for the replay command",
+    )
+    crawler.add_argument(
+        "--archive-html",
+        action="store_true",
+        help="Also keep each page's HTML in the snapshot archive",
+    )
+    crawler.add_argument(
+        "--trace",
+        help="Append one JSON line of per-stage timings per URL to this file",
+    )
+    crawler.add_argument(
+        "--metrics",
+        help="Write per-stage latency histograms and run counters to this "
+        "Prometheus text file",
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Classify website product categories from a Google Sheet or a file."
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    classify = commands.add_parser(
+        "classify",
+        parents=[common, categoriser, crawler],
+        help="Classify the rows of the Google Sheet or an input file (the default)",
+    )
+    classify.add_argument(
+        "--input",
+        help="Read URLs from this CSV, JSONL or Parquet file instead of the Google Sheet",
+    )
+    classify.add_argument(
+        "--output",
+        help="Append results to this CSV, JSONL or Parquet file (required with --input)",
+    )
+    classify.add_argument(
+        "--url-column",
+        default="URL",
+        help="Column or field holding the URL in --input (default: URL)",
+    )
+    classify.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Read the input and report how many rows and sites a run would classify, "
+        "without fetching, calling ChatGPT or writing results",
+    )
+    classify.add_argument(
+        "--batch-size",
+        type=int,
+        default=50,
+        help="Write results to the sheet every this many rows (default: 50)",
+    )
+    classify.add_argument(
+        "--flush-interval",
+        type=float,
+        default=10.0,
+        help="Write buffered results at least this often, in seconds (default: 10)",
+    )
+    classify.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip rows whose Status is already 1 and reuse results from the checkpoint file",
+    )
+    classify.add_argument(
+        "--checkpoint",
+        default="classifier_checkpoint.jsonl",
+        help="Local file recording classified rows (default: classifier_checkpoint.jsonl)",
+    )
+    classify.add_argument(
+        "--dedupe",
+        choices=DEDUPE_LEVELS,
+        default=DEFAULT_DEDUPE_LEVEL,
+        help="Classify each canonical URL, site (host) or registrable domain once "
+        f"and copy the result to matching rows (default: {DEFAULT_DEDUPE_LEVEL})",
+    )
+    classify.add_argument(
+        "--retry-schedule",
+        default="classifier_retries.sqlite3",
+        help="SQLite file scheduling retries of failed rows and listing dead letters "
+        "(default: classifier_retries.sqlite3)",
+    )
+    classify.add_argument(
+        "--retry-wait",
+        type=float,
+        default=DEFAULT_RETRY_WAIT,
+        help="Seconds the run may wait at its end for scheduled retries to come due "
+        f"(default: {DEFAULT_RETRY_WAIT:g}); later ones are left for a --resume run",
+    )
+    classify.add_argument(
+        "--no-retries",
+        action="store_true",
+        help="Do not schedule failed rows for retry",
+    )
+    classify.add_argument(
+        "--shards",
+        type=int,
+        help="Split the run across this many worker processes, each with its own "
+        "browser, fed from the shared work queue (0 to only seed and merge)",
+    )
+    classify.add_argument(
+        "--queue-worker",
+        action="store_true",
+        help="Join a sharded run as a worker, e.g. from another machine",
+    )
+    classify.add_argument(
+        "--queue",
+        default="classifier_queue.sqlite3",
+        help="SQLite work queue shared by sharded workers "
+        "(default: classifier_queue.sqlite3)",
+    )
+    classify.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help="Seconds before rows held by an unresponsive worker are handed to "
+        f"another (default: {DEFAULT_LEASE_SECONDS})",
+    )
+    classify.add_argument(
+        "--shared-queue",
+        action="store_true",
+        help="The queue file lives on a network filesystem shared by several machines",
+    )
+    serve = commands.add_parser(
+        "serve",
+        parents=[common, categoriser, crawler],
+        help="Run as an HTTP/JSON classification service",
+    )
+    serve.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address the service listens on (default: 127.0.0.1)",
+    )
+    serve.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_SERVICE_PORT,
+        help=f"Port the service listens on (default: {DEFAULT_SERVICE_PORT})",
+    )
+    serve.add_argument(
+        "--max-pending",
+        type=int,
+        default=DEFAULT_MAX_PENDING,
+        help="URLs the service accepts at once before answering 503 "
+        f"(default: {DEFAULT_MAX_PENDING})",
+    )
+    serve.add_argument(
+        "--request-timeout",
+        type=float,
+        default=DEFAULT_REQUEST_TIMEOUT,
+        help="Seconds the service waits for a request's URLs before answering 504 "
+        f"(default: {DEFAULT_REQUEST_TIMEOUT:g})",
+    )
+    replay = commands.add_parser(
+        "replay",
+        parents=[common, categoriser],
+        help="Run the categorisers over a snapshot archive offline and report "
+        "codes that changed",
+    )
+    replay.add_argument("archive", help="Snapshot archive written with --archive")
+    replay.add_argument(
+        "--llm",
+        dest="replay_llm",
+        action="store_true",
+        help="Send sites the LLM cache cannot answer to ChatGPT",
+    )
+    replay.add_argument(
+        "--diff-output",
+        help="Write every changed code to this CSV file",
+    )
+    bench = commands.add_parser(
+        "bench",
+        help="Run a benchmark; arguments after its name are passed to it",
+    )
+    bench.add_argument("benchmark", choices=BENCHMARKS)
+    bench.add_argument("benchmark_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        return args
+
+    serving = args.command == "serve"
+    if args.llm_batch_size is None:
+        args.llm_batch_size = SERVICE_LLM_BATCH_SIZE if serving else 1
+    if args.llm_batch_wait is None:
+        args.llm_batch_wait = SERVICE_LLM_BATCH_WAIT if serving else DEFAULT_LLM_BATCH_WAIT
+    if args.llm_batch_size < 1:
+        parser.error("--llm-batch-size must be at least 1")
+    if args.llm_batch_wait < 0:
+        parser.error("--llm-batch-wait must be 0 or more")
+    if args.command == "replay":
+        return args
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.per_domain < 1:
+        parser.error("--per-domain must be at least 1")
+    if args.page_budget <= EXTRACTION_RESERVE:
+        parser.error(f"--page-budget must be more than {EXTRACTION_RESERVE:g} seconds")
+    for option in ("pages_per_browser", "max_browser_rss_mb", "max_dom_nodes", "max_js_heap_mb"):
+        if getattr(args, option) < 0:
+            parser.error(f"--{option.replace('_', '-')} must be 0 or more")
+    if args.max_age_days < 0:
+        parser.error("--max-age-days must be 0 or more")
+    if args.preflight_timeout <= 0:
+        parser.error("--preflight-timeout must be positive")
+    if args.breaker_threshold < 0:
+        parser.error("--breaker-threshold must be 0 or more")
+    if args.archive_html and not args.archive:
+        parser.error("--archive-html needs --archive")
+    if args.pool_size is None:
+        args.pool_size = args.concurrency
+    if serving:
+        if args.max_pending < 1:
+            parser.error("--max-pending must be at least 1")
+        if args.request_timeout <= 0:
+            parser.error("--request-timeout must be positive")
+        return args
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.shards is not None and args.shards < 0:
+        parser.error("--shards must be 0 or more")
+    if args.shards is not None and args.queue_worker:
+        parser.error("--shards starts the coordinator; use --queue-worker alone to join it")
+    if args.dry_run and (args.shards is not None or args.queue_worker):
+        parser.error("--dry-run cannot be combined with --shards or --queue-worker")
+    if args.retry_wait < 0:
+        parser.error("--retry-wait must be 0 or more")
+    if args.lease_seconds <= 0:
+        parser.error("--lease-seconds must be positive")
+    if args.input and not args.output:
+        parser.error("--output is required with --input")
+    if args.output and not args.input:
+        parser.error("--output needs --input; sheet input is written back to the sheet")
+    return args
+
+
+# Function to build the browser request-interception policy from the CLI options
+def build_interception_policy(args):
+    resource_types = [
+        resource_type.strip()
+        for resource_type in args.block_resource_types.split(",")
+        if resource_type.strip()
+    ]
+    blocklist = None if args.no_blocklist else load_blocklist(args.blocklist)
+    return InterceptionPolicy(
+        blocked_resource_types=resource_types,
+        blocklist=blocklist,
+        block_third_party_scripts=args.block_third_party_scripts,
+    )
+
+
+# Function to build the row source and sink factory for the chosen backend
+def open_backends(args):
+    if args.input:
+        source = open_source(args.input, args.url_column)
+        sink = functools.partial(file_sink, args.output, resume=args.resume)
+        return source, sink
+
+    from sheet_writer import BatchedSheetWriter, SheetSource
 
-if __name__ == "__main__":
     spreadsheet = authenticate_google_sheets(
-        GOOGLE_APPLICATION_CREDENTIALS, GOOGLE_SHEET_ID
+        os.getenv("GOOGLE_APPLICATION_CREDENTIALS"), os.getenv("GOOGLE_SHEET_ID")
+    )
+    sheet = spreadsheet.get_worksheet(0)
+    return SheetSource(sheet), functools.partial(BatchedSheetWriter, sheet)
+
+
+# Function to list the environment variables missing for the backends a
+# command uses: OpenAI when ChatGPT may be called, Google when rows come from
+# the sheet. Replays, dry runs and --no-llm runs need no OpenAI key.
+def missing_credentials(args):
+    required = []
+    if args.command == "replay":
+        if args.replay_llm:
+            required += OPENAI_VARIABLES
+    elif not args.no_llm and not getattr(args, "dry_run", False):
+        required += OPENAI_VARIABLES
+    if args.command == "classify" and not args.input and not args.queue_worker:
+        required += GOOGLE_SHEET_VARIABLES
+    return [name for name in required if not os.getenv(name)]
+
+
+# Function to open the ChatGPT client from the environment
+def open_llm_client(args):
+    return LLMClient(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL"),
+        requests_per_minute=args.llm_rpm,
+        tokens_per_minute=args.llm_tpm,
+        max_in_flight=args.llm_concurrency,
+    )
+
+
+# Function to open every resource a Classifier shares across URLs (browser
+# pool and its memory supervisor, ChatGPT client and cache, local model, HTTP
+# tier, pre-flight check) from the command-line options. They are closed
+# when `stack` is. With --no-llm no ChatGPT client is opened.
+async def open_classifier(args, stack, stats):
+    # Start the driver and browser once for the whole run
+    page_limits = None
+    if args.max_dom_nodes or args.max_js_heap_mb:
+        page_limits = PageLimits(args.max_dom_nodes, args.max_js_heap_mb)
+    browser_pool = await stack.enter_async_context(
+        BrowserPool(
+            engine=args.engine,
+            pool_size=args.pool_size,
+            pages_per_context=args.pages_per_context,
+            interception_policy=build_interception_policy(args),
+            pages_per_browser=args.pages_per_browser,
+            page_limits=page_limits,
+        )
+    )
+    await stack.enter_async_context(
+        MemorySupervisor(browser_pool, stats, max_rss_mb=args.max_browser_rss_mb)
+    )
+    llm_client = None
+    if not args.no_llm:
+        llm_client = await stack.enter_async_context(open_llm_client(args))
+    llm_cache = None
+    if not args.no_llm_cache:
+        llm_cache = stack.enter_context(
+            LLMCache(
+                args.llm_cache,
+                max_entries=args.llm_cache_max_entries,
+                ttl_seconds=args.llm_cache_ttl_days * 24 * 3600,
+            )
+        )
+    text_model = None
+    if args.text_model:
+        text_model = HashedTextClassifier.load(args.text_model)
+    example_log = None
+    if args.save_examples:
+        example_log = stack.enter_context(ExampleLog(args.save_examples))
+    http_fetcher = None
+    if not args.no_http_tier:
+        http_fetcher = await stack.enter_async_context(
+            HttpFetcher(
+                max_connections=max(args.concurrency, 10),
+                keep_html=bool(args.archive and args.archive_html),
+            )
+        )
+    preflight = None
+    if not args.no_preflight:
+        preflight = Preflight(timeout=args.preflight_timeout)
+    circuit_breaker = None
+    if args.breaker_threshold:
+        circuit_breaker = CircuitBreaker(args.breaker_threshold, args.breaker_cooldown)
+    site_store = None
+    if not args.no_site_store:
+        site_store = stack.enter_context(SiteStore(args.site_store, args.max_age_days))
+    snapshot_archive = None
+    if args.archive:
+        snapshot_archive = stack.enter_context(
+            SnapshotArchive(args.archive, store_html=args.archive_html)
+        )
+
+    return Classifier(
+        browser_pool,
+        stats=stats,
+        matchers=load_matchers(args.keywords),
+        text_model=text_model,
+        model_threshold=args.model_threshold,
+        example_log=example_log,
+        http_fetcher=http_fetcher,
+        llm_client=llm_client,
+        llm_cache=llm_cache,
+        llm_batch_size=args.llm_batch_size,
+        llm_batch_wait=args.llm_batch_wait,
+        page_budget=args.page_budget,
+        min_headings=args.min_headings,
+        preflight=preflight,
+        circuit_breaker=circuit_breaker,
+        site_store=site_store,
+        snapshot_archive=snapshot_archive,
     )
-    asyncio.run(update_product_column(spreadsheet))
+
+
+# Function to run the classifier against a source and sink with every shared
+# resource (browser, ChatGPT client, cache, model, tracer) opened for the run
+# Returns the run's stats.
+async def run_classifier(
+    args, source, sink, checkpoint_path, trace_path, metrics_path, retry_schedule_path=None
+):
+    stats = RunStats()
+    async with contextlib.AsyncExitStack() as stack:
+        classifier = await open_classifier(args, stack, stats)
+        tracer = stack.enter_context(Tracer(trace_path, metrics_path))
+        retry_schedule = None
+        if retry_schedule_path and not args.no_retries:
+            retry_schedule = stack.enter_context(
+                RetrySchedule(retry_schedule_path, resume=args.resume)
+            )
+
+        await update_product_column(
+            source,
+            sink,
+            classifier,
+            concurrency=args.concurrency,
+            per_domain=args.per_domain,
+            batch_size=args.batch_size,
+            flush_interval=args.flush_interval,
+            resume=args.resume,
+            checkpoint_path=checkpoint_path,
+            retry_schedule=retry_schedule,
+            retry_wait=args.retry_wait,
+            tracer=tracer,
+            dedupe_level=args.dedupe,
+        )
+    return stats
+
+
+# Function to serve classifications over HTTP until the process is stopped.
+# The browser pool is warmed before the first request, and ChatGPT misses
+# from concurrent requests share batched completions.
+async def run_service(args):
+    stats = RunStats()
+    async with contextlib.AsyncExitStack() as stack:
+        classifier = await open_classifier(args, stack, stats)
+        await classifier.browser_pool.prewarm()
+        tracer = stack.enter_context(Tracer(args.trace, args.metrics))
+        service = ClassifierService(
+            classifier,
+            DomainLimiter(args.per_domain),
+            tracer,
+            concurrency=args.concurrency,
+            max_pending=args.max_pending,
+            request_timeout=args.request_timeout,
+        )
+        try:
+            await service.serve(args.host, args.port)
+        finally:
+            tracer.write_metrics(stats)
+
+
+# Function to categorise one archived snapshot; returns (url, old code, new
+# code, classified by). The new code is None if the site could not be
+# categorised, e.g. it needs a ChatGPT call the replay does not make.
+async def replay_snapshot(url, fields, old_category, categorise, tracer):
+    trace = tracer.start(None, url)
+    lang, metadata = build_metadata(fields)
+    with trace_stage("classification"):
+        category_code, status = await categorise(lang, metadata, url=url)
+    tracer.finish(trace)
+    if status != 1:
+        category_code = None
+    return url, old_category, category_code, trace.record.get("classified_by")
+
+
+# Function to replay the categorisers over a snapshot archive: the current
+# keyword rules, local model and, with --llm, ChatGPT are run on every
+# archived site without fetching anything, and codes that differ from the
+# archived ones are reported. Offline, ChatGPT answers come from the LLM
+# cache; sites that would need a new ChatGPT call keep their archived code.
+async def replay_archive(args):
+    stats = RunStats()
+    async with contextlib.AsyncExitStack() as stack:
+        archive = stack.enter_context(SnapshotArchive(args.archive))
+        llm_cache = None
+        if not args.no_llm_cache:
+            llm_cache = stack.enter_context(
+                LLMCache(
+                    args.llm_cache,
+                    max_entries=args.llm_cache_max_entries,
+                    ttl_seconds=args.llm_cache_ttl_days * 24 * 3600,
+                )
+            )
+        llm_client = None
+        if args.replay_llm:
+            llm_client = await stack.enter_async_context(open_llm_client(args))
+        text_model = None
+        if args.text_model:
+            text_model = HashedTextClassifier.load(args.text_model)
+        # Without a ChatGPT client the classifier answers from the cache only
+        classifier = Classifier(
+            None,
+            stats=stats,
+            matchers=load_matchers(args.keywords),
+            text_model=text_model,
+            model_threshold=args.model_threshold,
+            llm_client=llm_client,
+            llm_cache=llm_cache,
+            llm_batch_size=args.llm_batch_size,
+            llm_batch_wait=args.llm_batch_wait,
+        )
+        categorise = classifier.categorise
+        tracer = Tracer()
+        diff_file = None
+        if args.diff_output:
+            diff_file = stack.enter_context(
+                open(args.diff_output, "w", newline="", encoding="utf-8")
+            )
+            diff_writer = csv.writer(diff_file)
+            diff_writer.writerow(["url", "old", "new", "classified_by"])
+
+        transitions = collections.Counter()
+        logger.info(f"Replaying the categorisers over {args.archive}...")
+        snapshots = archive.snapshots()
+        while True:
+            # Chunks keep ChatGPT calls concurrent when --llm is on
+            chunk = list(itertools.islice(snapshots, REPLAY_CHUNK_SIZE))
+            if not chunk:
+                break
+            results = await asyncio.gather(
+                *(
+                    replay_snapshot(url, fields, old_category, categorise, tracer)
+                    for url, fields, old_category, _ in chunk
+                )
+            )
+            for url, old_category, category_code, classified_by in results:
+                stats.increment("replayed_sites")
+                if category_code is None:
+                    continue
+                if category_code == old_category:
+                    stats.increment("replay_unchanged")
+                    continue
+                stats.increment("replay_changed")
+                transitions[(old_category, category_code)] += 1
+                if diff_file is not None:
+                    diff_writer.writerow([url, old_category, category_code, classified_by])
+
+    elapsed = time.time() - stats.start_time
+    logger.info("----------- Replay ------------")
+    logger.info(
+        f"Sites replayed: {stats['replayed_sites']} in {elapsed:.1f} s "
+        f"({stats['replayed_sites'] / max(elapsed, 1e-9):.0f} sites/s)"
+    )
+    logger.info(f"Unchanged codes: {stats['replay_unchanged']}")
+    logger.info(f"Changed codes: {stats['replay_changed']}")
+    for (old_category, category_code), count in transitions.most_common():
+        logger.info(f"  {old_category} -> {category_code}: {count}")
+    logger.info(
+        f"Sites needing a ChatGPT call that is not cached: {stats['llm_skipped']}"
+        + ("" if args.replay_llm else " (run with --llm to send them)")
+    )
+    logger.info(
+        f"Classified by rules: {stats['rule_classified_urls']}, "
+        f"local model: {stats['model_classified_urls']}, "
+        f"LLM cache: {stats['llm_cache_hits']}, ChatGPT calls: {stats['llm_calls']}"
+    )
+    if diff_file is not None:
+        logger.info(f"Changed codes written to {args.diff_output}")
+    return stats
+
+
+# Function to run one sharded worker: lease rows from the shared queue and
+# record results back into it. Traces and metrics go to per-worker files.
+async def run_queue_worker(args):
+    owner = worker_id(getattr(args, "shard", None))
+    with WorkQueue(args.queue, args.lease_seconds, args.shared_queue) as work_queue:
+        source = QueueSource(work_queue, owner, lease_batch=args.concurrency)
+        sink = functools.partial(QueueSink, work_queue)
+        renewer = asyncio.create_task(renew_leases(work_queue, owner))
+        logger.info(f"Worker {owner} leasing rows from {args.queue}")
+        try:
+            # Results are durable in the queue, so no checkpoint is kept. Retries
+            # are not scheduled either: queue rows must all complete for the run
+            # to drain, and failed rows are picked up by a later --resume run
+            stats = await run_classifier(
+                args,
+                source,
+                sink,
+                None,
+                shard_path(args.trace, owner),
+                shard_path(args.metrics, owner),
+            )
+            work_queue.report_worker(
+                owner,
+                stats["url_processed"],
+                stats.gauges.get("peak_browser_rss_bytes"),
+                own_peak_rss_bytes(),
+            )
+        finally:
+            renewer.cancel()
+            # Hand back anything still leased so other workers need not wait
+            work_queue.release(owner)
+
+
+# Function run in each worker process started by the coordinator
+def run_shard(args, shard):
+    args = argparse.Namespace(**{**vars(args), "shard": shard, "queue_worker": True})
+    logging.basicConfig(
+        level=args.log_level,
+        format="%(asctime)s %(processName)s %(levelname)s %(message)s",
+    )
+    try:
+        asyncio.run(run_queue_worker(args))
+    except KeyboardInterrupt:
+        pass
+
+
+# Function to coordinate a sharded run: start the worker processes, stream
+# rows from the source into the shared queue and merge finished rows into the
+# real sink until the queue is drained. Workers on other machines can join
+# with --queue-worker pointed at the same queue file.
+async def coordinate(args):
+    stats = RunStats()
+    source, sink = open_backends(args)
+    if not args.resume:
+        # A fresh run starts a fresh queue
+        remove_queue(args.queue)
+
+    with WorkQueue(args.queue, args.lease_seconds, args.shared_queue) as work_queue:
+        work_queue.set_seeding(True)
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(target=run_shard, args=(args, shard), name=f"shard-{shard}")
+            for shard in range(1, args.shards + 1)
+        ]
+        for process in processes:
+            process.start()
+        logger.info(f"Started {len(processes)} worker process(es) on {args.queue}")
+
+        try:
+            added = work_queue.enqueue(source.rows(resume=args.resume, stats=stats))
+            work_queue.set_seeding(False)
+            logger.info(
+                f"Queued {added} new or failed row(s) of {stats['valid_urls']} valid URL(s)."
+            )
+
+            async with sink(
+                stats, batch_size=args.batch_size, flush_interval=args.flush_interval
+            ) as writer:
+                while True:
+                    merged = await merge_results(work_queue, writer, args.batch_size)
+                    if merged:
+                        logger.info(f"Merged {merged} row(s); queue: {work_queue.counts()}")
+                    if work_queue.drained() and not work_queue.unmerged(1):
+                        break
+                    if processes and not any(p.is_alive() for p in processes):
+                        logger.error(
+                            "All worker processes exited with rows left in the queue; "
+                            "rerun with --resume to finish them."
+                        )
+                        break
+                    await asyncio.sleep(args.flush_interval)
+        finally:
+            for process in processes:
+                await asyncio.to_thread(process.join)
+        workers = work_queue.workers()
+
+    logger.info("----------- Sharded run ------------")
+    logger.info(f"Rows written to the output: {stats['url_processed']}")
+    logger.info(f"Rows not written to the output: {stats['write_errors']}")
+    logger.info(f"Rows skipped as already classified: {stats['skipped_rows']}")
+    for owner, rows_done, peak_browser_rss, peak_process_rss in workers:
+        browser_mb = f"{peak_browser_rss / 1024 / 1024:.0f} MB" if peak_browser_rss else "n/a"
+        logger.info(
+            f"Worker {owner}: {rows_done} row(s), peak browser memory {browser_mb}, "
+            f"peak process memory {peak_process_rss / 1024 / 1024:.0f} MB"
+        )
+    logger.info(f"Time taken: {time.time() - stats.start_time:.2f} seconds")
+
+
+# Function to preview a classify run: read the rows a run would classify and
+# count the sites left after deduplication, without starting a browser,
+# calling ChatGPT or writing any results
+def preview_run(args):
+    stats = RunStats()
+    source, _ = open_backends(args)
+    site_groups = None if args.dedupe == "off" else SiteGroups(args.dedupe)
+    for idx, url in source.rows(resume=args.resume, stats=stats):
+        stats.increment("rows_to_classify")
+        if site_groups is None or site_groups.join(idx, url) is None:
+            stats.increment("sites_to_classify")
+
+    logger.info("----------- Dry run ------------")
+    logger.info(f"Valid URLs in the input: {stats['valid_urls']}")
+    logger.info(f"Rows skipped as already classified: {stats['skipped_rows']}")
+    logger.info(f"Rows a run would classify: {stats['rows_to_classify']}")
+    logger.info(
+        f"Sites a run would fetch with --dedupe {args.dedupe}: "
+        f"{stats['sites_to_classify']}"
+    )
+    return stats
+
+
+# Function to run a benchmark script from benchmarks/ with its own arguments
+def run_benchmark(name, argv):
+    sys.path.insert(0, BENCHMARKS_DIR)
+    return importlib.import_module(BENCHMARKS[name]).main(argv)
+
+
+async def main(args):
+    if args.command == "replay":
+        await replay_archive(args)
+    elif args.command == "serve":
+        await run_service(args)
+    elif args.dry_run:
+        preview_run(args)
+    elif args.queue_worker:
+        await run_queue_worker(args)
+    elif args.shards is not None:
+        await coordinate(args)
+    else:
+        source, sink = open_backends(args)
+        await run_classifier(
+            args,
+            source,
+            sink,
+            args.checkpoint,
+            args.trace,
+            args.metrics,
+            args.retry_schedule,
+        )
+
+
+# Function for the command line: parse it, load .env, make sure the backends
+# the command uses have their credentials, and run the command
+def run_cli(argv=None):
+    args = parse_args(argv)
+    if args.command == "bench":
+        return run_benchmark(args.benchmark, args.benchmark_args)
+
+    logging.basicConfig(
+        level=args.log_level, format="%(asctime)s %(levelname)s %(message)s"
+    )
+    load_environment()
+    missing = missing_credentials(args)
+    if missing:
+        hint = ""
+        if args.command != "replay" and "OPENAI_API_KEY" in missing:
+            hint = " (or run with --no-llm)"
+        sys.exit(f"{', '.join(missing)} not set in .env or the environment{hint}")
+    asyncio.run(main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli())
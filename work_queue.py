@@ -0,0 +1,291 @@
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+from io_backends import BatchedWriter
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker may hold a row before another worker can reclaim it
+DEFAULT_LEASE_SECONDS = 300
+
+# Rows inserted per transaction while seeding the queue
+SEED_CHUNK_SIZE = 1000
+
+# Seconds an idle worker waits before asking the queue for work again
+IDLE_POLL_INTERVAL = 2.0
+
+
+# Function to name a worker uniquely across processes and machines
+def worker_id(shard=None):
+    name = f"{socket.gethostname()}-{os.getpid()}"
+    return name if shard is None else f"{name}-{shard}"
+
+
+# Durable SQLite queue of rows shared by worker processes. Workers lease rows
+# for lease_seconds and complete them with their result; leases of a crashed
+# worker expire and the rows go back to the pool. The coordinator merges
+# completed rows into the real sink.
+#
+# WAL mode suits processes on one machine. For machines sharing the file over
+# a network filesystem, pass shared_filesystem=True to use the rollback
+# journal, which only relies on the filesystem's file locks.
+class WorkQueue:
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, shared_filesystem=False):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._conn.execute("PRAGMA busy_timeout = 60000")
+        self._conn.execute(
+            f"PRAGMA journal_mode={'DELETE' if shared_filesystem else 'WAL'}"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS work ("
+            " row INTEGER PRIMARY KEY,"
+            " url TEXT NOT NULL,"
+            " state TEXT NOT NULL DEFAULT 'pending',"
+            " owner TEXT,"
+            " lease_expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " product TEXT,"
+            " status INTEGER,"
+            " merged INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS work_state ON work (state)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS workers ("
+            " owner TEXT PRIMARY KEY,"
+            " rows_done INTEGER NOT NULL,"
+            " peak_browser_rss INTEGER,"
+            " peak_process_rss INTEGER,"
+            " finished REAL NOT NULL)"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    # Write transaction that takes the database lock up front, so two workers
+    # can never lease the same row
+    @contextlib.contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    # The coordinator marks the queue as seeding while it streams rows in, so
+    # workers that run out of rows keep waiting instead of exiting early
+    def set_seeding(self, seeding):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('seeding', ?)",
+            ("1" if seeding else "0",),
+        )
+
+    def seeding(self):
+        entry = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'seeding'"
+        ).fetchone()
+        return entry is not None and entry[0] == "1"
+
+    # True once every row has been seeded and completed
+    def drained(self):
+        return not self.seeding() and self.unfinished() == 0
+
+    # Function to add (row, url) pairs. Rows already queued are left as they
+    # are, except rows that finished with a failure: those go back to pending,
+    # so a --resume run classifies them again
+    def enqueue(self, rows):
+        added = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= SEED_CHUNK_SIZE:
+                added += self._insert(chunk)
+                chunk = []
+        if chunk:
+            added += self._insert(chunk)
+        return added
+
+    def _insert(self, chunk):
+        before = self._conn.total_changes
+        with self._transaction():
+            self._conn.executemany(
+                "INSERT INTO work (row, url) VALUES (?, ?)"
+                " ON CONFLICT (row) DO UPDATE SET url = excluded.url,"
+                " state = 'pending', owner = NULL, lease_expires = NULL,"
+                " product = NULL, status = NULL, merged = 0"
+                " WHERE work.state = 'done' AND COALESCE(work.status, 0) != 1",
+                chunk,
+            )
+        return self._conn.total_changes - before
+
+    # Claim up to `limit` pending rows, or rows whose lease has expired
+    def lease(self, owner, limit):
+        now = time.time()
+        with self._transaction():
+            rows = self._conn.execute(
+                "SELECT row, url FROM work"
+                " WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)"
+                " ORDER BY row LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE work SET state = 'leased', owner = ?, lease_expires = ?,"
+                " attempts = attempts + 1 WHERE row = ?",
+                [(owner, now + self.lease_seconds, row) for row, _ in rows],
+            )
+        return rows
+
+    # Extend every lease held by a worker that is still alive
+    def renew(self, owner):
+        self._conn.execute(
+            "UPDATE work SET lease_expires = ? WHERE state = 'leased' AND owner = ?",
+            (time.time() + self.lease_seconds, owner),
+        )
+
+    # Record results; a row reclaimed and finished elsewhere keeps its first result
+    def complete(self, results):
+        with self._transaction():
+            self._conn.executemany(
+                "UPDATE work SET state = 'done', product = ?, status = ?,"
+                " owner = NULL, lease_expires = NULL WHERE row = ? AND state != 'done'",
+                [(product, status, row) for row, _, product, status in results],
+            )
+
+    # Hand leased rows back, e.g. when a worker shuts down early
+    def release(self, owner):
+        self._conn.execute(
+            "UPDATE work SET state = 'pending', owner = NULL, lease_expires = NULL"
+            " WHERE state = 'leased' AND owner = ?",
+            (owner,),
+        )
+
+    # Number of rows not yet done, leased or not
+    def unfinished(self):
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM work WHERE state != 'done'"
+        ).fetchone()[0]
+
+    def counts(self):
+        return dict(
+            self._conn.execute("SELECT state, COUNT(*) FROM work GROUP BY state")
+        )
+
+    # Record a worker's totals when it exits, for the coordinator's report
+    def report_worker(self, owner, rows_done, peak_browser_rss, peak_process_rss):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?, ?)",
+            (owner, rows_done, peak_browser_rss, peak_process_rss, time.time()),
+        )
+
+    def workers(self):
+        return self._conn.execute(
+            "SELECT owner, rows_done, peak_browser_rss, peak_process_rss FROM workers"
+            " ORDER BY owner"
+        ).fetchall()
+
+    # Completed rows not yet written to the coordinator's sink
+    def unmerged(self, limit):
+        return self._conn.execute(
+            "SELECT row, url, product, status FROM work"
+            " WHERE state = 'done' AND merged = 0 ORDER BY row LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def mark_merged(self, rows):
+        with self._transaction():
+            self._conn.executemany(
+                "UPDATE work SET merged = 1 WHERE row = ?", [(row,) for row in rows]
+            )
+
+
+# Row source for a worker: leases rows in small batches until the queue is
+# drained. While other workers still hold leases it keeps polling, so it can
+# pick up rows they drop if they crash.
+class QueueSource:
+    def __init__(self, work_queue, owner, lease_batch=8):
+        self.work_queue = work_queue
+        self.owner = owner
+        self.lease_batch = lease_batch
+
+    async def rows(self, resume=False, stats=None):
+        while True:
+            leased = self.work_queue.lease(self.owner, self.lease_batch)
+            if leased:
+                for row, url in leased:
+                    if stats is not None:
+                        stats.increment("valid_urls")
+                    yield row, url
+            elif self.work_queue.drained():
+                return
+            else:
+                await asyncio.sleep(IDLE_POLL_INTERVAL)
+
+
+# Sink for a worker: results go back into the shared queue
+class QueueSink(BatchedWriter):
+    def __init__(self, work_queue, stats, **kwargs):
+        super().__init__(stats, **kwargs)
+        self.work_queue = work_queue
+
+    async def _write_batch(self, results):
+        try:
+            self.work_queue.complete(results)
+        except sqlite3.Error as e:
+            logger.error(f"Error recording results in {self.work_queue.path}: {e}")
+            return False
+        return True
+
+
+# Function to keep a worker's leases alive while it runs
+async def renew_leases(work_queue, owner):
+    while True:
+        await asyncio.sleep(work_queue.lease_seconds / 3)
+        work_queue.renew(owner)
+
+
+# Function to copy completed rows from the queue into the coordinator's sink.
+# Rows are only marked merged once the sink has written them, so a failed
+# write is retried on the next call.
+async def merge_results(work_queue, writer, batch_size=500):
+    merged = 0
+    while True:
+        results = work_queue.unmerged(batch_size)
+        if not results:
+            return merged
+        if not await writer.write(results):
+            return merged
+        work_queue.mark_merged([row for row, _, _, _ in results])
+        merged += len(results)
+
+
+# Function to derive a per-worker file name, e.g. trace.jsonl -> trace.host-1.jsonl
+def shard_path(path, owner):
+    if not path:
+        return path
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{owner}{extension}"
+
+
+# Function to delete a queue database and its WAL side files
+def remove_queue(path):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path + suffix)